@@ -0,0 +1,223 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+"""
+Benchmarks of conversion and loading of rates and symbols.
+API mode uses the local stub of the API (stub_server.py), file modes use rates_files/test_rates.json.
+
+example: ./benchmarks/conversion.py --output results.json
+         ./benchmarks/conversion.py --compare results.json --max_regression 0.2
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+# Directory with currency_converter.py and src package.
+project_dir = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.insert(0, project_dir)
+
+from src.CurrencyConverter import CurrencyConverter
+from src.FixedPoint import minor_units
+from src.TextWriter import TextWriter
+from stub_server import StubRatesServer
+
+rates_filepath = os.path.join(project_dir, 'rates_files', 'test_rates.json')
+symbols_filepath = os.path.join(project_dir, 'cur_symbols', 'currency_symbols.txt')
+
+
+def percentile(sorted_values, fraction):
+    return sorted_values[min(int(len(sorted_values) * fraction), len(sorted_values) - 1)]
+
+
+def measure(operation, iterations, warmup=10):
+    """
+    Run the operation repeatedly and measure every call.
+
+    Args:
+        operation (callable): Function without arguments.
+        iterations (int): Number of measured calls.
+        warmup (int): Number of calls before the measurement.
+
+    Returns:
+        Dictionary with ops/sec, latency percentiles (microseconds) and objects per call.
+        Python 2 can't count allocations, so "objects_per_op" is the number of objects tracked by the garbage
+        collector which were created and not freed by a call (it shows leaks and growing caches).
+    """
+    for _ in xrange(warmup):
+        operation()
+    gc.collect()
+    objects_before = len(gc.get_objects())
+    latencies = []
+    timer = time.time
+    total_start = timer()
+    for _ in xrange(iterations):
+        start = timer()
+        operation()
+        latencies.append(timer() - start)
+    total = timer() - total_start
+    gc.collect()
+    objects_after = len(gc.get_objects())
+    latencies.sort()
+    return {
+        'iterations': iterations,
+        'ops_per_sec': round(iterations / total, 1),
+        'p50_us': round(percentile(latencies, 0.5) * 1e6, 2),
+        'p99_us': round(percentile(latencies, 0.99) * 1e6, 2),
+        'max_us': round(latencies[-1] * 1e6, 2),
+        # Minus the list of latencies.
+        'objects_per_op': round(float(objects_after - objects_before - 1) / iterations, 3),
+    }
+
+
+def format_naive(amounts, symbols):
+    """
+    Baseline of MoneyFormatter.format_many() ("cs" locale) - symbol, decimals and separators are found for every value.
+    """
+    formatted = {}
+    for code, amount in amounts.iteritems():
+        code_symbols = [symbol for symbol, symbol_code in symbols.iteritems() if symbol_code == code] or [code]
+        symbol = min(code_symbols, key=lambda symbol: (len(symbol.decode('utf-8')), symbol))
+        number = '{:,.{}f}'.format(amount, minor_units(code)).replace(',', ' ').replace('.', ',')
+        formatted[code] = number + ' ' + symbol
+    return formatted
+
+
+def convert_in_threads(converter, n_threads, conversions=4000):
+    """
+    Convert in n_threads threads at once (the conversions are divided among them) - ops/sec of the same
+    number of conversions in 1 and more threads shows whether the threads wait for each other.
+    """
+    def convert():
+        for _ in xrange(conversions // n_threads):
+            converter.convert(10, 'EUR', 'CZK')
+
+    threads = [threading.Thread(target=convert) for _ in range(n_threads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def run(iterations):
+    """
+    Returns:
+        Dictionary case name -> results (see measure()).
+    """
+    random.seed(1)
+    tmp_dir = tempfile.mkdtemp()
+    stub = StubRatesServer(rates_filepath).start()
+    try:
+        # Rates file with current timestamp, so "file" mode does not download new rates.
+        with open(rates_filepath) as rates_file:
+            rates_data = json.load(rates_file)
+        rates_data['timestamp'] = int(time.time())
+        fresh_rates_filepath = os.path.join(tmp_dir, 'latest.json')
+        with open(fresh_rates_filepath, 'w') as rates_file:
+            json.dump(rates_data, rates_file)
+
+        converter = CurrencyConverter('', 'file_no_update', symbols_filepath, rates_filepath)
+        cached_converter = CurrencyConverter('', 'file_no_update', symbols_filepath, rates_filepath,
+                                             result_cache_size=1024)
+        api_converter = CurrencyConverter('', 'api', symbols_filepath, api_url=stub.api_url)
+        file_converter = CurrencyConverter('', 'file', symbols_filepath, fresh_rates_filepath, api_url=stub.api_url)
+        codes = sorted(rates_data['rates'])
+        items = [(round(random.uniform(0, 10000), 2), random.choice(codes), random.choice(codes))
+                 for _ in xrange(10000)]
+        text_writer = TextWriter(tmp_dir)
+        all_amounts = converter.convert(10, 'EUR', result_format='object').output
+        converter.formatter('cs')
+        texts = [random.choice(['€%s', '%s Kč', '$%s', '%s ¥', 'USD %s']) % str(amount).replace('.', ',')
+                 for amount, _, _ in items]
+
+        cases = [
+            ('convert', lambda: converter.convert(10, 'EUR', 'CZK'), iterations),
+            ('convert_object', lambda: converter.convert(10, 'EUR', 'CZK', result_format='object'), iterations),
+            ('convert_symbols', lambda: converter.convert(10, '€', 'Kč'), iterations),
+            ('convert_exact', lambda: converter.convert('10.00', 'EUR', 'CZK', exact=True), iterations),
+            ('convert_all', lambda: converter.convert(10, 'EUR'), iterations // 10),
+            ('convert_all_object', lambda: converter.convert(10, 'EUR', result_format='object'), iterations // 10),
+            ('convert_subset', lambda: converter.convert(10, 'EUR', ['CZK', 'USD', 'GBP', 'JPY']), iterations),
+            ('convert_all_cached', lambda: cached_converter.convert(10, 'EUR'), iterations),
+            # Conversions/sec = ops/sec * 4000 (threads share the GIL, so 4 threads can't be faster than 1).
+            ('convert_threads_1', lambda: convert_in_threads(converter, 1), 20),
+            ('convert_threads_4', lambda: convert_in_threads(converter, 4), 20),
+            ('convert_many_10k', lambda: converter.convert_many(items), 20),
+            ('convert_text', lambda: converter.convert_text('1 000,50 Kč', 'EUR'), iterations),
+            ('convert_text_many_10k', lambda: converter.convert_text_many(texts, 'EUR'), 20),
+            ('format_all', lambda: converter.formatter('cs').format_many(all_amounts), iterations // 10),
+            ('format_all_naive', lambda: format_naive(all_amounts, converter.currency_symbols), 20),
+            # Rows/sec = ops/sec * 10 000.
+            ('write_csv_10k', lambda: text_writer.write_file(iter(items), 'items', ','), 50),
+            ('get_rates_api', lambda: api_converter._get_rates('api'), 200),
+            ('get_rates_file', lambda: file_converter._get_rates('file'), 1000),
+            ('get_rates_file_no_update', lambda: converter._get_rates('file_no_update'), 1000),
+            ('read_currency_symbols', lambda: CurrencyConverter._read_currency_symbols(symbols_filepath), 1000),
+        ]
+        return dict((name, measure(operation, case_iterations)) for name, operation, case_iterations in cases)
+    finally:
+        stub.stop()
+        shutil.rmtree(tmp_dir)
+
+
+def compare(results, baseline, max_regression):
+    """
+    Print change of ops/sec against baseline results.
+
+    Returns:
+        Names of cases slower by more than max_regression (fraction).
+    """
+    regressions = []
+    for name in sorted(results):
+        if name not in baseline:
+            continue
+        change = results[name]['ops_per_sec'] / baseline[name]['ops_per_sec'] - 1
+        print('%-26s %+7.1f %%' % (name, change * 100))
+        if change < -max_regression:
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks of the currency converter')
+    parser.add_argument('--iterations', action='store', type=int, default=10000,
+                        help='Number of calls of fast cases (default 10000)')
+    parser.add_argument('--output', action='store', metavar='<path>', help='Save results as JSON.')
+    parser.add_argument('--compare', action='store', metavar='<path>', help='Compare with saved results.')
+    parser.add_argument('--max_regression', action='store', type=float, default=0.1,
+                        help='Exit with error if a case is slower by more than this fraction (default 0.1).')
+    args = parser.parse_args()
+
+    results = run(args.iterations)
+    print('%-26s %12s %10s %10s %10s' % ('case', 'ops/sec', 'p50 us', 'p99 us', 'objects'))
+    for name in sorted(results):
+        result = results[name]
+        print('%-26s %12.1f %10.2f %10.2f %10.3f' % (name, result['ops_per_sec'], result['p50_us'],
+                                                     result['p99_us'], result['objects_per_op']))
+
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump({
+                'python': sys.version.split()[0],
+                'platform': platform.platform(),
+                'time': int(time.time()),
+                'results': results,
+            }, output_file, indent=4, sort_keys=True)
+
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            baseline = json.load(baseline_file)['results']
+        print('')
+        regressions = compare(results, baseline, args.max_regression)
+        if regressions:
+            raise SystemExit('Slower than baseline: ' + ', '.join(regressions))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+"""
+Measure startup time of the converter - every case runs in a new Python process.
+
+example: ./benchmarks/startup.py --repeat 20 --json
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+# Directory with currency_converter.py and src package.
+project_dir = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+
+CONSTRUCT_AND_CONVERT = """
+from src.CurrencyConverter import CurrencyConverter
+converter = CurrencyConverter('', 'file_no_update', 'cur_symbols/currency_symbols.txt', 'rates_files/test_rates.json')
+converter.convert(10, 'EUR', 'CZK')
+"""
+
+CASES = [
+    ('python', ['-c', 'pass']),
+    ('import currency_converter', ['-c', 'import currency_converter']),
+    ('currency_converter.py --help', ['currency_converter.py', '--help']),
+    ('construct and convert', ['-c', CONSTRUCT_AND_CONVERT]),
+]
+
+
+def measure(arguments, repeat):
+    """
+    Returns:
+        List of durations (ms) of the process runs.
+    """
+    durations = []
+    with open(os.devnull, 'wb') as devnull:
+        for _ in range(repeat):
+            start = time.time()
+            subprocess.check_call([sys.executable] + arguments, cwd=project_dir, stdout=devnull)
+            durations.append((time.time() - start) * 1000)
+    return durations
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Startup time of the currency converter')
+    parser.add_argument('--repeat', action='store', type=int, default=10, help='Runs of every case (default 10)')
+    parser.add_argument('--json', action='store_true', help='Print results as JSON.')
+    args = parser.parse_args()
+
+    results = []
+    for name, arguments in CASES:
+        durations = measure(arguments, args.repeat)
+        results.append({
+            'case': name,
+            'min_ms': round(min(durations), 2),
+            'mean_ms': round(sum(durations) / len(durations), 2),
+        })
+
+    if args.json:
+        print(json.dumps(results, indent=4))
+    else:
+        for result in results:
+            print('%-30s min %8.2f ms   mean %8.2f ms' % (result['case'], result['min_ms'], result['mean_ms']))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,15 +1,42 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 import unittest
+import os
 import os.path
 import json
+import datetime
+import shutil
+import tempfile
+import threading
+import time
+import httplib
+import decimal
+import gzip
+from StringIO import StringIO
 
 from src.CurrencyConverter import CurrencyConverter
+from src.AsyncCurrencyConverter import AsyncCurrencyConverter
+from src.ConversionServer import make_server
+from src.StreamConverter import convert_stream
+from src.TextWriter import RowWriter, TextWriter
+from src.HistoricalRatesStore import HistoricalRatesStore
+from src.SnapshotStore import MappedSnapshot, write_snapshot
+from src.RatesTable import RatesTable
+from src.SharedRegistry import SharedRegistry, registry
+from src.Metrics import Metrics
+from src.FixedPoint import parse_amount
+from src.MoneyFormatter import MoneyFormatter
+from src.MoneyParser import MoneyParser, normalize_number
+from src.RatesProviders import FailoverRatesProvider, HttpRatesProvider, StaticRatesProvider
+from src.SymbolsBuilder import SymbolsBuilder, parse_currency_page, parse_symbols_list
+from stub_server import StubRatesServer
 
 # Filepaths
 current_dir = os.path.dirname(os.path.realpath(__file__))
 rates_filepath = os.path.abspath(current_dir+'/rates_files/test_rates.json')
 symbols_filepath = os.path.abspath(current_dir+'/cur_symbols/currency_symbols.txt')
+wiki_list_filepath = os.path.abspath(current_dir+'/cur_symbols/wiki_list.htm')
+currency_page_filepath = os.path.abspath(current_dir+'/cur_symbols/currency_page.htm')
 
 # Get API key from config file
 with open(os.path.abspath(current_dir+'/config.txt')) as config_file:
@@ -117,6 +144,25 @@ class TestCurrencyConverter(unittest.TestCase):
             msg = 'Convert() method does not return JSON string with necessary fields.\n' + str(e)
             self.fail(msg)
 
+    # Test convert method - result formats
+
+    def test_convert_f1(self):
+        """Return result as dictionary."""
+        r_dict = self.c_converter.convert(10, 'EUR', 'CZK', result_format='dict')
+        self.assertEqual(r_dict, {'input': {'amount': 10, 'currency': 'EUR'}, 'output': {'CZK': 270.26}})
+
+    def test_convert_f2(self):
+        """Return result as object, which can be serialized to the same JSON as convert() returns."""
+        result = self.c_converter.convert(10, 'EUR', 'CZK', result_format='object')
+        self.assertEqual((result.amount, result.currency, result.output), (10, 'EUR', {'CZK': 270.26}))
+        self.assertEqual(json.loads(result.to_json()), json.loads(self.c_converter.convert(10, 'EUR', 'CZK')))
+
+    def test_convert_f3(self):
+        """When invalid result format is entered, raise an exception."""
+        with self.assertRaises(ValueError) as context:
+            self.c_converter.convert(10, 'EUR', 'CZK', result_format='xml')
+        self.assertTrue(9 in context.exception)
+
     # Test convert method: If no output currency set, convert to all currencies.
 
     def test_convert_c1(self):
@@ -177,12 +223,1370 @@ class TestCurrencyConverter(unittest.TestCase):
         out_amount = dict_data['output']['PLN']
         self.assertEqual(out_amount, 49.65)
 
+    def test_convert_s7(self):
+        """Codes are case insensitive, symbols are normalized (NFKC) and stripped."""
+        dict_data = json.loads(self.c_converter.convert(10, ' eur\t', u'\u00a0K\u010d '.encode('utf-8')))
+        self.assertEqual(dict_data['output']['CZK'], 270.26)
+        dict_data = json.loads(self.c_converter.convert(10, 'EUR', '\xef\xbc\x84'))  # fullwidth dollar sign
+        self.assertIn('USD', dict_data['output'])
+
+    def test_convert_s8(self):
+        """Exact symbol has priority over normalized one: ₨ (MUR) is normalized to Rs (LKR)."""
+        dict_data = json.loads(self.c_converter.convert(10, 'EUR', '₨'))
+        self.assertIn('MUR', dict_data['output'])
+        dict_data = json.loads(self.c_converter.convert(10, 'EUR', 'Rs'))
+        self.assertIn('LKR', dict_data['output'])
+
+    def test_convert_e5(self):
+        """Error message for unknown currency contains similar codes."""
+        with self.assertRaises(ValueError) as context:
+            self.c_converter.convert(10, 'EURO', 'CZK')
+        self.assertIn('Did you mean: EUR', context.exception.args[0])
+
     def test_convert_s6(self):
         """£ (GBP) to all currencies."""
         dict_data = json.loads(self.c_converter.convert(11.11, '£', False))
         out_amounts = dict_data['output']
         self.assertGreater(len(out_amounts), 100)
 
+    # Test convert_many method
+
+    def test_convert_many_1(self):
+        """Convert a batch of amounts - results are the same as from convert()."""
+        items = [(10, 'EUR', 'CZK'), (111.88, 'Kč', '€'), ('500.5', '¥', '$'), (10, 'EUR', 'CZK')]
+        result = self.c_converter.convert_many(items)
+        self.assertEqual(list(result['output_amounts']), [270.26, 4.14, 4.45, 270.26])
+        self.assertEqual(result['input_currencies'], ['EUR', 'CZK', 'JPY', 'EUR'])
+        self.assertEqual(result['output_currencies'], ['CZK', 'EUR', 'USD', 'CZK'])
+        self.assertEqual(list(result['input_amounts']), [10, 111.88, 500.5, 10])
+
+    def test_convert_many_e1(self):
+        """When an unknown currency is in the batch, raise an exception."""
+        with self.assertRaises(ValueError) as context:
+            self.c_converter.convert_many([(10, 'EUR', 'CZK'), (10, 'XEUR', 'CZK')])
+        self.assertTrue(5 in context.exception)
+
+    def test_convert_many_e2(self):
+        """When output currency is missing in the batch, raise an exception."""
+        with self.assertRaises(ValueError) as context:
+            self.c_converter.convert_many([(10, 'EUR', None)])
+        self.assertTrue(8 in context.exception)
+
+
+class TestRatesCache(unittest.TestCase):
+    """
+    Tests caching of exchange rates in CurrencyConverter (rates are not read on every convert() call).
+    A copy of the test rates file is used, so it can be modified.
+    """
+
+    def setUp(self):
+        """Copy the test rates file to a temporary directory."""
+        self.tmp_dir = tempfile.mkdtemp()
+        self.tmp_rates_filepath = os.path.join(self.tmp_dir, 'rates.json')
+        shutil.copy(rates_filepath, self.tmp_rates_filepath)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_cache_hit(self):
+        """Second conversion uses the cached rates."""
+        converter = CurrencyConverter(app_id, 'file_no_update', symbols_filepath, self.tmp_rates_filepath)
+        converter.convert(10, 'EUR', 'CZK')
+        converter.convert(10, 'EUR', 'CZK')
+        self.assertEqual(converter.rates_cache.stats['refreshes'], 1)
+        self.assertEqual(converter.rates_cache.stats['hits'], 1)
+
+    def test_cache_no_io(self):
+        """Fresh cached rates are used even if the Rates file disappears."""
+        converter = CurrencyConverter(app_id, 'file_no_update', symbols_filepath, self.tmp_rates_filepath)
+        converter.convert(10, 'EUR', 'CZK')
+        os.remove(self.tmp_rates_filepath)
+        dict_data = json.loads(converter.convert(10, 'EUR', 'CZK'))
+        self.assertEqual(dict_data['output']['CZK'], 270.26)
+
+    def test_cache_file_modified(self):
+        """When TTL expires and the Rates file was modified, the file is read again."""
+        converter = CurrencyConverter(app_id, 'file_no_update', symbols_filepath, self.tmp_rates_filepath,
+                                      rates_ttl=0)
+        converter.convert(10, 'EUR', 'CZK')
+        # Double the CZK rate and move the modification time.
+        with open(self.tmp_rates_filepath) as rates_file:
+            rates_data = json.load(rates_file)
+        rates_data['rates']['CZK'] *= 2
+        rates_data['timestamp'] += 60
+        with open(self.tmp_rates_filepath, 'w') as rates_file:
+            json.dump(rates_data, rates_file)
+        mtime = os.path.getmtime(self.tmp_rates_filepath) + 10
+        os.utime(self.tmp_rates_filepath, (mtime, mtime))
+        dict_data = json.loads(converter.convert(10, 'EUR', 'CZK'))
+        self.assertEqual(dict_data['output']['CZK'], 540.52)
+        self.assertEqual(converter.rates_cache.stats['refreshes'], 2)
+
+    def test_rates_table_reused(self):
+        """Cross rates table is built again only for rates with a new timestamp."""
+        converter = CurrencyConverter(app_id, 'file_no_update', symbols_filepath, self.tmp_rates_filepath,
+                                      rates_ttl=0)
+        converter.convert(10, 'EUR', 'CZK')
+        table = converter._rates_table
+        # Touch the file - it is read again, but the timestamp of rates is the same.
+        mtime = os.path.getmtime(self.tmp_rates_filepath) + 10
+        os.utime(self.tmp_rates_filepath, (mtime, mtime))
+        converter.convert(10, 'EUR', 'CZK')
+        self.assertEqual(converter.rates_cache.stats['refreshes'], 2)
+        self.assertIs(converter._rates_table, table)
+
+    def test_cache_file_not_modified(self):
+        """When TTL expires, but the Rates file was not modified, it is not read again."""
+        converter = CurrencyConverter(app_id, 'file_no_update', symbols_filepath, self.tmp_rates_filepath,
+                                      rates_ttl=0)
+        converter.convert(10, 'EUR', 'CZK')
+        converter.convert(10, 'EUR', 'CZK')
+        self.assertEqual(converter.rates_cache.stats['refreshes'], 1)
+        self.assertEqual(converter.rates_cache.stats['revalidations'], 1)
+
+
+class TestAsyncCurrencyConverter(unittest.TestCase):
+    """
+    Tests AsyncCurrencyConverter in "api" mode against a local stub of the rates API.
+    """
+
+    def setUp(self):
+        self.server = StubRatesServer(rates_filepath, delay=0.05).start()
+        self.converter = AsyncCurrencyConverter(app_id, 'api', symbols_filepath, api_url=self.server.api_url,
+                                                fetch_timeout=1)
+
+    def tearDown(self):
+        self.converter.close()
+        self.server.stop()
+
+    def test_convert_async(self):
+        """Result of asynchronous conversion is the same as of the synchronous one."""
+        future = self.converter.convert_async(10, 'EUR', 'CZK')
+        self.assertEqual(json.loads(future.result(5))['output']['CZK'], 270.26)
+
+    def test_coalescing(self):
+        """Concurrent conversions share one download of rates."""
+        futures = [self.converter.convert_async(10, 'EUR', 'CZK') for _ in range(20)]
+        for future in futures:
+            self.assertEqual(json.loads(future.result(5))['output']['CZK'], 270.26)
+        self.assertEqual(self.server.request_count, 1)
+
+    def test_fallback(self):
+        """When the API fails, the last known rates are used."""
+        self.converter.convert_async(10, 'EUR', 'CZK').result(5)
+        self.converter.rates_cache.ttl = 0
+        self.converter.rates_cache._expires_at = 0
+        self.server.fail = True
+        future = self.converter.convert_async(10, 'EUR', 'CZK')
+        self.assertEqual(json.loads(future.result(5))['output']['CZK'], 270.26)
+        self.assertEqual(self.converter.fallback_count, 1)
+
+    def test_failure_coalescing(self):
+        """Conversions waiting for a download which timed out don't download again, they use the last rates."""
+        converter = AsyncCurrencyConverter(app_id, 'api', symbols_filepath, api_url=self.server.api_url,
+                                           fetch_timeout=0.2, workers=8)
+        self.addCleanup(converter.close)
+        converter.convert_async(10, 'EUR', 'CZK').result(5)
+        converter.rates_cache.ttl = 0
+        converter.rates_cache._expires_at = 0
+        self.server.delay = 1
+        start = time.time()
+        futures = [converter.convert_async(10, 'EUR', 'CZK') for _ in range(8)]
+        for future in futures:
+            self.assertEqual(json.loads(future.result(5))['output']['CZK'], 270.26)
+        self.assertLess(time.time() - start, 0.6)
+        # The first download and one which timed out (not retried on the kept-alive connection).
+        self.assertEqual(self.server.request_count, 2)
+        self.assertEqual(converter.fallback_count, 8)
+        self.assertEqual(converter.rates_cache.stats['failures'], 1)
+
+    def test_no_rates(self):
+        """When the API fails and no rates are known, the exception is raised from result()."""
+        self.server.fail = True
+        future = self.converter.convert_async(10, 'EUR', 'CZK')
+        with self.assertRaises(IOError):
+            future.result(5)
+
+
+class TestRatesRefresher(unittest.TestCase):
+    """
+    Tests background refreshing of rates (in "api" mode against a local stub of the rates API).
+    """
+
+    def setUp(self):
+        self.server = StubRatesServer(rates_filepath).start()
+        self.converter = CurrencyConverter(app_id, 'api', symbols_filepath, api_url=self.server.api_url,
+                                           rates_ttl=0.1)
+
+    def tearDown(self):
+        self.converter.stop_refresher()
+        self.server.stop()
+
+    def wait_for(self, condition):
+        """Wait (max. 5 seconds) until the condition is true."""
+        end = time.time() + 5
+        while not condition() and time.time() < end:
+            time.sleep(0.01)
+        self.assertTrue(condition())
+
+    def test_refresh(self):
+        """Rates are refreshed in the background and conversions don't download them."""
+        refresher = self.converter.start_refresher(interval=0.05)
+        self.wait_for(lambda: refresher.stats['refreshes'] >= 2)
+        self.converter.convert(10, 'EUR', 'CZK')
+        self.assertEqual(self.converter.rates_cache.stats['misses'], 0)
+        self.assertGreater(refresher.stats['total_latency'], 0)
+
+    def test_stale_while_revalidate(self):
+        """When refreshing fails, conversions use the expired rates and failures are counted."""
+        refresher = self.converter.start_refresher(interval=0.05)
+        self.wait_for(lambda: refresher.stats['refreshes'] >= 1)
+        self.server.fail = True
+        self.wait_for(lambda: refresher.stats['failures'] >= 1)
+        time.sleep(0.1)
+        dict_data = json.loads(self.converter.convert(10, 'EUR', 'CZK'))
+        self.assertEqual(dict_data['output']['CZK'], 270.26)
+        self.assertGreater(self.converter.rates_cache.stats['stale_hits'], 0)
+
+
+class TestRatesFileUpdate(unittest.TestCase):
+    """
+    Tests updating of the Rates file ("file" mode) and its binary snapshot.
+    """
+
+    def setUp(self):
+        """Copy the (expired) test rates file to a temporary directory and serve fresh rates from a stub API."""
+        self.tmp_dir = tempfile.mkdtemp()
+        self.tmp_rates_filepath = os.path.join(self.tmp_dir, 'rates.json')
+        shutil.copy(rates_filepath, self.tmp_rates_filepath)
+        self.server = StubRatesServer(rates_filepath, delay=0.05).start()
+        rates_data = json.loads(self.server.body)
+        rates_data['timestamp'] = int(time.time())
+        self.server.body = json.dumps(rates_data)
+
+    def tearDown(self):
+        self.server.stop()
+        shutil.rmtree(self.tmp_dir)
+
+    def create_converter(self):
+        return CurrencyConverter(app_id, 'file', symbols_filepath, self.tmp_rates_filepath,
+                                 api_url=self.server.api_url)
+
+    def test_snapshot(self):
+        """Binary snapshot contains the same rates as were saved."""
+        with open(rates_filepath) as rates_file:
+            rates_data = json.load(rates_file)
+        snapshot_filepath = os.path.join(self.tmp_dir, 'rates.bin')
+        write_snapshot(snapshot_filepath, rates_data)
+        snapshot = MappedSnapshot(snapshot_filepath)
+        self.assertEqual(snapshot.to_rates_data(),
+                         dict((key, rates_data[key]) for key in ['timestamp', 'base', 'rates']))
+        snapshot.close()
+
+    def test_update(self):
+        """Expired file is updated from API together with the snapshot, which is then read instead of JSON."""
+        converter = self.create_converter()
+        dict_data = json.loads(converter.convert(10, 'EUR', 'CZK'))
+        self.assertEqual(dict_data['output']['CZK'], 270.26)
+        self.assertTrue(os.path.isfile(converter.snapshot_filepath))
+        # Make JSON file unreadable - the snapshot must be used.
+        with open(self.tmp_rates_filepath, 'w') as rates_file:
+            rates_file.write('{')
+        mtime = os.path.getmtime(self.tmp_rates_filepath) - 10
+        os.utime(self.tmp_rates_filepath, (mtime, mtime))
+        self.assertEqual(converter._read_rates_file()['rates']['CZK'], 23.94491)
+
+    def test_single_update(self):
+        """When many converters (i.e. processes) find the file expired at once, only one of them updates it."""
+        converters = [self.create_converter() for _ in range(5)]
+        threads = [threading.Thread(target=converter.convert, args=(10, 'EUR', 'CZK')) for converter in converters]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.server.request_count, 1)
+
+
+class TestConversionServer(unittest.TestCase):
+    """
+    Tests HTTP conversion server (running in a background thread).
+    """
+
+    def setUp(self):
+        self.converter = CurrencyConverter(app_id, 'file_no_update', symbols_filepath, rates_filepath)
+        self.server = make_server(self.converter, port=0, workers=2)
+        self.thread = threading.Thread(target=self.server.serve_forever, args=(0.05,))
+        self.thread.start()
+        self.connection = httplib.HTTPConnection('127.0.0.1', self.server.server_address[1], timeout=5)
+
+    def tearDown(self):
+        self.connection.close()
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+        self.converter.stop_refresher()
+
+    def request(self, method, path, body=None):
+        """Send request through the keep-alive connection and return status and decoded JSON."""
+        self.connection.request(method, path, body)
+        response = self.connection.getresponse()
+        return response.status, json.loads(response.read())
+
+    def test_convert(self):
+        """Convert one amount (symbols are URL encoded) - more requests through one connection."""
+        for _ in range(3):
+            status, r_dict = self.request('GET', '/convert?amount=111.88&input_currency=K%C4%8D&output_currency=EUR')
+            self.assertEqual(status, 200)
+            self.assertEqual(r_dict, {'input': {'amount': 111.88, 'currency': 'CZK'}, 'output': {'EUR': 4.14}})
+
+    def test_convert_many(self):
+        """Convert a batch."""
+        status, r_dict = self.request('POST', '/convert_many', json.dumps([[10, 'EUR', 'CZK'], [500.5, '¥', '$']]))
+        self.assertEqual(status, 200)
+        self.assertEqual(r_dict['output_amounts'], [270.26, 4.45])
+        self.assertEqual(r_dict['output_currencies'], ['CZK', 'USD'])
+
+    def test_errors(self):
+        """Invalid input returns status 400, unknown path 404."""
+        status, r_dict = self.request('GET', '/convert?amount=10&input_currency=XEUR')
+        self.assertEqual(status, 400)
+        self.assertIn('XEUR', r_dict['error'])
+        status, r_dict = self.request('GET', '/xyz')
+        self.assertEqual(status, 404)
+
+    def test_invalid_items(self):
+        """Batch items with invalid types return status 400 (the connection is kept)."""
+        for body in ['[[null, "EUR", "CZK"]]', '[[{}, "EUR", "CZK"]]', '[[10, 1, "CZK"]]', '[[true, "EUR", "CZK"]]',
+                     '[10]', '{"a": 1}', '[["\\u00e9", "EUR", "CZK"]]', '[["nan", "EUR", "CZK"]]']:
+            status, r_dict = self.request('POST', '/convert_many', body)
+            self.assertEqual(status, 400, body)
+            self.assertIn('error', r_dict)
+
+    def test_invalid_input(self):
+        """Invalid UTF-8 and amounts which are not finite numbers return status 400."""
+        for query in ['amount=10&input_currency=%FF', 'amount=1e400&input_currency=EUR',
+                      'amount=nan&input_currency=EUR', 'amount=-inf&input_currency=EUR']:
+            status, r_dict = self.request('GET', '/convert?' + query)
+            self.assertEqual(status, 400, query)
+        self.assertIn(u'\ufffd', self.request('GET', '/convert?amount=10&input_currency=%FF')[1]['error'])
+
+    def test_too_large_body(self):
+        """Body larger than the limit returns status 413 and it is not read."""
+        self.server.max_body_size = 100
+        status, r_dict = self.request('POST', '/convert_many', json.dumps([[10, 'EUR', 'CZK']] * 20))
+        self.assertEqual(status, 413)
+        self.assertIn('100', r_dict['error'])
+
+    def test_invalid_content_length(self):
+        """Invalid Content-Length returns status 400 and the connection is closed."""
+        self.connection.putrequest('POST', '/convert_many')
+        self.connection.putheader('Content-Length', 'abc')
+        self.connection.endheaders()
+        response = self.connection.getresponse()
+        self.assertEqual(response.status, 400)
+        self.assertIn('Content-Length', json.loads(response.read())['error'])
+        self.assertTrue(response.will_close)
+
+    def test_idle_timeout(self):
+        """Idle keep-alive connections don't occupy the workers."""
+        self.server.idle_timeout = 0.1
+        idle_connections = [httplib.HTTPConnection('127.0.0.1', self.server.server_address[1], timeout=5)
+                            for _ in range(2)]
+        for connection in idle_connections:
+            connection.request('GET', '/health')
+            connection.getresponse().read()
+            self.addCleanup(connection.close)
+        # Both workers wait for the next request of the idle connections until the timeout.
+        start = time.time()
+        status, _ = self.request('GET', '/health')
+        self.assertEqual(status, 200)
+        self.assertLess(time.time() - start, 2)
+
+
+class TestStreamConverter(unittest.TestCase):
+    """
+    Tests conversion of CSV and JSON Lines streams.
+    """
+
+    def setUp(self):
+        self.converter = CurrencyConverter(app_id, 'file_no_update', symbols_filepath, rates_filepath)
+
+    def test_csv(self):
+        """Convert CSV (columns in any order) in small chunks."""
+        in_stream = StringIO('input_currency,amount,output_currency\nEUR,10,CZK\nKč,111.88,€\n¥,500.5,$\n')
+        out_stream = StringIO()
+        stats = convert_stream(self.converter, in_stream, out_stream, 'csv', chunk_size=2)
+        self.assertEqual(out_stream.getvalue(), 'amount,input_currency,output_amount,output_currency\n'
+                                                '10.0,EUR,270.26,CZK\n111.88,CZK,4.14,EUR\n500.5,JPY,4.45,USD\n')
+        self.assertEqual(stats['rows'], 3)
+
+    def test_jsonl(self):
+        """Convert JSON Lines."""
+        in_stream = StringIO('{"amount": 10, "input_currency": "EUR", "output_currency": "CZK"}\n'
+                             '{"amount": "111.88", "input_currency": "K\\u010d", "output_currency": "EUR"}\n')
+        out_stream = StringIO()
+        convert_stream(self.converter, in_stream, out_stream, 'jsonl')
+        lines = [json.loads(line) for line in out_stream.getvalue().splitlines()]
+        self.assertEqual(lines, [{'input': {'amount': 10, 'currency': 'EUR'}, 'output': {'CZK': 270.26}},
+                                 {'input': {'amount': 111.88, 'currency': 'CZK'}, 'output': {'EUR': 4.14}}])
+
+    def test_invalid_record(self):
+        """Invalid record stops the conversion with an exception."""
+        in_stream = StringIO('amount,input_currency,output_currency\n10,EUR,CZK\n10,XEUR,CZK\n')
+        with self.assertRaises(ValueError) as context:
+            convert_stream(self.converter, in_stream, StringIO(), 'csv')
+        self.assertTrue(5 in context.exception)
+
+    def test_invalid_input(self):
+        """Short CSV rows and invalid JSON Lines records raise ValueError with their row (line) number."""
+        in_stream = StringIO('amount,input_currency,output_currency\n10,EUR,CZK\n5,$\n')
+        with self.assertRaisesRegexp(ValueError, '^row 3: '):
+            convert_stream(self.converter, in_stream, StringIO(), 'csv')
+        for record, message in [('{"amount": 10, "input_currency": "EUR"}', 'output_currency must be string'),
+                                ('{"amount": null, "input_currency": "EUR", "output_currency": "CZK"}',
+                                 'amount must be number or string'),
+                                ('[10, "EUR", "CZK"]', 'record must be JSON object'),
+                                ('{"amount": 10,', '')]:
+            in_stream = StringIO('{"amount": 10, "input_currency": "EUR", "output_currency": "CZK"}\n' + record)
+            with self.assertRaisesRegexp(ValueError, '^line 2: ' + message):
+                convert_stream(self.converter, in_stream, StringIO(), 'jsonl')
+
+    def test_snapshot(self):
+        """Batches converted with a snapshot use its rates instead of the current ones."""
+        self.assertIs(self.converter.snapshot(), self.converter.snapshot())
+        snapshot = RatesTable({'timestamp': 1, 'base': 'USD', 'rates': {'USD': 1.0, 'EUR': 0.5, 'CZK': 10.0}})
+        result = self.converter.convert_many([(10, 'EUR', 'CZK')], snapshot=snapshot)
+        self.assertEqual(list(result['output_amounts']), [200.0])
+        result = self.converter.convert_many([(10, 'EUR', 'CZK')], exact=True, snapshot=snapshot)
+        self.assertEqual(result['output_minor_amounts'], [20000])
+        self.assertEqual(list(self.converter.convert_many([(10, 'EUR', 'CZK')])['output_amounts']), [270.26])
+
+
+class TestMoneyParser(unittest.TestCase):
+    """
+    Tests parsing of amounts with currencies entered as free text.
+    """
+
+    def setUp(self):
+        self.c_converter = CurrencyConverter(app_id, 'file_no_update', symbols_filepath, rates_filepath)
+
+    def test_parse(self):
+        """Currency before or after the number (also without space), numbers with group separators."""
+        cases = [
+            ('€10.04', ('10.04', 'EUR')),
+            ('1 000,50 Kč', ('1000.50', 'CZK')),
+            ('500.5¥', ('500.5', 'JPY')),
+            ('usd 10', ('10', 'USD')),
+            ("CHF 1'000.50", ('1000.50', 'CHF')),
+            ('1.234.567,89 €', ('1234567.89', 'EUR')),
+            ('1\xc2\xa0000 Kč', ('1000', 'CZK')),
+            ('Bs.10', ('10', 'BOB')),
+            ('10.د.ب', ('10', 'BHD')),
+            ('１０＄', ('10', 'USD')),
+            (u'-\u20ac5', ('-5', 'EUR')),
+        ]
+        for text, expected in cases:
+            self.assertEqual(self.c_converter.parse_money(text), expected)
+        # Batch parsing (with currencies resolved once per distinct text) gives the same results.
+        amounts, codes = MoneyParser(self.c_converter.resolver).parse_many(text for text, _ in cases)
+        self.assertEqual(zip(amounts, codes), [expected for _, expected in cases])
+
+    def test_invalid(self):
+        """Text without a number or a known currency raises an exception."""
+        for text in ['10', '€', '10 XYZ', '€10 Kč', '1.2.3,4,5 €']:
+            with self.assertRaises(ValueError) as context:
+                self.c_converter.parse_money(text)
+            self.assertTrue(13 in context.exception)
+
+    def test_normalize_number(self):
+        """Single separator followed by 3 digits is a group separator unless it's the decimal separator."""
+        self.assertEqual(normalize_number(u'1,000'), '1000')
+        self.assertEqual(normalize_number(u'1,000', ','), '1.000')
+        self.assertEqual(normalize_number(u'1.000', ','), '1000')
+        self.assertEqual(normalize_number(u'10,5'), '10.5')
+        self.assertEqual(normalize_number(u'1,000,000.5'), '1000000.5')
+
+    def test_convert_text(self):
+        """Parsed texts are converted like the amounts and currencies."""
+        self.assertEqual(json.loads(self.c_converter.convert_text('€10', 'CZK'))['output']['CZK'], 270.26)
+        result = self.c_converter.convert_text_many(['€10', '111,88 Kč', '10.د.ب'], 'EUR')
+        self.assertEqual(list(result['input_amounts']), [10.0, 111.88, 10.0])
+        self.assertEqual(result['input_currencies'], ['EUR', 'CZK', 'BHD'])
+        self.assertEqual(result['output_amounts'][1], 4.14)
+        with self.assertRaises(ValueError) as context:
+            self.c_converter.convert_text_many(['€10', 'Kč'], 'EUR')
+        self.assertIn('item 1', context.exception.args[0])
+
+
+class TestMoneyFormatter(unittest.TestCase):
+    """
+    Tests formatting of amounts with currency symbols by precompiled templates.
+    """
+
+    def setUp(self):
+        self.c_converter = CurrencyConverter(app_id, 'file_no_update', symbols_filepath, rates_filepath)
+
+    def test_locales(self):
+        """Separators, minor units and position of the symbol depend on the locale and the currency."""
+        formatter = self.c_converter.formatter('cs')
+        self.assertEqual(formatter.format(2707.36, 'CZK'), '2 707,36 Kč')
+        self.assertEqual(formatter.format(decimal.Decimal('1234.565'), 'BHD'), '1 234,565 .د.ب')
+        formatter = self.c_converter.formatter('en')
+        self.assertEqual(formatter.format(1234, 'JPY'), '¥1,234')
+        self.assertEqual(formatter.format(-10.5, 'USD'), '-$10.50')
+        self.assertEqual(formatter.format(10, 'CHF'), 'SFr. 10.00')
+        self.assertEqual(self.c_converter.formatter('de').format(1234.5, 'EUR'), '1.234,50 €')
+
+    def test_unknown_locale(self):
+        """Unknown locale raises an exception."""
+        with self.assertRaises(ValueError) as context:
+            self.c_converter.formatter('xx')
+        self.assertTrue(14 in context.exception)
+
+    def test_convert_formatted(self):
+        """All amounts of the result are formatted, the formatter is reused."""
+        result = self.c_converter.convert_formatted(10, 'EUR', locale='cs')
+        self.assertEqual(result['input'], {'amount': '10,00 €', 'currency': 'EUR'})
+        self.assertEqual(result['output']['CZK'], '270,26 Kč')
+        self.assertEqual(len(result['output']), len(json.loads(self.c_converter.convert(10, 'EUR'))['output']))
+        self.assertIs(self.c_converter.formatter('cs'), self.c_converter.formatter('cs'))
+        # Formatting of all amounts in one call gives the same results as one by one.
+        formatter = MoneyFormatter(self.c_converter.currency_symbols, ['CZK', 'USD'], 'fr')
+        self.assertEqual(formatter.format_many({'CZK': 1000, 'USD': -1}),
+                         {'CZK': formatter.format(1000, 'CZK'), 'USD': formatter.format(-1, 'USD')})
+
+    def test_currency_without_template(self):
+        """Currencies which are not in the current rates (i.e. in historical rates) are formatted too."""
+        formatter = MoneyFormatter(self.c_converter.currency_symbols, ['CZK'], 'en')
+        self.assertEqual(formatter.format(1.5, 'EUR'), '€1.50')
+        self.assertEqual(formatter.format_many({'CZK': 1, 'JPY': 10, 'XTS': 1}),
+                         {'CZK': 'Kč 1.00', 'JPY': '¥10', 'XTS': 'XTS 1.00'})
+
+
+class TestTextWriter(unittest.TestCase):
+    """
+    Tests buffered writing of CSV files.
+    """
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.writer = TextWriter(self.tmp_dir, buffer_size=16)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def read(self, file_name):
+        with open(os.path.join(self.tmp_dir, file_name)) as csv_file:
+            return csv_file.read()
+
+    def test_generator_and_quoting(self):
+        """Rows from a generator are written with BOM, cells with delimiter or quotes are quoted."""
+        rows = ([code, symbol, n] for n, (code, symbol) in enumerate([('GBP', u'£'), ('XXX', 'a;b'), ('YYY', 'q"')]))
+        stats = self.writer.write_file(rows, 'symbols', ';')
+        self.assertEqual(stats['rows'], 3)
+        self.assertEqual(self.read('symbols.csv'), '\xef\xbb\xbfGBP;\xc2\xa3;0\nXXX;"a;b";1\nYYY;"q""";2\n')
+
+    def test_append(self):
+        """Appended rows follow the existing ones, BOM is written only once."""
+        self.writer.append_file([['a', 1]], 'items', ',')
+        self.writer.append_file([['b', 2.5]], 'items', ',')
+        self.assertEqual(self.read('items.csv'), '\xef\xbb\xbfa,1\nb,2.5\n')
+
+    def test_gzip(self):
+        """Compressed file (also appended) is read as one stream."""
+        self.writer.write_file([['a', 1]], 'items', ',', compress=True)
+        self.writer.append_file((['b', n] for n in range(1000)), 'items', ',', compress=True)
+        with gzip.open(os.path.join(self.tmp_dir, 'items.csv.gz')) as gzip_file:
+            lines = gzip_file.read().splitlines()
+        self.assertEqual(len(lines), 1001)
+        self.assertEqual(lines[-1], 'b,999')
+
+    def test_row_writer(self):
+        """Rows are written to the stream when the buffer is full or flushed."""
+        stream = StringIO()
+        writer = RowWriter(stream, buffer_size=10)
+        writer.writerow(['a', 1])
+        self.assertEqual(stream.getvalue(), '')
+        writer.writerows([['b', 2]] * 3)
+        self.assertEqual(stream.getvalue(), 'a,1\nb,2\nb,2\nb,2\n')
+        writer.writerow(['c', 3])
+        writer.flush()
+        self.assertEqual(stream.getvalue(), 'a,1\nb,2\nb,2\nb,2\nc,3\n')
+        self.assertEqual(writer.rows, 5)
+
+
+class TestHistoricalRates(unittest.TestCase):
+    """
+    Tests conversion with historical rates.
+    The store contains test rates (2016-02-12 11:00:08 UTC) and the same rates with doubled CZK one hour later.
+    """
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.converter = CurrencyConverter(app_id, 'file_no_update', symbols_filepath, rates_filepath,
+                                           history_dirpath=self.tmp_dir)
+        # Loaded rates are saved to the store.
+        self.converter.convert(10, 'EUR', 'CZK')
+        with open(rates_filepath) as rates_file:
+            rates_data = json.load(rates_file)
+        self.timestamp = rates_data['timestamp']
+        rates_data['timestamp'] += 3600
+        rates_data['rates']['CZK'] *= 2
+        self.converter.history.append(rates_data)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_concurrent_new_currencies(self):
+        """Lookups map columns of currencies added by other process while other threads read all columns."""
+        with open(rates_filepath) as rates_file:
+            rates_data = json.load(rates_file)
+        writer = HistoricalRatesStore(self.tmp_dir)
+        self.addCleanup(writer.close)
+        store = self.converter.history
+        errors = []
+        stop_event = threading.Event()
+
+        def read():
+            while not stop_event.is_set():
+                try:
+                    store.rates_at(self.timestamp + 10 ** 6)
+                    store.series('CZK', self.timestamp, self.timestamp + 10 ** 6)
+                except Exception, e:
+                    errors.append(e)
+
+        threads = [threading.Thread(target=read) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        for n in range(30):
+            rates_data['timestamp'] += 7200
+            rates_data['rates']['X%02d' % n] = 1.0
+            writer.append(rates_data)
+        stop_event.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(store.rates_at(rates_data['timestamp'])['rates']['X29'], 1.0)
+
+    def test_convert_at(self):
+        """Use the last rates known at the time."""
+        for at, czk in [(self.timestamp, 270.26), (datetime.datetime(2016, 2, 12, 11, 30), 270.26),
+                        (self.timestamp + 3600, 540.52), (datetime.date(2016, 3, 1), 540.52)]:
+            dict_data = json.loads(self.converter.convert(10, 'EUR', 'CZK', at=at))
+            self.assertEqual(dict_data['output']['CZK'], czk)
+
+    def test_convert_at_e1(self):
+        """When there are no rates for the time, raise an exception."""
+        with self.assertRaises(ValueError) as context:
+            self.converter.convert(10, 'EUR', 'CZK', at=self.timestamp - 1)
+        self.assertTrue(10 in context.exception)
+
+    def test_convert_at_e2(self):
+        """When historical rates store is not set, raise an exception."""
+        converter = CurrencyConverter(app_id, 'file_no_update', symbols_filepath, rates_filepath)
+        with self.assertRaises(ValueError) as context:
+            converter.convert(10, 'EUR', 'CZK', at=self.timestamp)
+        self.assertTrue(11 in context.exception)
+
+    def test_convert_series(self):
+        """Convert with all rates in the time range."""
+        result = self.converter.convert_series(10, '€', 'Kč', self.timestamp - 10, self.timestamp + 3600)
+        self.assertEqual(result['timestamps'], (self.timestamp, self.timestamp + 3600))
+        self.assertEqual(list(result['output_amounts']), [270.26, 540.52])
+
+    def test_reopen(self):
+        """Snapshots are persistent and not appended twice."""
+        store = HistoricalRatesStore(self.tmp_dir)
+        self.assertEqual(len(store), 2)
+        self.assertFalse(store.append(store.rates_at(self.timestamp)))
+        self.assertEqual(store.rates_at(self.timestamp + 3600)['rates']['CZK'], 23.94491 * 2)
+
+
+
+class TestExactConversion(unittest.TestCase):
+    """
+    Tests exact (fixed-point) conversion with minor units of currencies and rounding modes.
+    """
+
+    def setUp(self):
+        self.c_converter = CurrencyConverter(app_id, 'file_no_update', symbols_filepath, rates_filepath)
+
+    def test_exact(self):
+        """Amounts are Decimal objects rounded to minor units of the output currency."""
+        result = self.c_converter.convert('10', 'EUR', 'CZK', result_format='object', exact=True)
+        self.assertEqual(result.amount, decimal.Decimal('10'))
+        self.assertEqual(str(result.output['CZK']), '270.26')
+        for code, places in [('JPY', 0), ('KWD', 3), ('USD', 2)]:
+            output = self.c_converter.convert('10.00', 'EUR', code, result_format='object', exact=True).output
+            self.assertEqual(output[code].as_tuple().exponent, -places)
+
+    def test_exact_json(self):
+        """Decimal amounts are strings in JSON."""
+        dict_data = json.loads(self.c_converter.convert(decimal.Decimal('10.00'), 'EUR', 'CZK', exact=True))
+        self.assertEqual(dict_data['output']['CZK'], '270.26')
+        dict_data = json.loads(self.c_converter.convert('10', 'EUR', exact=True))
+        self.assertEqual(dict_data['output']['JPY'], '1270')
+
+    def test_exact_rounding(self):
+        """Result is the same as with Decimal arithmetic for all rounding modes."""
+        context = decimal.Context(prec=50)
+        with open(rates_filepath) as rates_file:
+            rates = json.load(rates_file)['rates']
+        exact_rate = context.divide(decimal.Decimal(repr(rates['CZK'])), decimal.Decimal(repr(rates['EUR'])))
+        for rounding in [decimal.ROUND_HALF_UP, decimal.ROUND_HALF_EVEN, decimal.ROUND_DOWN, decimal.ROUND_CEILING]:
+            for amount in ['0.01', '0.05', '1.15', '123.45', '99999.99']:
+                result = self.c_converter.convert(amount, 'EUR', 'CZK', result_format='object', exact=True,
+                                                  rounding=rounding)
+                expected = context.multiply(decimal.Decimal(amount), exact_rate).quantize(decimal.Decimal('0.01'),
+                                                                                          rounding=rounding)
+                self.assertEqual(result.output['CZK'], expected)
+
+    def test_exact_many(self):
+        """Batch conversion returns integers in minor units."""
+        result = self.c_converter.convert_many([('10', 'EUR', 'CZK'), (10, '€', 'JPY'), ('0.1', 'USD', 'KWD')],
+                                               exact=True)
+        self.assertEqual(result['output_minor_amounts'], [27026, 1270, 30])
+        self.assertEqual(result['output_minor_units'], [2, 0, 3])
+        self.assertEqual(result['output_currencies'], ['CZK', 'JPY', 'KWD'])
+
+    def test_exact_e1(self):
+        """Invalid amount or rounding mode raises an exception."""
+        for amount, code in [('1.2.3', 6), ('abc', 6), ('-1', 7)]:
+            with self.assertRaises(ValueError) as context:
+                self.c_converter.convert(amount, 'EUR', 'CZK', exact=True)
+            self.assertTrue(code in context.exception)
+        with self.assertRaises(ValueError) as context:
+            self.c_converter.convert(10, 'EUR', 'CZK', exact=True, rounding='ROUND_RANDOM')
+        self.assertTrue(12 in context.exception)
+
+    def test_exact_exponent_range(self):
+        """Amounts with huge exponents are rejected at once (they are not expanded to huge integers)."""
+        start = time.time()
+        for amount in ['1e-999999999', '1e999999999', decimal.Decimal('1e-999999999'), '0.' + '1' * 500]:
+            with self.assertRaises(ValueError) as context:
+                self.c_converter.convert(amount, 'EUR', 'CZK', exact=True)
+            self.assertTrue(6 in context.exception)
+        with self.assertRaises(ValueError) as context:
+            parse_amount('1e401')
+        self.assertIn('Not a finite number', context.exception.args[0])
+        self.assertEqual(parse_amount('1e400'), (10 ** 400, 0))
+        self.assertLess(time.time() - start, 1)
+
+
+class TestResultCache(unittest.TestCase):
+    """
+    Tests remembering of conversion results.
+    """
+
+    def setUp(self):
+        self.server = StubRatesServer(rates_filepath).start()
+        self.converter = CurrencyConverter(app_id, 'api', symbols_filepath, api_url=self.server.api_url,
+                                           rates_ttl=0, result_cache_size=2)
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_hits(self):
+        """Repeated conversion (amount and currencies in any form) is taken from the cache."""
+        result = self.converter.convert(10, 'EUR')
+        self.assertIs(self.converter.convert('10.0', '€'), result)
+        self.assertEqual(self.converter.result_cache.stats['hits'], 1)
+        # Returned objects are copies.
+        r_dict = self.converter.convert(10, 'EUR', 'CZK', result_format='dict')
+        r_dict['output']['CZK'] = 0
+        self.assertEqual(self.converter.convert(10, 'EUR', 'CZK', result_format='dict')['output']['CZK'], 270.26)
+
+    def test_limit(self):
+        """The least recently used result is removed."""
+        for amount in [1, 2, 3]:
+            self.converter.convert(amount, 'EUR', 'CZK')
+        self.assertEqual(len(self.converter.result_cache), 2)
+        self.assertEqual(self.converter.result_cache.stats['evictions'], 1)
+
+    def test_invalidation(self):
+        """Results are removed when new rates are loaded."""
+        self.converter.convert(10, 'EUR', 'CZK')
+        rates_data = json.loads(self.server.body)
+        rates_data['timestamp'] += 60
+        rates_data['rates']['CZK'] *= 2
+        self.server.body = json.dumps(rates_data)
+        dict_data = json.loads(self.converter.convert(10, 'EUR', 'CZK'))
+        self.assertEqual(dict_data['output']['CZK'], 540.52)
+        self.assertEqual(self.converter.result_cache.stats['hits'], 0)
+
+
+class TestOutputCurrencies(unittest.TestCase):
+    """
+    Tests conversion to several (listed) currencies and direct JSON encoding.
+    """
+
+    def setUp(self):
+        self.c_converter = CurrencyConverter(app_id, 'file_no_update', symbols_filepath, rates_filepath)
+
+    def test_subset(self):
+        """Listed currencies (codes or symbols, duplicates ignored) are returned with the same amounts."""
+        result = self.c_converter.convert(10, 'EUR', ['CZK', '$', 'USD', 'GBP'], result_format='dict')
+        self.assertEqual(sorted(result['output']), ['CZK', 'GBP', 'USD'])
+        all_result = self.c_converter.convert(10, 'EUR', result_format='dict')
+        for code, amount in result['output'].iteritems():
+            self.assertEqual(amount, all_result['output'][code])
+
+    def test_subset_invalid(self):
+        """Unknown currency in the list raises an exception."""
+        with self.assertRaises(ValueError) as context:
+            self.c_converter.convert(10, 'EUR', ['CZK', 'XYZ'])
+        self.assertTrue(5 in context.exception)
+
+    def test_json_encoding(self):
+        """JSON written directly is the same as JSON of the result dictionary."""
+        for amount in [10, 0.1, 1234567.891, 0]:
+            for output_cur in [None, 'CZK', ['JPY', 'CZK']]:
+                json_data = self.c_converter.convert(amount, 'EUR', output_cur)
+                r_dict = self.c_converter.convert(amount, 'EUR', output_cur, result_format='dict')
+                self.assertEqual(json.loads(json_data), r_dict)
+        self.assertEqual(self.c_converter.convert(0.1, 'EUR', 'CZK'),
+                         json.dumps(self.c_converter.convert(0.1, 'EUR', 'CZK', result_format='dict')))
+
+    def test_json_overflow(self):
+        """Amounts which overflow are serialized by json module (the same as without direct encoding)."""
+        for output_cur in ['IDR', None]:
+            json_data = self.c_converter.convert(1e306, 'USD', output_cur)
+            self.assertNotIn(': inf', json_data)
+            self.assertEqual(json.loads(json_data)['output']['IDR'], float('inf'))
+            self.assertEqual(json_data, json.dumps(self.c_converter.convert(1e306, 'USD', output_cur,
+                                                                            result_format='dict')))
+
+
+class TestDeltaUpdates(unittest.TestCase):
+    """
+    Tests that unchanged rates are not downloaded, saved or processed again.
+    """
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.server = StubRatesServer(rates_filepath).start()
+
+    def tearDown(self):
+        self.server.stop()
+        shutil.rmtree(self.tmp_dir)
+
+    def test_conditional_request(self):
+        """Rates are downloaded again only if they have changed (ETag), the table is not rebuilt."""
+        converter = CurrencyConverter(app_id, 'api', symbols_filepath, api_url=self.server.api_url, rates_ttl=0)
+        converter.convert(10, 'EUR', 'CZK')
+        table = converter._rates_table
+        for _ in range(3):
+            dict_data = json.loads(converter.convert(10, 'EUR', 'CZK'))
+            self.assertEqual(dict_data['output']['CZK'], 270.26)
+        self.assertEqual((self.server.request_count, self.server.not_modified_count), (4, 3))
+        self.assertIs(converter._rates_table, table)
+        # Changed rates are downloaded.
+        rates_data = json.loads(self.server.body)
+        rates_data['timestamp'] += 60
+        self.server.body = json.dumps(rates_data)
+        converter.convert(10, 'EUR', 'CZK')
+        self.assertEqual(converter._rates_table.timestamp, rates_data['timestamp'])
+        self.assertEqual(converter._rates_table.changed, frozenset())
+
+    def test_conditional_provider(self):
+        """HTTP provider returns None for conditional request if the rates have not changed."""
+        provider = HttpRatesProvider(self.server.api_url)
+        self.assertIsNotNone(provider.fetch(conditional=True))
+        self.assertIsNone(provider.fetch(conditional=True))
+        self.assertIsNotNone(provider.fetch())
+        provider.close()
+
+    def test_unchanged_file(self):
+        """Expired file is not rewritten if API returns rates with the same timestamp."""
+        tmp_rates_filepath = os.path.join(self.tmp_dir, 'rates.json')
+        shutil.copy(rates_filepath, tmp_rates_filepath)
+        mtime = int(os.path.getmtime(tmp_rates_filepath)) - 10
+        os.utime(tmp_rates_filepath, (mtime, mtime))
+        converter = CurrencyConverter(app_id, 'file', symbols_filepath, tmp_rates_filepath,
+                                      api_url=self.server.api_url)
+        dict_data = json.loads(converter.convert(10, 'EUR', 'CZK'))
+        self.assertEqual(dict_data['output']['CZK'], 270.26)
+        self.assertEqual(self.server.request_count, 1)
+        self.assertEqual(os.path.getmtime(tmp_rates_filepath), mtime)
+        self.assertFalse(os.path.exists(converter.snapshot_filepath))
+
+    def test_incremental_table(self):
+        """Only cross rates of changed currencies are calculated - the result is the same as a new table."""
+        with open(rates_filepath) as rates_file:
+            rates_data = json.load(rates_file)
+        table = RatesTable(rates_data)
+        rates_data['timestamp'] += 60
+        rates_data['rates']['CZK'] *= 1.01
+        rates_data['rates']['EUR'] *= 0.99
+        new_table = RatesTable(rates_data, previous=table)
+        self.assertEqual(new_table.changed, frozenset(['CZK', 'EUR']))
+        self.assertEqual(new_table.cross, RatesTable(rates_data).cross)
+        # Different currencies - the whole table is calculated.
+        del rates_data['rates']['CZK']
+        self.assertIsNone(RatesTable(rates_data, previous=new_table).changed)
+
+
+class TestRatesProviders(unittest.TestCase):
+    """
+    Tests getting rates from several providers with failover, hedged requests and circuit breaker.
+    """
+
+    def setUp(self):
+        with open(rates_filepath) as rates_file:
+            self.rates_data = json.load(rates_file)
+        self.rates_data['timestamp'] = int(time.time())
+
+    def test_failover(self):
+        """When a provider fails, the next one is used."""
+        broken = StaticRatesProvider(self.rates_data, name='broken')
+        broken.fail = True
+        backup = StaticRatesProvider(self.rates_data, name='backup')
+        provider = FailoverRatesProvider([broken, backup], hedge_delay=None)
+        converter = CurrencyConverter(app_id, 'api', symbols_filepath, rates_provider=provider)
+        dict_data = json.loads(converter.convert(10, 'EUR', 'CZK'))
+        self.assertEqual(dict_data['output']['CZK'], 270.26)
+        self.assertEqual(provider.stats['broken']['failures'], 1)
+        self.assertEqual(provider.stats['backup']['requests'], 1)
+
+    def test_hedged_request(self):
+        """Slow provider does not delay the result - the next provider is asked too."""
+        slow = StaticRatesProvider(self.rates_data, delay=1.0, name='slow')
+        fast = StaticRatesProvider(self.rates_data, name='fast')
+        provider = FailoverRatesProvider([slow, fast], hedge_delay=0.05)
+        start = time.time()
+        self.assertEqual(json.loads(provider.fetch())['timestamp'], self.rates_data['timestamp'])
+        self.assertLess(time.time() - start, 0.5)
+        self.assertEqual(provider.stats['fast']['requests'], 1)
+        # The slow provider finishes in the background - then the fast one is asked first.
+        time.sleep(1.1)
+        self.assertGreater(provider.stats['slow']['avg_latency'], provider.stats['fast']['avg_latency'])
+        provider.fetch()
+        self.assertEqual((slow.fetch_count, fast.fetch_count), (1, 2))
+
+    def test_circuit_breaker(self):
+        """Provider failing repeatedly is skipped until reset timeout passes."""
+        broken = StaticRatesProvider(self.rates_data, name='broken')
+        broken.fail = True
+        provider = FailoverRatesProvider([broken], failure_threshold=2, reset_timeout=0.2)
+        for _ in range(4):
+            self.assertRaises(IOError, provider.fetch)
+        self.assertEqual(broken.fetch_count, 2)
+        # After reset timeout, the provider is tried again.
+        time.sleep(0.25)
+        broken.fail = False
+        provider.fetch()
+        self.assertEqual(broken.fetch_count, 3)
+        self.assertEqual(provider.stats['broken']['open_until'], 0)
+
+    def test_all_failed(self):
+        """When all providers fail, raise the error of the last one."""
+        broken = StaticRatesProvider(self.rates_data, name='broken')
+        broken.fail = True
+        stub = StubRatesServer(rates_filepath).start()
+        stub.fail = True
+        try:
+            provider = FailoverRatesProvider([broken, HttpRatesProvider(stub.api_url, timeout=1.0)], hedge_delay=0)
+            with self.assertRaises(IOError):
+                provider.fetch()
+            provider.close()
+        finally:
+            stub.stop()
+
+
+class TestMetrics(unittest.TestCase):
+    """
+    Tests metrics of conversions and getting rates and their export in Prometheus format.
+    """
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.rates_filepath = os.path.join(self.tmp_dir, 'latest.json')
+        shutil.copy(rates_filepath, self.rates_filepath)
+        self.metrics = Metrics()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_convert_metrics(self):
+        """Stages of conversion, cache statistics and bytes read are recorded."""
+        converter = CurrencyConverter(app_id, 'file_no_update', symbols_filepath, self.rates_filepath,
+                                      metrics=self.metrics)
+        for _ in range(3):
+            converter.convert(10, 'EUR', 'CZK')
+        text = self.metrics.to_prometheus()
+        self.assertIn('currency_converter_convert_seconds_count 3\n', text)
+        for stage in ['validate', 'rates', 'resolve', 'math', 'serialize']:
+            self.assertIn('currency_converter_convert_stage_seconds_count{stage="%s"} 3\n' % stage, text)
+        self.assertIn('currency_converter_rates_cache_hits_total 2\n', text)
+        self.assertIn('# TYPE currency_converter_convert_seconds histogram\n', text)
+        self.assertEqual(self.metrics.counter('rates_file_bytes_read_total', format='json'),
+                         os.path.getsize(self.rates_filepath))
+
+    def test_fallback_metrics(self):
+        """API errors and fallbacks to the (expired) Rates file are counted."""
+        stub = StubRatesServer(rates_filepath).start()
+        stub.fail = True
+        try:
+            converter = CurrencyConverter(app_id, 'file', symbols_filepath, self.rates_filepath, api_url=stub.api_url,
+                                          metrics=self.metrics)
+            converter.convert(10, 'EUR', 'CZK')
+        finally:
+            stub.stop()
+        self.assertEqual(self.metrics.counter('api_requests_total'), 1)
+        self.assertEqual(self.metrics.counter('api_errors_total'), 1)
+        self.assertEqual(self.metrics.counter('file_fallbacks_total'), 1)
+        self.assertIn('currency_converter_get_rates_seconds_count{source="file"} 1\n', self.metrics.to_prometheus())
+
+    def test_server_metrics(self):
+        """Server exports metrics on /metrics."""
+        converter = CurrencyConverter(app_id, 'file_no_update', symbols_filepath, self.rates_filepath,
+                                      metrics=self.metrics)
+        server = make_server(converter, port=0, workers=2)
+        thread = threading.Thread(target=server.serve_forever, args=(0.05,))
+        thread.start()
+        try:
+            connection = httplib.HTTPConnection('127.0.0.1', server.server_address[1], timeout=5)
+            connection.request('GET', '/convert?amount=10&input_currency=EUR&output_currency=CZK')
+            connection.getresponse().read()
+            connection.request('GET', '/metrics')
+            response = connection.getresponse()
+            text = response.read()
+            connection.close()
+        finally:
+            server.shutdown()
+            server.server_close()
+            thread.join()
+            converter.stop_refresher()
+        self.assertEqual(response.status, 200)
+        self.assertIn('currency_converter_http_requests_total{path="/convert",status="200"} 1\n', text)
+        self.assertIn('currency_converter_convert_seconds_count 1\n', text)
+
+
+class TestSharedRegistry(unittest.TestCase):
+    """
+    Tests sharing of symbols and rates by converters of one process.
+    """
+
+    def new_converter(self, **kwargs):
+        converter = CurrencyConverter(app_id, 'file_no_update', symbols_filepath, rates_filepath, **kwargs)
+        self.addCleanup(converter.close)
+        return converter
+
+    def test_symbols(self):
+        """All converters get the same immutable symbols, they are released by close()."""
+        converter1 = self.new_converter()
+        converter2 = self.new_converter()
+        symbols = converter1.currency_symbols
+        self.assertIs(converter2.currency_symbols, symbols)
+        self.assertEqual(symbols['€'], 'EUR')
+        with self.assertRaises(TypeError):
+            symbols['X'] = 'XTS'
+        # Index of the symbols is shared too (tables of the converters have equal codes).
+        converter1.convert(10, 'EUR', 'CZK')
+        converter2.convert(10, 'EUR', 'CZK')
+        self.assertIsNot(converter1._rates_table, converter2._rates_table)
+        self.assertIs(converter1.resolver, converter2.resolver)
+        key = converter1._shared_keys[0]
+        references = registry.references(key)
+        converter1.close()
+        self.assertEqual(registry.references(key), references - 1)
+        self.assertIsNone(converter1._currency_symbols)
+
+    def test_shared_rates(self):
+        """Converters with the same source load the rates and build the table only once."""
+        converter1 = self.new_converter(shared=True)
+        converter2 = self.new_converter(shared=True)
+        other_converter = self.new_converter(shared=True, rates_ttl=30)
+        self.assertIs(converter1.rates_cache, converter2.rates_cache)
+        self.assertIsNot(converter1.rates_cache, other_converter.rates_cache)
+        self.assertEqual(json.loads(converter1.convert(10, 'EUR', 'CZK'))['output']['CZK'], 270.26)
+        self.assertEqual(json.loads(converter2.convert(10, 'EUR', 'CZK'))['output']['CZK'], 270.26)
+        self.assertIs(converter1._rates_table, converter2._rates_table)
+        self.assertEqual(converter1.rates_cache.stats['refreshes'], 1)
+        # Not shared converter has its own rates.
+        self.assertIsNot(self.new_converter().rates_cache, converter1.rates_cache)
+
+    def test_shared_refresher(self):
+        """Shared refresher runs until the last converter stops it."""
+        converter1 = self.new_converter(shared=True)
+        converter2 = self.new_converter(shared=True)
+        refresher = converter1.start_refresher(interval=60)
+        self.assertIs(converter2.start_refresher(), refresher)
+        converter1.stop_refresher()
+        self.assertTrue(refresher._thread.is_alive())
+        self.assertTrue(converter2.rates_cache.stale_while_revalidate)
+        converter2.close()
+        self.assertFalse(refresher._thread.is_alive())
+        self.assertFalse(converter1.rates_cache.stale_while_revalidate)
+
+    def test_eviction(self):
+        """Unused objects are kept for reuse, the least recently released are evicted."""
+        shared_registry = SharedRegistry(max_unused=1)
+        first = shared_registry.acquire('a', object)
+        self.assertIs(shared_registry.acquire('a', object), first)
+        shared_registry.release('a')
+        shared_registry.release('a')
+        # Unused object is reused.
+        self.assertIs(shared_registry.acquire('a', object), first)
+        shared_registry.release('a')
+        shared_registry.acquire('b', object)
+        shared_registry.release('b')
+        self.assertEqual(shared_registry.stats, {'hits': 2, 'misses': 2, 'evictions': 1})
+        self.assertIsNot(shared_registry.acquire('a', object), first)
+        self.assertEqual(len(shared_registry), 2)
+
+
+class TestLazyStartup(unittest.TestCase):
+    """
+    Tests that symbols are read on first use and cached in the symbols cache directory (if it's set).
+    """
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.symbols_filepath = os.path.join(self.tmp_dir, 'currency_symbols.txt')
+        shutil.copy(symbols_filepath, self.symbols_filepath)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_lazy_symbols(self):
+        """Symbols are not read in constructor."""
+        converter = CurrencyConverter(app_id, 'file_no_update', self.symbols_filepath, rates_filepath)
+        self.assertIsNone(converter._currency_symbols)
+        self.assertIsNone(converter._resolver)
+        self.assertEqual(json.loads(converter.convert(10, '€', 'Kč'))['output']['CZK'], 270.26)
+        self.assertEqual(converter.currency_symbols['€'], 'EUR')
+
+    def test_symbols_cache(self):
+        """Cache is saved only to the cache directory and it is used until the symbols file changes."""
+        converter = CurrencyConverter(app_id, 'file_no_update', self.symbols_filepath, rates_filepath)
+        self.assertEqual(converter.currency_symbols['€'], 'EUR')
+        self.assertEqual(os.listdir(self.tmp_dir), ['currency_symbols.txt'])
+        cache_dir = os.path.join(self.tmp_dir, 'cache')
+        self.assertEqual(CurrencyConverter._load_currency_symbols(self.symbols_filepath, cache_dir)['€'], 'EUR')
+        self.assertEqual(len(os.listdir(cache_dir)), 1)
+        with open(self.symbols_filepath, 'a') as symbols_file:
+            symbols_file.write('XTS\tTEST\n')
+        converter = CurrencyConverter(app_id, 'file_no_update', self.symbols_filepath, rates_filepath,
+                                      symbols_cache_dir=cache_dir)
+        self.assertEqual(converter.currency_symbols['TEST'], 'XTS')
+        self.assertEqual(CurrencyConverter._load_currency_symbols(self.symbols_filepath, cache_dir)['TEST'], 'XTS')
+        # Invalid cache is ignored (and replaced).
+        cache_filepath = os.path.join(cache_dir, os.listdir(cache_dir)[0])
+        with open(cache_filepath, 'wb') as cache_file:
+            cache_file.write('invalid')
+        self.assertEqual(CurrencyConverter._load_currency_symbols(self.symbols_filepath, cache_dir)['TEST'], 'XTS')
+        self.assertNotEqual(open(cache_filepath, 'rb').read(), 'invalid')
+
+
+class CountingLock(object):
+    """
+    Lock which counts its acquisitions.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.acquisitions = 0
+
+    def acquire(self, blocking=True):
+        self.acquisitions += 1
+        return self._lock.acquire(blocking)
+
+    def release(self):
+        self._lock.release()
+
+    def __enter__(self):
+        self.acquire()
+
+    def __exit__(self, *args):
+        self.release()
+
+
+class TestThreadSafety(unittest.TestCase):
+    """
+    Stress test of one converter shared by many threads while the rates (and the Rates file) are being refreshed.
+    Every new version of the rates multiplies all of them by the version number, so a result mixing two versions
+    is detected.
+    """
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.tmp_rates_filepath = os.path.join(self.tmp_dir, 'rates.json')
+        shutil.copy(rates_filepath, self.tmp_rates_filepath)
+        with open(rates_filepath) as rates_file:
+            self.rates_data = json.load(rates_file)
+        self.version = 1
+        self.provider = StaticRatesProvider(self.versioned_rates(1))
+        # The Rates file has an old timestamp, so both converters (i.e. processes) update it on every refresh.
+        self.converters = [CurrencyConverter(app_id, 'file', symbols_filepath, self.tmp_rates_filepath,
+                                             rates_provider=self.provider) for _ in range(2)]
+        # Reads the Rates file whenever it changes.
+        self.file_converter = CurrencyConverter(app_id, 'file_no_update', symbols_filepath, self.tmp_rates_filepath,
+                                                rates_ttl=0)
+        self.stop_event = threading.Event()
+
+    def tearDown(self):
+        for converter in self.converters:
+            converter.stop_refresher()
+        shutil.rmtree(self.tmp_dir)
+
+    def versioned_rates(self, version):
+        rates = dict((code, rate * version) for code, rate in self.rates_data['rates'].iteritems())
+        rates['USD'] = 1.0
+        return {'timestamp': self.rates_data['timestamp'] + version, 'base': 'USD', 'rates': rates}
+
+    def change_rates(self):
+        """Publish a new version of the rates every few milliseconds (until stopped)."""
+        while not self.stop_event.wait(0.005):
+            self.version += 1
+            self.provider.rates_data = self.versioned_rates(self.version)
+
+    def convert(self, converter, counts, errors):
+        """Convert until stopped, check that every result uses rates of one version."""
+        n = 0
+        while not self.stop_event.is_set():
+            try:
+                output = converter.convert(1000, 'USD', result_format='object').output
+                versions = set(int(round(amount / (1000 * self.rates_data['rates'][code])))
+                               for code, amount in output.iteritems()
+                               if code != 'USD' and self.rates_data['rates'][code] >= 1)
+                if len(versions) != 1:
+                    errors.append(versions)
+            except Exception, e:
+                errors.append(e)
+            n += 1
+        counts.append(n)
+
+    def run_threads(self, n_threads, duration=0.5):
+        """
+        Returns:
+            Tuple (list of numbers of conversions of the threads, errors) of n_threads converting threads.
+        """
+        counts = []
+        errors = []
+        self.stop_event.clear()
+        threads = [threading.Thread(target=self.change_rates)]
+        for n in range(n_threads):
+            converter = self.file_converter if n % 4 == 3 else self.converters[0]
+            threads.append(threading.Thread(target=self.convert, args=(converter, counts, errors)))
+        for thread in threads:
+            thread.start()
+        time.sleep(duration)
+        self.stop_event.set()
+        for thread in threads:
+            thread.join()
+        return counts, errors
+
+    def start_refreshers(self):
+        for converter in self.converters:
+            converter.convert(10, 'EUR')
+            converter.start_refresher(interval=0.002)
+
+    def test_no_torn_reads(self):
+        """Results of all threads are consistent while the rates change."""
+        self.start_refreshers()
+        counts, errors = self.run_threads(8)
+        self.assertEqual(errors, [])
+        self.assertGreater(sum(counts), 0)
+        for converter in self.converters:
+            self.assertGreater(converter.refresher.stats['refreshes'], 2)
+            self.assertEqual(converter.refresher.stats['failures'], 0)
+        # The file contains one of the versions.
+        with open(self.tmp_rates_filepath) as rates_file:
+            self.assertGreaterEqual(json.load(rates_file)['timestamp'], self.rates_data['timestamp'] + 2)
+
+    def test_lock_free(self):
+        """Conversions with fresh rates (also repeated ones from the result cache) don't take any lock."""
+        converter = CurrencyConverter(app_id, 'file_no_update', symbols_filepath, rates_filepath, rates_ttl=60,
+                                      result_cache_size=16)
+        for output_cur in ['CZK', 'Kč', None]:
+            converter.convert(10, '€', output_cur)
+        locks = [CountingLock() for _ in range(4)]
+        converter.rates_cache._lock, converter._table_lock, converter.result_cache._lock, \
+            converter.resolver._memo._lock = locks
+
+        def convert():
+            for _ in range(500):
+                for output_cur in ['CZK', 'Kč', None]:
+                    converter.convert(10, '€', output_cur)
+
+        threads = [threading.Thread(target=convert) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual([lock.acquisitions for lock in locks], [0, 0, 0, 0])
+        # Statistics are not locked (they can miss some increments).
+        self.assertGreater(converter.result_cache.stats['hits'], 0)
+
+    def test_no_blocking(self):
+        """Conversions don't wait for each other or for refreshes - every thread converts while the rates change."""
+        # Throughput with more threads is compared by benchmarks/conversion.py (convert_threads_* cases).
+        self.start_refreshers()
+        # Only the converter with the refresher (the file converter reads the file on every conversion).
+        self.file_converter = self.converters[0]
+        refreshes = self.converters[0].refresher.stats['refreshes']
+        counts, errors = self.run_threads(4)
+        self.assertEqual(errors, [])
+        self.assertEqual(len(counts), 4)
+        self.assertGreater(min(counts), 0)
+        self.assertGreater(self.converters[0].refresher.stats['refreshes'], refreshes)
+
+
+class TestSymbolsBuilder(unittest.TestCase):
+    """
+    Tests building of the currency symbols table from saved Wikipedia pages (offline) and the page cache.
+    """
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        with open(wiki_list_filepath) as list_file:
+            self.list_html = list_file.read()
+        self.fixtures = {'https://en.wikipedia.org/wiki/British_pound': currency_page_filepath}
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_parse(self):
+        """Symbols with links to currencies are found in the list, code and name on the currency page."""
+        links = parse_symbols_list(self.list_html.decode('utf-8'))
+        self.assertEqual(links[u'£'], 'https://en.wikipedia.org/wiki/British_pound')
+        self.assertEqual(links[u'Ar'], 'https://en.wikipedia.org/wiki/Malagasy_ariary')
+        with open(currency_page_filepath) as page_file:
+            self.assertEqual(parse_currency_page(page_file.read().decode('utf-8')), (u'GBP', u'Pound sterling'))
+        self.assertIsNone(parse_currency_page(u'<html><h1 id="firstHeading">Old coin</h1></html>'))
+
+    def test_offline_build(self):
+        """Pages from fixtures are cached, parsed once and available to the next offline build."""
+        builder = SymbolsBuilder(self.tmp_dir, offline=True, fixtures=self.fixtures)
+        rows = builder.build(self.list_html)
+        self.assertEqual(rows, [[u'GBP', u'£', u'Pound sterling']])
+        self.assertEqual(builder.stats['parsed'], 1)
+        self.assertEqual((builder.stats['fixture'], builder.stats['cached']), (1, 0))
+        builder = SymbolsBuilder(self.tmp_dir, offline=True)
+        self.assertEqual(builder.build(self.list_html), rows)
+        self.assertEqual((builder.stats['fixture'], builder.stats['cached']), (0, 1))
+        self.assertEqual(builder.stats['parsed'], 0)
+        self.assertEqual(builder.stats['parse_cache_hits'], 1)
+
+    def test_conditional_download(self):
+        """Unchanged page is not downloaded again (304) and not parsed again."""
+        server = StubRatesServer(currency_page_filepath).start()
+        try:
+            builder = SymbolsBuilder(self.tmp_dir, workers=2)
+            self.assertEqual(builder.currency_info(server.api_url), (u'GBP', u'Pound sterling'))
+            builder.save()
+            builder = SymbolsBuilder(self.tmp_dir, workers=2)
+            self.assertEqual(builder.currency_info(server.api_url), (u'GBP', u'Pound sterling'))
+            self.assertEqual(server.not_modified_count, 1)
+            self.assertEqual(builder.stats['parse_cache_hits'], 1)
+            # Pages younger than max_age are not requested at all.
+            builder.max_age = 60
+            builder.currency_info(server.api_url)
+            self.assertEqual(server.request_count, 2)
+        finally:
+            server.stop()
+
 
 # Run all tests when the file is run from terminal.
 if __name__ == '__main__':
@@ -1,69 +1,55 @@
 # -*- coding: UTF-8 -*-
-import urllib2
-
-from bs4 import BeautifulSoup
-
-from TextWriter import TextWriter
-
-
-# Get HTML page (https://en.wikipedia.org/wiki/Currency_symbol)
-soup = BeautifulSoup(open('wiki_list.htm'), 'lxml')
-# Find the table
-table = soup.find('table', class_='wikitable sortable')
-# Get rows
-rows = table.find_all('tr')
-
-# Save all links
-links = {}
-
-for row in rows[1:]:
-    # Get symbol - link or no link?
-    s_link = row.find_all('td')[0].find('a')
-    if s_link:
-        symbol = s_link.text.strip()
-    else:
-        symbol = row.find_all('td')[0].find(text=True, recursive=False).strip()
-    # Get link
-    url = row.find_all('td')[1].find('a').get('href')
-    url = 'https://en.wikipedia.org'+url
-    # Save symbol and link
-    links[symbol] = url
-
-# Visit all links and get currency code of the symbol
-c_symbols = {}
-
-#links = {'£': 'https://en.wikipedia.org/wiki/Pound_sterling'}
-
-for symbol, url in links.items():
-    print symbol, url
-    #soup = BeautifulSoup(open('currency_page.htm'), 'lxml')
-    # Get Wiki page
-    page = urllib2.urlopen(url).read()
-    soup = BeautifulSoup(page, 'lxml')
-    # Find infobox
-    table = soup.find('table', class_='infobox')
-    # Check if the table was found - if not, it's a past currency.
-    if not table:
-        continue
-    # Find ISO code
-    iso_cell = table.find('a', title='ISO 4217')
-    # Check if the code was found - if not, it's not a regular currency.
-    if not iso_cell:
-        continue
-    cur_code = iso_cell.parent.parent.contents[3].text.strip()
-    cur_name = soup.select('#firstHeading')[0].text.strip()
-    # Save the code
-    c_symbols[symbol] = [cur_code, cur_name]
-
-# Create list from c_symbols
-c_list = []
-for symbol, (code, name) in c_symbols.items():
-    c_list.append([code, symbol, name])
-
-# Prepare header
-header = ['currency code', 'currency symbol', 'currency name']
-c_list.insert(0, header)
-
-# Write list to file
-tw = TextWriter()
-tw.write_file(c_list, 'currency_symbols_raw', ';')
+"""
+Create currency_symbols_raw.csv (currency code;currency symbol;currency name) from the list of currency symbols
+(https://en.wikipedia.org/wiki/Currency_symbol saved as wiki_list.htm) and Wikipedia pages of the currencies.
+
+example: ./parse_wiki.py
+         ./parse_wiki.py --offline --fixture https://en.wikipedia.org/wiki/British_pound=currency_page.htm
+"""
+import argparse
+import os
+import sys
+
+# Directory with src package.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+from src.SymbolsBuilder import SymbolsBuilder
+from src.TextWriter import TextWriter
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build table of currency symbols from Wikipedia')
+    parser.add_argument('--list_page', action='store', default='wiki_list.htm',
+                        help='Saved list of currency symbols (default wiki_list.htm)')
+    parser.add_argument('--cache_dir', action='store', default='.wiki_cache',
+                        help='Directory of downloaded pages (default .wiki_cache)')
+    parser.add_argument('--workers', action='store', type=int, default=8,
+                        help='Number of pages downloaded at once (default 8)')
+    parser.add_argument('--max_age', action='store', type=float,
+                        help='Do not request pages downloaded less than this number of seconds ago.')
+    parser.add_argument('--offline', action='store_true', help='Use only cached pages and fixtures.')
+    parser.add_argument('--fixture', action='append', default=[], metavar='<URL>=<path>',
+                        help='Saved page used instead of the URL (can be repeated).')
+    parser.add_argument('--output', action='store', default='currency_symbols_raw',
+                        help='Path to the output CSV file without extension (default currency_symbols_raw)')
+    args = parser.parse_args()
+
+    fixtures = dict(fixture.split('=', 1) for fixture in args.fixture)
+    builder = SymbolsBuilder(args.cache_dir, workers=args.workers, max_age=args.max_age, offline=args.offline,
+                             fixtures=fixtures)
+    with open(args.list_page) as list_file:
+        c_list = builder.build(list_file.read())
+    sys.stderr.write(' '.join('%s=%d' % item for item in sorted(builder.stats.items())) + '\n')
+
+    # Prepare header
+    header = ['currency code', 'currency symbol', 'currency name']
+    c_list.insert(0, header)
+
+    # Write list to file
+    output_dir, file_name = os.path.split(args.output)
+    tw = TextWriter(output_dir or '.')
+    tw.write_file(c_list, file_name, ';')
+
+
+if __name__ == '__main__':
+    main()
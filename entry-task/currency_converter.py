@@ -4,25 +4,37 @@ import os
 import sys
 
 from src.CurrencyConverter import CurrencyConverter
+from src.ConversionResult import dumps
 
 # Get directory of the file.
 current_dir = os.path.dirname(os.path.realpath(__file__))
 
-# Get API key from config file.
-with open(os.path.abspath(current_dir+'/config.txt')) as config_file:
-    app_id = config_file.read().strip()
-
 # Set filepaths
+config_filepath = os.path.abspath(current_dir+'/config.txt')
 rates_filepath = os.path.abspath(current_dir+'/rates_files/latest.json')
 symbols_filepath = os.path.abspath(current_dir+'/cur_symbols/currency_symbols.txt')
 
-# Create the main object.
-converter = CurrencyConverter(app_id, 'api', symbols_filepath, rates_filepath)
+# The main object - created on first use (so --help and import of the module are fast).
+converter = None
+
+
+def get_converter(metrics=None):
+    global converter
+    if converter is None:
+        # Get API key from config file.
+        with open(config_filepath) as config_file:
+            app_id = config_file.read().strip()
+        converter = CurrencyConverter(app_id, 'api', symbols_filepath, rates_filepath, metrics=metrics)
+    return converter
 
 
 # If the file was imported (as module).
-def convert_money(amount, input_cur, output_cur=None):
-    return converter.convert(amount, input_cur, output_cur)
+def convert_money(amount, input_cur, output_cur=None, result_format='json'):
+    return get_converter().convert(amount, input_cur, output_cur, result_format=result_format)
+
+
+def convert_money_many(items, backend='python'):
+    return get_converter().convert_many(items, backend)
 
 # If the file was run directly (as script).
 if __name__ == '__main__':
@@ -37,19 +49,90 @@ if __name__ == '__main__':
     # example 2: ./currency_converter.py --amount 0.9 --input_currency ¥ --output_currency AUD
     parser = argparse.ArgumentParser(description='Currency Converter in Python')
     parser.add_argument('--amount', action='store', help='Amount of money to convert',
-                        metavar='<float>', required=True)
+                        metavar='<float>')
     parser.add_argument('--input_currency', action='store', help='From currency',
-                        metavar='<3 letter currency code or currency symbol>', required=True)
+                        metavar='<3 letter currency code or currency symbol>')
     parser.add_argument('--output_currency', action='store',
-                        help='To currency | If missing, to all currencies.',
+                        help='To currency | Several currencies separated by commas | If missing, to all currencies.',
                         metavar='<3 letter currency code or currency symbol>')
+    # Server mode
+    # example: ./currency_converter.py --serve --port 8080
+    parser.add_argument('--serve', action='store_true',
+                        help='Run HTTP conversion server instead of one conversion.')
+    parser.add_argument('--host', action='store', default='127.0.0.1', help='Server address (default 127.0.0.1)')
+    parser.add_argument('--port', action='store', type=int, default=8080, help='Server port (default 8080)')
+    parser.add_argument('--socket', action='store', metavar='<path>',
+                        help='Listen on Unix socket instead of host and port.')
+    parser.add_argument('--workers', action='store', type=int, default=8,
+                        help='Number of server threads (default 8)')
+    # Stream mode
+    # example: ./currency_converter.py --stream transactions.csv --output converted.csv
+    parser.add_argument('--stream', action='store', metavar='<path>',
+                        help='Convert all records from CSV/JSON Lines file ("-" = stdin).')
+    parser.add_argument('--format', action='store', choices=['csv', 'jsonl'],
+                        help='Format of the stream (default is given by file extension, otherwise csv).')
+    parser.add_argument('--output', action='store', metavar='<path>', help='Output file of the stream (default stdout).')
+    parser.add_argument('--chunk_size', action='store', type=int, default=10000,
+                        help='Number of records converted at once (default 10000).')
+    # Metrics
+    parser.add_argument('--metrics', action='store_true',
+                        help='Record metrics - server exports them on /metrics, otherwise they are printed '
+                             'to stderr in Prometheus text format.')
     args = parser.parse_args()
 
+    if args.metrics:
+        from src.Metrics import Metrics
+        get_converter(Metrics())
+
+    # Run the server.
+    if args.serve:
+        from src.ConversionServer import make_server
+        try:
+            server = make_server(get_converter(), args.host, args.port, args.socket, args.workers, verbose=True)
+        except Exception, e:
+            raise SystemExit(e)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            server.server_close()
+        raise SystemExit(0)
+
+    # Convert the stream.
+    if args.stream:
+        from src.StreamConverter import convert_stream
+        file_format = args.format or ('jsonl' if args.stream.endswith(('.jsonl', '.json')) else 'csv')
+        in_stream = sys.stdin if args.stream == '-' else open(args.stream, 'rb')
+        out_stream = open(args.output, 'wb') if args.output else sys.stdout
+        try:
+            stats = convert_stream(get_converter(), in_stream, out_stream, file_format, args.chunk_size)
+        except Exception, e:
+            raise SystemExit(e)
+        finally:
+            if in_stream is not sys.stdin:
+                in_stream.close()
+            if out_stream is not sys.stdout:
+                out_stream.close()
+        sys.stderr.write('Converted %d rows in %.2f s (%.0f rows/sec).\n'
+                         % (stats['rows'], stats['seconds'], stats['rows_per_sec']))
+        if args.metrics:
+            sys.stderr.write(get_converter().metrics.to_prometheus())
+        raise SystemExit(0)
+
+    # Amount and input currency are required for conversion.
+    if args.amount is None or args.input_currency is None:
+        parser.error('arguments --amount and --input_currency are required')
+
     # Calculate the result.
+    output_cur = args.output_currency
+    if output_cur and ',' in output_cur:
+        output_cur = output_cur.split(',')
     try:
-        result = converter.convert(args.amount, args.input_currency, args.output_currency, terminal_encoding)
+        result = get_converter().convert(args.amount, args.input_currency, output_cur, terminal_encoding,
+                                   result_format='object')
     except Exception, e:
         raise SystemExit(e)
 
     # Show JSON string
-    print(result)
+    print(dumps(result.to_dict()))
+    if args.metrics:
+        sys.stderr.write(get_converter().metrics.to_prometheus())
@@ -0,0 +1,74 @@
+# -*- coding: UTF-8 -*-
+import threading
+import urllib2
+
+from CurrencyConverter import CurrencyConverter
+from HttpClient import KeepAliveClient
+from WorkerPool import WorkerPool
+
+
+class AsyncCurrencyConverter(CurrencyConverter):
+    """
+    CurrencyConverter with non-blocking conversion (convert_async() returns a Future immediately).
+    Rates are downloaded through a pool of keep-alive connections with a timeout. All calls waiting for
+    expired rates share one download and if it fails, the last known rates are used.
+    """
+
+    def __init__(self, app_id, rates_read_mode, symbols_filepath, rates_filepath=False, fetch_timeout=5.0,
+                 workers=4, **kwargs):
+        """
+        Args:
+            app_id, rates_read_mode, symbols_filepath, rates_filepath: See CurrencyConverter.
+            fetch_timeout (int | float): Maximum number of seconds to wait for the API.
+            workers (int): Number of threads running conversions (and connections to the API).
+            kwargs: Other arguments of CurrencyConverter (rates_ttl, api_url, ...).
+
+        Raises:
+            See CurrencyConverter.
+        """
+        CurrencyConverter.__init__(self, app_id, rates_read_mode, symbols_filepath, rates_filepath, **kwargs)
+        self.http_client = KeepAliveClient(self.rates_url, timeout=fetch_timeout, pool_size=workers)
+        self.workers = WorkerPool(workers)
+        # Number of times the last known rates were used because new rates could not be get.
+        self.fallback_count = 0
+        self._fallback_lock = threading.Lock()
+
+    def convert_async(self, *args, **kwargs):
+        """
+        Start conversion in the background - see CurrencyConverter.convert() for arguments and result.
+
+        Returns:
+            Future object - result() returns the result of conversion or raises its exception.
+        """
+        return self.workers.submit(self.convert, *args, **kwargs)
+
+    def close(self):
+        """Stop the worker threads, close connections to the API and release the shared objects."""
+        CurrencyConverter.close(self)
+        self.workers.shutdown()
+        self.http_client.close()
+        if self.rates_provider is not None:
+            self.rates_provider.close()
+
+    def _get_cached_rates(self):
+        """
+        Get current exchange rates. If new rates can't be get, use the last known rates (if there are any).
+        """
+        try:
+            return CurrencyConverter._get_cached_rates(self)
+        except (urllib2.URLError, IOError, ValueError):
+            rates_data = self.rates_cache.peek()
+            if rates_data is None:
+                raise
+            # Conversions fall back in many worker threads at once.
+            with self._fallback_lock:
+                self.fallback_count += 1
+            return rates_data
+
+    def _request_rates(self, conditional=False):
+        """Download the latest rates from API through a keep-alive connection (or from the rates provider)."""
+        if self.rates_provider is not None:
+            return self.rates_provider.fetch(conditional)
+        rates_json, self._api_validators = self.http_client.get_if_modified(
+            self._api_validators if conditional else {})
+        return rates_json
@@ -0,0 +1,92 @@
+# -*- coding: UTF-8 -*-
+import json
+from itertools import izip
+
+
+class ConversionResult(object):
+    """
+    Result of CurrencyConverter.convert() - input amount and currency and amounts in output currencies.
+    """
+    __slots__ = ('amount', 'currency', 'output')
+
+    def __init__(self, amount, currency, output):
+        """
+        Args:
+            amount (float | decimal.Decimal): Input amount (Decimal in exact mode).
+            currency (string): Input currency code.
+            output (dict): Output currency code -> output amount (float or Decimal).
+        """
+        self.amount = amount
+        self.currency = currency
+        self.output = output
+
+    def __repr__(self):
+        return 'ConversionResult(%r, %r, %r)' % (self.amount, self.currency, self.output)
+
+    def copy(self):
+        """
+        Returns:
+            ConversionResult with a copy of the output dictionary.
+        """
+        return ConversionResult(self.amount, self.currency, dict(self.output))
+
+    def to_dict(self):
+        """
+        Returns:
+            Dictionary in the format of JSON returned by CurrencyConverter.convert().
+        """
+        return {
+            'input': {
+                'amount': self.amount,
+                'currency': self.currency,
+            },
+            'output': self.output,
+        }
+
+    def to_json(self):
+        """
+        Returns:
+            JSON string (see CurrencyConverter.convert()).
+        """
+        return dumps(self.to_dict())
+
+
+def json_default(value):
+    """
+    Serialize values which are not supported by JSON serializers: Decimal amounts (exact mode) are serialized
+    as strings, so they are not rounded by conversion to float.
+    """
+    if type(value).__name__ == 'Decimal':
+        return str(value)
+    raise TypeError(repr(value) + ' is not JSON serializable')
+
+
+def dumps(obj):
+    """
+    Serialize object to JSON string (Decimal amounts as strings, see json_default()).
+
+    Args:
+        obj: Object to serialize.
+
+    Returns:
+        JSON string.
+    """
+    return json.dumps(obj, default=json_default)
+
+
+def encode_json(amount, currency, keys, values):
+    """
+    Serialize result of conversion to JSON string (the same as json.dumps(result.to_dict()), but without
+    the dictionaries) - float amounts are written by repr() as json module does.
+
+    Args:
+        amount (float): Input amount (finite).
+        currency (string): Input currency code.
+        keys (sequence): JSON keys of output currencies in the format '"CZK": ' (see RatesTable.json_keys).
+        values (sequence): Output amounts (floats) in order of keys.
+
+    Returns:
+        JSON string.
+    """
+    return '{"input": {"currency": "%s", "amount": %r}, "output": {%s}}' % (
+        currency, amount, ', '.join(map(''.join, izip(keys, map(repr, values)))))
@@ -0,0 +1,225 @@
+# -*- coding: UTF-8 -*-
+import json
+import os
+import urlparse
+import BaseHTTPServer
+import SocketServer
+
+from ConversionResult import dumps
+from WorkerPool import WorkerPool
+
+# Paths of the server (other paths are counted together in metrics).
+KNOWN_PATHS = frozenset(['/convert', '/convert_many', '/health', '/metrics'])
+
+
+class RequestTooLarge(ValueError):
+    """Request body is larger than the limit of the server (status 413)."""
+
+
+class ConversionRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """
+    HTTP interface of CurrencyConverter (with keep-alive connections):
+        GET /convert?amount=10&input_currency=EUR&output_currency=CZK ... the same JSON as the script returns
+            (output_currency can be repeated to get several currencies, it's missing for all currencies)
+        POST /convert_many with JSON body [[10, "EUR", "CZK"], [5, "$", "€"]] ... arrays of results
+        GET /health ... "OK" if rates are available
+        GET /metrics ... metrics in Prometheus text format (if the converter has metrics)
+    Errors are returned as JSON {"error": "<message>"} with status 400 (invalid input), 413 (too large body)
+    or 503 (no rates).
+    """
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        # Idle keep-alive connections occupy a worker - they are closed after a short time (see make_server()).
+        self.timeout = self.server.idle_timeout
+        BaseHTTPServer.BaseHTTPRequestHandler.setup(self)
+
+    def do_GET(self):
+        url = urlparse.urlsplit(self.path)
+        if url.path == '/convert':
+            params = urlparse.parse_qs(url.query)
+            output_cur = params.get('output_currency', [None])
+            self._handle(lambda: self.server.converter.convert(
+                params.get('amount', [''])[0],
+                params.get('input_currency', [''])[0],
+                output_cur[0] if len(output_cur) == 1 else output_cur,
+                result_format='object',
+            ).to_dict())
+        elif url.path == '/health':
+            self._handle(self._health)
+        elif url.path == '/metrics' and self.server.converter.metrics is not None:
+            self._send(200, self.server.converter.metrics.to_prometheus(), 'text/plain; version=0.0.4')
+        else:
+            self._send(404, {'error': 'Unknown path: ' + url.path})
+
+    def do_POST(self):
+        url = urlparse.urlsplit(self.path)
+        if url.path == '/convert_many':
+            self._handle(lambda: self._convert_many(self._read_body()))
+        else:
+            self._send(404, {'error': 'Unknown path: ' + url.path})
+
+    def _read_body(self):
+        """
+        Returns:
+            Body of the request.
+
+        Raises:
+            ValueError: Invalid Content-Length header.
+            RequestTooLarge: Content-Length is larger than max_body_size of the server.
+        """
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            if length < 0:
+                raise ValueError(length)
+        except ValueError:
+            # The body can't be skipped, so the connection can't be used for the next request.
+            self.close_connection = 1
+            raise ValueError('Invalid Content-Length header: ' + self.headers.get('Content-Length'))
+        if length > self.server.max_body_size:
+            self.close_connection = 1
+            raise RequestTooLarge('Request body is larger than %d bytes.' % self.server.max_body_size)
+        return self.rfile.read(length)
+
+    def _health(self):
+        self.server.converter.warm_up()
+        return 'OK'
+
+    def _convert_many(self, body):
+        msg = 'Request body must be JSON list of [amount, input currency, output currency].'
+        try:
+            items = json.loads(body)
+            if not isinstance(items, list) or not all(isinstance(item, list) and len(item) == 3 for item in items):
+                raise ValueError(msg)
+        except ValueError:
+            raise ValueError(msg)
+        for item_n, (amount, input_cur, output_cur) in enumerate(items):
+            # Amount is a number or a string (bool is an int), currencies are strings.
+            if isinstance(amount, bool) or not isinstance(amount, (int, long, float, unicode)) or \
+                    not isinstance(input_cur, unicode) or not isinstance(output_cur, unicode):
+                raise ValueError('%s (item %d)' % (msg, item_n))
+            if isinstance(amount, unicode):
+                amount = amount.encode('utf-8')
+            items[item_n] = (amount, input_cur.encode('utf-8'), output_cur.encode('utf-8'))
+        result = self.server.converter.convert_many(items)
+        for key in ['input_amounts', 'output_amounts']:
+            result[key] = list(result[key])
+        return result
+
+    def _handle(self, function):
+        """Call the function and send its result (or error) to the client."""
+        try:
+            self._send(200, function())
+        except RequestTooLarge, e:
+            self._send(413, {'error': e.args[0]})
+        except (ValueError, TypeError, KeyError), e:
+            # TypeError and KeyError can come only from input which was not validated.
+            self._send(400, {'error': self._error_message(e)})
+        except IOError, e:
+            self._send(503, {'error': self._error_message(e)})
+
+    @staticmethod
+    def _error_message(error):
+        """
+        Returns:
+            Message of the exception as unicode (it can contain invalid UTF-8 entered by the client).
+        """
+        message = error.args[0] if isinstance(error, ValueError) and error.args else str(error)
+        if not isinstance(message, unicode):
+            message = str(message).decode('utf-8', 'replace')
+        return message
+
+    def _send(self, status, data, content_type=None):
+        """Send data as JSON (or as it is, if content type is set)."""
+        body = dumps(data) if content_type is None else data
+        metrics = self.server.converter.metrics
+        if metrics is not None:
+            path = urlparse.urlsplit(self.path).path
+            metrics.inc('http_requests_total', path=path if path in KNOWN_PATHS else 'other', status=status)
+        self.send_response(status)
+        self.send_header('Content-Type', content_type or 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        if self.close_connection:
+            self.send_header('Connection', 'close')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def address_string(self):
+        # Clients of Unix socket have no address.
+        return self.client_address[0] if self.client_address else 'unix'
+
+    def log_message(self, *args):
+        if self.server.verbose:
+            BaseHTTPServer.BaseHTTPRequestHandler.log_message(self, *args)
+
+
+class PooledServerMixIn:
+    """
+    Handle connections in a fixed pool of worker threads (instead of a new thread for every connection).
+    """
+
+    def process_request(self, request, client_address):
+        self.worker_pool.submit(self._process_request, request, client_address)
+
+    def _process_request(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+
+class ConversionHTTPServer(PooledServerMixIn, BaseHTTPServer.HTTPServer):
+    allow_reuse_address = True
+
+    def server_close(self):
+        BaseHTTPServer.HTTPServer.server_close(self)
+        self.worker_pool.shutdown(wait=False)
+
+
+class ConversionUnixServer(PooledServerMixIn, SocketServer.UnixStreamServer):
+
+    def server_close(self):
+        SocketServer.UnixStreamServer.server_close(self)
+        self.worker_pool.shutdown(wait=False)
+
+
+def make_server(converter, host='127.0.0.1', port=8080, unix_socket=None, workers=8, verbose=False,
+                idle_timeout=2.0, max_body_size=1048576):
+    """
+    Create a conversion server (call its serve_forever() method to run it).
+    The converter's rates are loaded immediately and then refreshed in the background.
+
+    Args:
+        converter (CurrencyConverter): Converter shared by all requests.
+        host (string): Address to listen on.
+        port (int): Port to listen on (0 = any free port).
+        unix_socket (string | None): Path to Unix socket to listen on (instead of host and port).
+        workers (int): Number of threads handling connections.
+        verbose (bool): Log every request to stderr.
+        idle_timeout (int | float): Number of seconds a keep-alive connection can wait for the next request
+            (a waiting connection occupies a worker, so idle clients could block the others).
+        max_body_size (int): Maximum size of request body in bytes (larger requests get status 413).
+
+    Returns:
+        Server object.
+
+    Raises:
+        Exceptions of CurrencyConverter if the rates could not be loaded.
+    """
+    # Warm up the rates before accepting the first request.
+    converter.warm_up()
+    converter.start_refresher()
+    if unix_socket:
+        if os.path.exists(unix_socket):
+            os.remove(unix_socket)
+        server = ConversionUnixServer(unix_socket, ConversionRequestHandler)
+    else:
+        server = ConversionHTTPServer((host, port), ConversionRequestHandler)
+    server.converter = converter
+    server.verbose = verbose
+    server.idle_timeout = idle_timeout
+    server.max_body_size = max_body_size
+    server.worker_pool = WorkerPool(workers)
+    return server
@@ -1,8 +1,24 @@
 # -*- coding: UTF-8 -*-
 import json
-import urllib2
 import time
 import os.path
+import marshal
+import threading
+from array import array
+from collections import OrderedDict
+from itertools import izip, repeat
+
+from RatesCache import RatesCache
+from RatesTable import RatesTable
+from ConversionResult import ConversionResult, encode_json, json_default
+from FixedPoint import ROUND_HALF_UP, check_rounding, divide, parse_amount, to_decimal
+from RatesRefresher import RatesRefresher
+from SharedRegistry import SharedRates, freeze_symbols, registry
+from CurrencyResolver import CurrencyResolver
+from LRUCache import LRUCache
+from MoneyFormatter import MoneyFormatter
+from MoneyParser import MoneyParser
+from SnapshotStore import FileLock, MappedSnapshot, atomic_write, write_snapshot
 
 # Workaround for Windows terminal encoding
 import codecs
@@ -13,23 +29,57 @@ class CurrencyConverter(object):
     """
     Main class for currency conversion (via convert() method).
     Supports reading rates from API or file and working with symbols.
+
+    One object can be shared by many threads (i.e. workers of a multi-threaded WSGI server):
+    * Rates are kept in immutable snapshots (rates dictionary, RatesTable, CurrencyResolver) which are never
+      modified after they are created - new rates create new snapshots, which replace the old ones by a single
+      attribute assignment. Conversions only read the current snapshots (a conversion which started with the old
+      rates finishes with them). While the rates are fresh, they take a lock only to save a new result
+      to the result cache (reading from it, resolving of codes and symbols found in the index are lock-free)
+      and to remember a resolved value which had to be normalized.
+    * New rates are loaded by one thread at a time (RatesCache) and the Rates file is written by one thread/process
+      at a time (FileLock) - it's replaced atomically, so readers never see a partially written file.
+    * Statistics counters are not locked, they can miss some increments under heavy concurrency.
     """
 
-    def __init__(self, app_id, rates_read_mode, symbols_filepath, rates_filepath=False):
+    def __init__(self, app_id, rates_read_mode, symbols_filepath, rates_filepath=False, rates_ttl=60,
+                 api_url='https://openexchangerates.org/api/latest.json', history_dirpath=None,
+                 rounding=ROUND_HALF_UP, rates_provider=None, metrics=None, result_cache_size=0, shared=False,
+                 symbols_cache_dir=None):
         """
         Args:
             app_id (string): API key for openexchangerates.org.
             rates_read_mode (string): "api", "file", "file_no_update".
             symbols_filepath (string): Absolute path to the Currency symbols file.
             rates_filepath (string): Absolute path to the Rates file.
+            rates_ttl (int | float): Number of seconds the rates are kept in memory (0 = get rates on every call).
+            api_url (string): URL of the rates API (without app_id parameter).
+            history_dirpath (string | None): Directory of historical rates store (see HistoricalRatesStore).
+                If set, all loaded rates are saved to it and convert() can use rates from the past.
+            rounding (string): Default rounding mode of exact conversion - constant of the decimal module
+                (i.e. decimal.ROUND_HALF_EVEN), see convert().
+            rates_provider (RatesProvider | None): Source of new rates used instead of api_url
+                (i.e. FailoverRatesProvider with several providers, see RatesProviders).
+            metrics (Metrics | None): Metrics object which records durations of conversion stages, getting rates,
+                API requests, fallbacks to the Rates file and bytes read (no overhead if it's not set).
+            result_cache_size (int): Maximum number of remembered results of convert() (0 = results are not
+                remembered). Repeated conversions with the same rates return the remembered result.
+            shared (bool): Share the rates with other converters with the same source of rates (Rates file path,
+                API URL or rates_provider object), rates_read_mode, rates_ttl and history_dirpath - they are loaded,
+                refreshed and stored in memory (cross rates table) only once for all of them, see SharedRegistry.
+                The rates are loaded by the first of them (i.e. with its app_id). Call close() when the converter
+                is not needed.
+            symbols_cache_dir (string | None): Directory where currency symbols read from the symbols file are
+                cached (created if it does not exist), so other processes don't parse the file again - the cache
+                is used until the file changes. Symbols are not cached if it's None.
 
         Raises:
-            ValueError: Invalid rates_read_mode value.
+            ValueError: Invalid rates_read_mode value. | Invalid rounding mode.
             IOError: Rates file does not exist. | Currency symbols file does not exist.
             IndexError: Currency symbols file could not be properly parsed.
         """
         # Set the correct API URL
-        self.rates_url = 'https://openexchangerates.org/api/latest.json?app_id='+app_id
+        self.rates_url = api_url + '?app_id=' + app_id
 
         # PARAMETERS CHECK
         # Check rates_read_mode validity.
@@ -46,19 +96,148 @@ class CurrencyConverter(object):
         # If rates file is missing, rates_read_mode must be set to "api".
         if not rates_filepath and rates_read_mode != 'api':
             raise ValueError("If rates file is missing, rates_read_mode must be set to 'api'.", 2)
+        check_rounding(rounding)
 
         # Set variables.
         self.rates_filepath = rates_filepath
         self.rates_read_mode = rates_read_mode
-        # Get currency symbols.
-        try:
-            self.currency_symbols = self._read_currency_symbols(symbols_filepath)
-        except IndexError:
-            msg = 'Currency symbols file has an invalid format. ' \
-                  'It should be: header \\n <cur code>\\t<cur symbol> \\n...'
-            raise IndexError(msg)
+        self.rounding = rounding
+        self.rates_provider = rates_provider
+        # ETag and Last-Modified of the last API response (for conditional requests).
+        self._api_validators = {}
+        self.metrics = metrics
+        # Results of recent conversions (cleared when new rates are loaded).
+        self.result_cache = LRUCache(result_cache_size) if result_cache_size else None
+        if metrics is not None:
+            metrics.add_collector(self._collect_metrics)
+        # Binary copy of the Rates file (shared by processes through mmap) and lock for updating the file.
+        if rates_filepath:
+            self.snapshot_filepath = rates_filepath + '.bin'
+            self.rates_file_lock = FileLock(rates_filepath + '.lock')
+        # Cache of the rates, so convert() does not read them on every call.
+        # In file modes, the cache is invalidated when the Rates file is modified.
+        self.rates_cache = RatesCache(
+            lambda: self._get_rates(self.rates_read_mode),
+            ttl=rates_ttl,
+            watch_filepath=rates_filepath if rates_read_mode != 'api' else None,
+            max_age=3600 if rates_read_mode == 'file' else None,
+        )
+        # Background refresher of the cached rates (see start_refresher()).
+        self.refresher = None
+        # Cross rates table built from the cached rates (rebuilt when rates with a new timestamp arrive).
+        self._rates_table = None
+        # Lock for building of new tables (readers don't use it).
+        self._table_lock = threading.Lock()
+        # Store of all loaded rates and cross rates tables of recently used past rates (timestamp -> table).
+        self.history = None
+        if history_dirpath:
+            from HistoricalRatesStore import HistoricalRatesStore
+            self.history = HistoricalRatesStore(history_dirpath)
+        self._history_tables = OrderedDict()
+        # Keys of objects acquired from the SharedRegistry (released by close()).
+        self._shared_keys = []
+        # Rates shared with other converters (None if they are not shared).
+        self._shared_rates = None
+        if shared:
+            self._shared_rates = self._acquire_shared(
+                self._rates_source_key(rates_ttl, api_url, history_dirpath), lambda: SharedRates(self.rates_cache))
+            self.rates_cache = self._shared_rates.rates_cache
+            self._table_lock = self._shared_rates.table_lock
+        # Currency symbols and index of currency codes and symbols - created on first use.
+        self.symbols_filepath = symbols_filepath
+        self.symbols_cache_dir = symbols_cache_dir
+        self._currency_symbols = None
+        self._symbols_key = None
+        self._resolver = None
+        # Registry key of the resolver and codes of the table it was acquired for.
+        self._resolver_key = None
+        self._resolver_codes = None
+        # Locale -> MoneyFormatter with templates of the currencies of the current rates.
+        self._formatters = {}
+
+    @property
+    def currency_symbols(self):
+        """
+        Dictionary currency symbol -> currency code (see _read_currency_symbols()), read on first use.
+        The dictionary is immutable and shared by all converters using the same version of the file.
 
-    def convert(self, in_amount, input_cur, output_cur=None, terminal_encoding=None):
+        Raises:
+            IndexError: Currency symbols file could not be properly parsed.
+        """
+        if self._currency_symbols is None:
+            try:
+                self._currency_symbols = self._acquire_symbols(self.symbols_filepath)
+            except IndexError:
+                msg = 'Currency symbols file has an invalid format. ' \
+                      'It should be: header \\n <cur code>\\t<cur symbol> \\n...'
+                raise IndexError(msg)
+        return self._currency_symbols
+
+    @property
+    def resolver(self):
+        """
+        CurrencyResolver with currency symbols and codes of the current rates, created on first use
+        (and again when the rates have different currency codes). Converters with the same symbols and codes
+        share one resolver.
+        """
+        resolver = self._resolver
+        table = self._rates_table
+        # Tables with the same codes share one codes tuple.
+        if resolver is None or (table is not None and self._resolver_codes is not table.codes):
+            symbols = self.currency_symbols
+            codes = table.codes if table is not None else ()
+            with self._table_lock:
+                if self._resolver_codes is not codes or self._resolver is None:
+                    key = ('resolver', self._symbols_key, codes)
+                    resolver = self._acquire_shared(key, lambda: CurrencyResolver(symbols, codes))
+                    if self._resolver_key is not None:
+                        self._shared_keys.remove(self._resolver_key)
+                        registry.release(self._resolver_key)
+                    self._resolver_key = key
+                    self._resolver_codes = codes
+                    self._resolver = resolver
+                resolver = self._resolver
+        return resolver
+
+    def formatter(self, locale='en'):
+        """
+        MoneyFormatter of the locale with templates of all currencies of the current rates, created on first use
+        (and again when the rates have different currency codes).
+
+        Raises:
+            ValueError: Unknown locale. | See convert().
+        """
+        table = self._get_rates_table()
+        formatter = self._formatters.get(locale)
+        if formatter is None or formatter.codes is not table.codes:
+            formatter = MoneyFormatter(self.currency_symbols, table.codes, locale)
+            self._formatters[locale] = formatter
+        return formatter
+
+    def convert_formatted(self, in_amount, input_cur, output_cur=None, locale='en', **kwargs):
+        """
+        Convert the amount and format the amounts for display (i.e. "2 707,36 Kč" in "cs", "¥1,234" in "en").
+
+        Args:
+            in_amount (string | float | int): Amount of money to convert.
+            input_cur (string): From currency (3 letter currency code or currency symbol).
+            output_cur (string | list | None): To currency - see convert().
+            locale (string): Locale of the separators and position of the symbol (see MoneyFormatter.LOCALES).
+            kwargs: Other parameters of convert() (except result_format).
+
+        Returns:
+            Dictionary with the same structure as result of convert() with result_format "dict",
+            amounts are formatted strings (UTF-8).
+
+        Raises:
+            ValueError: Unknown locale. | See convert().
+        """
+        formatter = self.formatter(locale)
+        return formatter.format_result(self.convert(in_amount, input_cur, output_cur, result_format='object',
+                                                    **kwargs))
+
+    def convert(self, in_amount, input_cur, output_cur=None, terminal_encoding=None, result_format='json',
+                at=None, exact=False, rounding=None):
         """
         Convert given amount of money in input currency to actual amount of money in output currency.
         If output currency parameter is missing, convert the amount to all known currencies.
@@ -66,11 +245,20 @@ class CurrencyConverter(object):
         Args:
             in_amount (string | float | int): Amount of money to convert.
             input_cur (string): From currency (3 letter currency code or currency symbol).
-            output_cur (string | None): To currency (3 letter currency code or currency symbol).
+            output_cur (string | list | None): To currency (3 letter currency code or currency symbol) or list of them.
             terminal_encoding (string | None): Encoding of the input_cur and output_cur parameters (default is UTF-8).
+            result_format (string): "json" (JSON string), "dict" (dictionary with the same structure as JSON)
+                or "object" (ConversionResult object - the fastest, no serialization is done).
+            at (datetime.datetime | datetime.date | int | float | None): Convert with the last rates known at
+                this time (UNIX timestamp or datetime in UTC) - historical rates store must be set.
+            exact (bool): Exact conversion - the amount is not converted to float (pass it as string or Decimal),
+                it's calculated with integers and rounded to minor units of the output currency (i.e. 0 decimal
+                places for JPY, 3 for KWD). Amounts in the result are Decimal objects (strings in JSON).
+            rounding (string | None): Rounding mode of exact conversion - constant of the decimal module
+                (default is given by constructor).
 
         Returns:
-            JSON string in the following format (example for EUR -> CZK conversion):
+            JSON string/dictionary/ConversionResult in the following format (example for EUR -> CZK conversion):
             {
                 "input": {
                     "amount": 100.0,
@@ -83,95 +271,718 @@ class CurrencyConverter(object):
 
         Raises:
             ValueError: Input amount is not a number. | Input amount cannot be less than zero.
-                Unknown currency code or symbol. | Invalid JSON response or file.
+                Unknown currency code or symbol. | Invalid JSON response or file. | Invalid result format.
+                No rates for the time. | Historical rates store is not set. | Invalid rounding mode.
             urllib2.HTTPError: Could not download data from the API.
             urllib2.URLError: No internet connection / invalid domain name in API URL.
             IOError: Could not read Rates file.
         """
-        # Firstly check if the input amount is a number (can be converted to float).
+        timer = self.metrics.timer('convert') if self.metrics is not None else None
+        # Check the result format and the input amount.
+        if result_format not in ['json', 'dict', 'object']:
+            msg = 'Result format has invalid value: ' + str(result_format) + \
+                  '. It must be "json", "dict" or "object".'
+            raise ValueError(msg, 9)
+        if exact:
+            rounding = self._check_rounding(rounding)
+            coefficient, places = self._check_exact_amount(in_amount)
+        else:
+            in_amount = self._check_amount(in_amount)
+        if timer is not None:
+            timer.stage('validate')
+
+        # Get current exchange rates (from cache if they are fresh) or rates from the past.
+        table = self._get_rates_table() if at is None else self._get_history_table(at)
+        if timer is not None:
+            timer.stage('rates')
+
+        # A) PROCESS currency codes/symbols
+        input_cur = self._resolve_currency(input_cur, table.ids, 'input', terminal_encoding)
+        # IDs of output currencies (None = all currencies).
+        out_ids = None
+        if isinstance(output_cur, (list, tuple)):
+            out_ids = []
+            for currency in output_cur:
+                out_id = table.ids[self._resolve_currency(currency, table.ids, 'output', terminal_encoding)]
+                if out_id not in out_ids:
+                    out_ids.append(out_id)
+            out_ids = tuple(out_ids)
+        elif output_cur:
+            out_ids = (table.ids[self._resolve_currency(output_cur, table.ids, 'output', terminal_encoding)],)
+        if timer is not None:
+            timer.stage('resolve')
+
+        # The same conversion with the same rates returns the remembered result (if the result cache is enabled).
+        cache_key = None
+        if self.result_cache is not None:
+            cache_key = (table.timestamp, (coefficient, places) if exact else in_amount, input_cur, out_ids,
+                         rounding if exact else None, result_format)
+            result = self.result_cache.get(cache_key)
+            if result is not None:
+                # Cached objects are not returned, so they can't be modified by the caller.
+                if result_format != 'json':
+                    result = result.copy()
+                    if result_format == 'dict':
+                        result = result.to_dict()
+                if timer is not None:
+                    timer.stage('cache')
+                    timer.finish()
+                return result
+
+        # B) CALCULATE AMOUNT
+        # Example for 10 EUR  -> CZK:
+        #   1. How many dollars do I need to buy 10 euros? 10 / 0.9 = 11.1111111111 ... B (1 USD = 0.90 EUR)
+        #   2. How many CZK do I get for B dollars? B * 24.26 = 269.55 (1 USD = 24.26 CZK)
+        # Both steps are precomputed in the table as a cross rate: 1 EUR = 24.26 / 0.9 CZK.
+
+        # Calculate amounts in the output currencies (in order of out_ids or of all codes of the table).
+        if exact:
+            # Exactly with integers: amount * (out_rate * 10 ** minor units) / in_rate
+            in_amount = to_decimal(coefficient, places)
+            denominator = table.scaled_rates[table.ids[input_cur]] * 10 ** places
+            if out_ids is None:
+                out_ids = xrange(table.size)
+            out_values = []
+            for out_id in out_ids:
+                units = table.minor_units[out_id]
+                numerator = coefficient * table.scaled_rates[out_id] * 10 ** units
+                out_values.append(to_decimal(divide(numerator, denominator, rounding), units))
+        elif out_ids is None:
+            # Row of the cross rates table is a contiguous array - one pass over it.
+            out_values = [round(in_amount * rate, 2) for rate in table.row(input_cur)]
+        else:
+            cross = table.cross
+            row = table.ids[input_cur] * table.size
+            out_values = [round(in_amount * cross[row + out_id], 2) for out_id in out_ids]
+        if timer is not None:
+            timer.stage('math')
+
+        # Create the final return object.
+        fast_json = result_format == 'json' and not exact
+        if fast_json:
+            # Amounts which overflow to inf (or nan) can't be written by %r - they are serialized by json module.
+            # Sum of the values is not finite if any of them is not finite (one pass in C).
+            total = sum(out_values)
+            fast_json = total - total == 0
+        if fast_json:
+            # JSON is written directly from the precomputed keys of the table (no dictionary is created).
+            if out_ids is None:
+                keys = table.json_keys
+            else:
+                keys = [table.json_keys[out_id] for out_id in out_ids]
+            result = encode_json(in_amount, input_cur, keys, out_values)
+        else:
+            codes = table.codes if out_ids is None else [table.codes[out_id] for out_id in out_ids]
+            result = ConversionResult(in_amount, input_cur, dict(izip(codes, out_values)))
+            if result_format == 'json':
+                # Convert dict to JSON string.
+                result = json.dumps(result.to_dict(), default=json_default)
+        if cache_key is not None:
+            self.result_cache.put(cache_key, result)
+            if result_format != 'json':
+                result = result.copy()
+        if result_format == 'dict':
+            result = result.to_dict()
+        if timer is not None:
+            timer.stage('serialize')
+            timer.finish()
+        return result
+
+    def convert_many(self, items, backend='python', exact=False, rounding=None, snapshot=None):
+        """
+        Convert many amounts of money at once (i.e. invoice line items).
+        Exchange rates are read only once for the whole batch and every (input, output) currency pair
+        is resolved only once.
+
+        Args:
+            items (iterable): Tuples (amount, input currency, output currency) - see convert() for allowed values.
+                Output currency must be set.
+            backend (string): "python" (arrays from the standard library) or "numpy" (NumPy arrays, NumPy
+                must be installed; values exactly in the middle are rounded to the nearest even number).
+            exact (bool): Exact conversion (see convert()) - "python" backend only. No Decimal objects are created,
+                output amounts are integers in minor units of the output currencies.
+            rounding (string | None): Rounding mode of exact conversion (see convert()).
+            snapshot (RatesTable | None): Rates returned by snapshot() - batches converted with the same snapshot
+                use the same rates, even if new rates were read meanwhile. Current rates are used if it's None.
+
+        Returns:
+            Dictionary with results at the same positions as the items (example for 10 EUR -> CZK, 5 USD -> EUR):
+            {
+                "timestamp": 1455274808,
+                "input_amounts": array('d', [10.0, 5.0]),
+                "input_currencies": ["EUR", "USD"],
+                "output_amounts": array('d', [270.26, 4.43]),
+                "output_currencies": ["CZK", "EUR"]
+            }
+            In exact mode, there are no "input_amounts" and "output_amounts" is replaced by:
+                "output_minor_amounts": [27026, 443],
+                "output_minor_units": [2, 2]
+            (output amount = minor amount / 10 ** minor units).
+
+        Raises:
+            ValueError: Unsupported backend. | Invalid rounding mode. | Input amount is not a number. | Input amount cannot be less
+                than zero. | Unknown currency code or symbol. | Output currency is missing.
+            ImportError: NumPy backend is selected, but NumPy is not installed.
+            urllib2.HTTPError, urllib2.URLError, IOError: Could not get exchange rates - see convert().
+        """
+        if backend not in ['python', 'numpy']:
+            raise ValueError('Unsupported backend: ' + str(backend) + '. It must be "python" or "numpy".')
+        if exact:
+            if backend != 'python':
+                raise ValueError('Exact conversion is supported only by "python" backend.')
+            rounding = self._check_rounding(rounding)
+        # Take one snapshot of the rates for the whole batch.
+        if snapshot is None:
+            snapshot = self._get_rates_table()
+        if exact:
+            return self._convert_many_exact(items, snapshot, rounding)
+        return self._convert_many(items, snapshot, backend)
+
+    def snapshot(self):
+        """
+        Get the current rates as an immutable snapshot - convert_many() with it uses these rates
+        (i.e. for all chunks of a stream), even if new rates are read meanwhile.
+
+        Returns:
+            RatesTable object.
+
+        Raises:
+            urllib2.HTTPError, urllib2.URLError, IOError: Could not get exchange rates - see convert().
+        """
+        return self._get_rates_table()
+
+    def _convert_many_exact(self, items, table, rounding):
+        """
+        Convert many amounts of money exactly with the given rates - see convert_many().
+
+        Args:
+            items (iterable): Tuples (amount, input currency, output currency).
+            table (RatesTable): Rates to use.
+            rounding (string): Rounding mode.
+
+        Returns:
+            Dictionary with results - see convert_many().
+
+        Raises:
+            ValueError: Invalid item (error message contains its position in items).
+        """
+        # Every distinct (input_cur, output_cur) pair as entered is resolved only once.
+        pairs = {}
+        in_codes = []
+        out_codes = []
+        out_amounts = []
+        out_units = []
+        # Powers of 10 for the numbers of decimal places of the amounts.
+        powers = [10 ** places for places in range(10)]
+        for item_n, (in_amount, input_cur, output_cur) in enumerate(items):
+            try:
+                coefficient, places = self._check_exact_amount(in_amount)
+                pair = pairs.get((input_cur, output_cur))
+                if pair is None:
+                    if not output_cur:
+                        raise ValueError("Output currency must be entered for every item of the batch.", 8)
+                    in_code = self._resolve_currency(input_cur, table.ids, 'input')
+                    out_code = self._resolve_currency(output_cur, table.ids, 'output')
+                    numerator, denominator = table.fixed_cross_rate(in_code, out_code)
+                    pair = (in_code, out_code, numerator, denominator, table.minor_units[table.ids[out_code]])
+                    pairs[(input_cur, output_cur)] = pair
+            except ValueError, e:
+                raise ValueError('%s (item %d)' % (e.args[0], item_n), *e.args[1:])
+            in_code, out_code, numerator, denominator, units = pair
+            power = powers[places] if places < 10 else 10 ** places
+            in_codes.append(in_code)
+            out_codes.append(out_code)
+            out_amounts.append(divide(coefficient * numerator, denominator * power, rounding))
+            out_units.append(units)
+
+        return {
+            'timestamp': table.timestamp,
+            'input_currencies': in_codes,
+            'output_minor_amounts': out_amounts,
+            'output_minor_units': out_units,
+            'output_currencies': out_codes,
+        }
+
+    def _convert_many(self, items, table, backend='python'):
+        """
+        Convert many amounts of money with the given rates - see convert_many().
+
+        Args:
+            items (iterable): Tuples (amount, input currency, output currency).
+            table (RatesTable): Cross rates to use.
+            backend (string): "python" or "numpy".
+
+        Returns:
+            Dictionary with results - see convert_many().
+
+        Raises:
+            ValueError: Invalid item (error message contains its position in items).
+            ImportError: NumPy backend is selected, but NumPy is not installed.
+        """
+        if backend == 'numpy':
+            import numpy
+
+        # A) PROCESS amounts and currency pairs
+        # Every distinct (input_cur, output_cur) pair as entered is resolved only once.
+        pair_ids = {}
+        in_codes = []
+        out_codes = []
+        pair_rates = []
+        in_amounts = array('d')
+        item_pairs = array('i')
+        for item_n, (in_amount, input_cur, output_cur) in enumerate(items):
+            try:
+                in_amounts.append(self._check_amount(in_amount))
+                pair_id = pair_ids.get((input_cur, output_cur))
+                if pair_id is None:
+                    if not output_cur:
+                        raise ValueError("Output currency must be entered for every item of the batch.", 8)
+                    in_code = self._resolve_currency(input_cur, table.ids, 'input')
+                    out_code = self._resolve_currency(output_cur, table.ids, 'output')
+                    pair_id = len(in_codes)
+                    pair_ids[(input_cur, output_cur)] = pair_id
+                    in_codes.append(in_code)
+                    out_codes.append(out_code)
+                    pair_rates.append(table.cross_rate(in_code, out_code))
+            except ValueError, e:
+                raise ValueError('%s (item %d)' % (e.args[0], item_n), *e.args[1:])
+            item_pairs.append(pair_id)
+
+        # B) CALCULATE AMOUNTS (the same way as convert() - with cross rates)
+        if backend == 'numpy':
+            pairs_index = numpy.frombuffer(item_pairs, dtype=numpy.intc)
+            amounts = numpy.frombuffer(in_amounts, dtype=numpy.float64)
+            out_amounts = numpy.round(amounts * numpy.array(pair_rates)[pairs_index], 2)
+            in_amounts = amounts
+        else:
+            out_amounts = array('d', [
+                round(amount * pair_rates[pair_id], 2)
+                for amount, pair_id in izip(in_amounts, item_pairs)
+            ])
+
+        return {
+            'timestamp': table.timestamp,
+            'input_amounts': in_amounts,
+            'input_currencies': [in_codes[pair_id] for pair_id in item_pairs],
+            'output_amounts': out_amounts,
+            'output_currencies': [out_codes[pair_id] for pair_id in item_pairs],
+        }
+
+    def convert_text(self, text, output_cur=None, decimal_separator='.', **kwargs):
+        """
+        Convert amount of money entered together with currency as free text (i.e. "€10.04", "1 000,50 Kč").
+
+        Args:
+            text (string): Amount with currency code or symbol before or after it (see MoneyParser).
+            output_cur (string | list | None): To currency - see convert().
+            decimal_separator (string): Decimal separator of ambiguous numbers ("1,000") - "." or ",".
+            kwargs: Other parameters of convert().
+
+        Returns:
+            See convert().
+
+        Raises:
+            ValueError: Amount with currency could not be parsed. | See convert().
+        """
+        amount, input_cur = self.parse_money(text, decimal_separator)
+        return self.convert(amount, input_cur, output_cur, **kwargs)
+
+    def convert_text_many(self, texts, output_cur, decimal_separator='.', **kwargs):
+        """
+        Convert many amounts with currencies entered as free text (i.e. a column of a file) to one currency.
+
+        Args:
+            texts (iterable): Amounts with currency codes or symbols (see MoneyParser).
+            output_cur (string): To currency (3 letter currency code or currency symbol).
+            decimal_separator (string): Decimal separator of ambiguous numbers ("1,000") - "." or ",".
+            kwargs: Other parameters of convert_many().
+
+        Returns:
+            See convert_many().
+
+        Raises:
+            ValueError: Amount with currency could not be parsed (message contains its position). |
+                See convert_many().
+        """
+        self._get_rates_table()
+        amounts, codes = MoneyParser(self.resolver, decimal_separator).parse_many(texts)
+        return self.convert_many(izip(amounts, codes, repeat(output_cur)), **kwargs)
+
+    def parse_money(self, text, decimal_separator='.'):
+        """
+        Split free text to amount and currency code (see MoneyParser.parse()).
+
+        Returns:
+            Tuple (amount as string, currency code).
+
+        Raises:
+            ValueError: Amount with currency could not be parsed.
+            urllib2.HTTPError, urllib2.URLError, IOError: Could not get exchange rates - see convert().
+        """
+        # Currency codes of the current rates are known to the resolver.
+        self._get_rates_table()
+        return MoneyParser(self.resolver, decimal_separator).parse(text)
+
+    def convert_series(self, in_amount, input_cur, output_cur, start, end):
+        """
+        Convert the amount with all historical rates in the time range (historical rates store must be set).
+
+        Args:
+            in_amount (string | float | int): Amount of money to convert.
+            input_cur (string): From currency (3 letter currency code or currency symbol).
+            output_cur (string): To currency (3 letter currency code or currency symbol).
+            start, end (datetime.datetime | datetime.date | int | float): Time range (including both ends).
+
+        Returns:
+            Dictionary (output amount is NaN if one of the currencies was not known at the time):
+            {
+                "input": {"amount": 10.0, "currency": "EUR"},
+                "output_currency": "CZK",
+                "timestamps": (1455274808, 1455278408),
+                "output_amounts": array('d', [270.26, 270.31])
+            }
+
+        Raises:
+            ValueError: Input amount is not a number. | Input amount cannot be less than zero.
+                Unknown currency code or symbol. | Historical rates store is not set.
+        """
+        if self.history is None:
+            raise ValueError('Historical rates store is not set (see history_dirpath parameter).', 11)
+        in_amount = self._check_amount(in_amount)
+        known_codes = dict.fromkeys(self.history.codes)
+        input_cur = self._resolve_currency(input_cur, known_codes, 'input')
+        output_cur = self._resolve_currency(output_cur, known_codes, 'output')
+        timestamps, in_rates = self.history.series(input_cur, start, end)
+        out_rates = self.history.series(output_cur, start, end)[1]
+        return {
+            'input': {'amount': in_amount, 'currency': input_cur},
+            'output_currency': output_cur,
+            'timestamps': timestamps,
+            'output_amounts': array('d', [
+                round(in_amount / in_rate * out_rate, 2) for in_rate, out_rate in izip(in_rates, out_rates)
+            ]),
+        }
+
+    def warm_up(self):
+        """
+        Load the rates now (if they are not loaded yet), so the first conversion does not wait for them.
+
+        Raises:
+            urllib2.HTTPError, urllib2.URLError, IOError: Could not get exchange rates - see convert().
+        """
+        self._get_rates_table()
+
+    def start_refresher(self, interval=None):
+        """
+        Start a background thread which refreshes the rates before they expire.
+        Conversions then never wait for new rates - they use the current rates, even if they are expired
+        (when refreshing fails).
+
+        Args:
+            interval (int | float | None): Number of seconds between refreshes (default is 80 % of rates TTL).
+
+        Returns:
+            RatesRefresher object (its "stats" attribute contains refresh latency and failures).
+            Converters with shared rates share one refresher (the interval of the first one is used).
+        """
+        if self.refresher is not None:
+            return self.refresher
+        if interval is None:
+            interval = max(self.rates_cache.ttl * 0.8, 1)
+        create = lambda: RatesRefresher(
+            self.rates_cache,
+            lambda: self._get_rates(self.rates_read_mode, refresh_ahead=interval),
+            interval,
+            # Conversions don't build the tables of new rates, the refresher does it.
+            on_refresh=self._update_rates_table,
+        )
+        if self._shared_rates is not None:
+            self.refresher = self._shared_rates.start_refresher(create)
+            return self.refresher
+        self.refresher = create()
+        self.rates_cache.stale_while_revalidate = True
+        self.refresher.start()
+        return self.refresher
+
+    def stop_refresher(self):
+        """Stop the background refresher (if it is running - shared refresher only when no converter uses it)."""
+        if self.refresher is None:
+            return
+        if self._shared_rates is not None:
+            self._shared_rates.stop_refresher()
+            self.refresher = None
+            return
+        self.refresher.stop()
+        self.refresher = None
+        self.rates_cache.stale_while_revalidate = False
+
+    def close(self):
+        """
+        Stop the refresher and release the shared symbols and rates (see SharedRegistry) - they are kept in memory
+        while they are used by some converter. The converter can still be used, but it reads them again.
+        """
+        self.stop_refresher()
+        with self._table_lock:
+            shared_keys, self._shared_keys = self._shared_keys, []
+            self._currency_symbols = self._symbols_key = None
+            self._resolver = self._resolver_key = self._resolver_codes = None
+        for key in shared_keys:
+            registry.release(key)
+
+    def _check_rounding(self, rounding):
+        """
+        Returns:
+            Rounding mode (the default one if it's None).
+
+        Raises:
+            ValueError: Invalid rounding mode.
+        """
+        if rounding is None:
+            return self.rounding
+        check_rounding(rounding)
+        return rounding
+
+    def _collect_metrics(self):
+        """
+        Returns:
+            Metrics counted by other objects (rates cache, resolver, refresher, providers) - see Metrics.add_collector().
+        """
+        samples = [('rates_cache_' + key + '_total', 'counter', value, {})
+                   for key, value in self.rates_cache.stats.iteritems()]
+        resolver = self._resolver
+        if resolver is not None:
+            samples.extend(('resolver_memo_' + key + '_total', 'counter', value, {})
+                           for key, value in resolver._memo.stats.iteritems())
+        if self.result_cache is not None:
+            samples.extend(('result_cache_' + key + '_total', 'counter', value, {})
+                           for key, value in self.result_cache.stats.iteritems())
+            samples.append(('result_cache_size', 'gauge', len(self.result_cache), {}))
+        table = self._rates_table
+        if table is not None:
+            samples.append(('rates_timestamp_seconds', 'gauge', table.timestamp, {}))
+        samples.extend(('shared_registry_' + key + '_total', 'counter', value, {})
+                       for key, value in registry.stats.iteritems())
+        samples.append(('shared_registry_objects', 'gauge', len(registry), {}))
+        refresher = self.refresher
+        if refresher is not None:
+            samples.append(('refresher_refreshes_total', 'counter', refresher.stats['refreshes'], {}))
+            samples.append(('refresher_failures_total', 'counter', refresher.stats['failures'], {}))
+            samples.append(('refresher_last_latency_seconds', 'gauge', refresher.stats['last_latency'], {}))
+        provider_stats = getattr(self.rates_provider, 'stats', None)
+        if isinstance(provider_stats, dict):
+            for name, stats in provider_stats.iteritems():
+                labels = {'provider': name}
+                samples.append(('provider_requests_total', 'counter', stats['requests'], labels))
+                samples.append(('provider_failures_total', 'counter', stats['failures'], labels))
+                samples.append(('provider_avg_latency_seconds', 'gauge', stats['avg_latency'], labels))
+                samples.append(('provider_circuit_open', 'gauge', int(stats['open_until'] != 0), labels))
+        return samples
+
+    @staticmethod
+    def _check_exact_amount(in_amount):
+        """
+        Check that the amount of money is a number >= 0 (without conversion to float).
+
+        Args:
+            in_amount (string | decimal.Decimal | int | float): Amount of money.
+
+        Returns:
+            Tuple (coefficient, places): amount = coefficient / 10 ** places.
+
+        Raises:
+            ValueError: Input amount is not a number. | Input amount cannot be less than zero.
+        """
         try:
-            in_amount = float(in_amount)
+            coefficient, places = parse_amount(in_amount)
         except ValueError:
             raise ValueError("Input amount is not a number: " + str(in_amount), 6)
+        if coefficient < 0:
+            raise ValueError("Input amount cannot be less than zero: " + str(in_amount), 7)
+        return coefficient, places
+
+    @staticmethod
+    def _check_amount(in_amount):
+        """
+        Check that the amount of money is a finite number >= 0.
+
+        Args:
+            in_amount (string | float | int): Amount of money.
+
+        Returns:
+            Amount as float.
+
+        Raises:
+            ValueError: Input amount is not a finite number. | Input amount cannot be less than zero.
+        """
+        # Firstly check if the input amount is a number (can be converted to float).
+        try:
+            amount = float(in_amount)
+        except (ValueError, TypeError):
+            raise ValueError("Input amount is not a number: " + str(in_amount), 6)
+        # Infinity and NaN (NaN is not equal to itself) can't be converted or written to JSON.
+        if amount - amount != 0:
+            raise ValueError("Input amount is not a finite number: " + str(in_amount), 6)
+        in_amount = amount
         # Only numbers >= 0 have sense (IMHO).
         if in_amount < 0:
             raise ValueError("Input amount cannot be less than zero: " + str(in_amount), 7)
+        return in_amount
 
-        # Get current exchange rates.
+    def _get_cached_rates(self):
+        """
+        Get current exchange rates from the cache (which reads them if necessary).
+
+        Returns:
+            Dictionary with keys "timestamp", "base" and "rates" - see self._get_rates() docstring for details.
+
+        Raises:
+            urllib2.HTTPError, urllib2.URLError, IOError: Could not get exchange rates - see convert().
+        """
         try:
-            rates_data = self._get_rates(self.rates_read_mode)
-        except urllib2.HTTPError, e:
-            msg = "There was an error while getting data from the API.\n" + e.msg
-            raise urllib2.HTTPError(e.url, e.code, msg, e.hdrs, e.fp)
-        except urllib2.URLError, e:
-            msg = "There is no internet connection or domain name in API URL is invalid.\n" + str(e)
-            raise urllib2.URLError(msg)
+            return self.rates_cache.get()
         except IOError, e:
+            # Errors of urllib2 are subclasses of IOError (urllib2 is imported only when API is used).
+            import urllib2
+            if isinstance(e, urllib2.HTTPError):
+                msg = "There was an error while getting data from the API.\n" + e.msg
+                raise urllib2.HTTPError(e.url, e.code, msg, e.hdrs, e.fp)
+            if isinstance(e, urllib2.URLError):
+                msg = "There is no internet connection or domain name in API URL is invalid.\n" + str(e)
+                raise urllib2.URLError(msg)
             msg = "Could not read Rates file.\n" + e.message
             raise IOError(msg)
 
-        # Select exchange rates
-        rates = rates_data['rates']
+    def _get_rates_table(self):
+        """
+        Get cross rates table for the current exchange rates.
+        The table is built again only if the rates have a new timestamp (by one thread, the others use
+        the previous table meanwhile).
 
-        # A) PROCESS currency codes/symbols
+        Returns:
+            RatesTable object.
 
-        # Remove possible surrounding whitespace characters from currency inputs.
-        input_cur = input_cur.strip()
-        if output_cur:
-            output_cur = output_cur.strip()
+        Raises:
+            urllib2.HTTPError, urllib2.URLError, IOError: Could not get exchange rates - see convert().
+        """
+        rates_data = self._get_cached_rates()
+        table = self._rates_table
+        if table is not None and table.timestamp == rates_data['timestamp']:
+            return table
+        return self._update_rates_table(rates_data, wait=table is None)
 
-        # If run from terminal, decode input values. Necessary only for reading symbols from Windows terminal.
-        if terminal_encoding:
-            input_cur = unicode(input_cur, terminal_encoding).encode('utf-8')
-            if output_cur:
-                output_cur = unicode(output_cur, terminal_encoding).encode('utf-8')
-
-        # Check if input currency is valid.
-        if input_cur not in rates and input_cur not in self.currency_symbols:
-            raise ValueError("Unknown input currency code/symbol entered: " + input_cur, 5)
-        # Check if output currency is valid.
-        if output_cur and (output_cur not in rates and output_cur not in self.currency_symbols):
-            raise ValueError("Unknown output currency code/symbol entered: " + output_cur, 5)
-
-        # If currency symbol is entered, find the coresponding code.
-        if input_cur not in rates:
-            input_cur = self.currency_symbols[input_cur]
-        if output_cur and output_cur not in rates:
-            output_cur = self.currency_symbols[output_cur]
+    def _update_rates_table(self, rates_data, wait=True):
+        """
+        Build cross rates table for the rates (if the current table has other timestamp) and make it current.
+        Only one thread builds a table at a time.
 
-        # B) CALCULATE AMOUNT
-        # Example for 10 EUR  -> CZK:
-        #   1. How many dollars do I need to buy 10 euros? 10 / 0.9 = 11.1111111111 ... B (1 USD = 0.90 EUR)
-        #   2. How many CZK do I get for B dollars? B * 24.26 = 269.55 (1 USD = 24.26 CZK)
+        Args:
+            rates_data (dict): Dictionary with keys "timestamp", "base" and "rates".
+            wait (bool): If other thread is building a table, wait for it (otherwise the current table is returned).
 
-        # Calculate amount in the base currency.
-        base_amount = in_amount / rates[input_cur]
+        Returns:
+            RatesTable object.
+        """
+        if not self._table_lock.acquire(wait):
+            return self._rates_table
+        try:
+            table = self._rates_table
+            # Other thread could have built the table while we were waiting for the lock.
+            if table is not None and table.timestamp == rates_data['timestamp']:
+                return table
+            shared = self._shared_rates
+            if shared is not None and shared.table is not None:
+                table = shared.table
+            if table is not None and table.timestamp == rates_data['timestamp']:
+                # Built by other converter with the shared rates.
+                self._rates_table = table
+            else:
+                # Only cross rates of currencies with changed rates are calculated again.
+                table = RatesTable(rates_data, previous=table)
+                self._rates_table = table
+                if shared is not None:
+                    shared.table = table
+                if self.history is not None:
+                    self._save_history(rates_data)
+            # Remembered results are valid only for the previous rates.
+            if self.result_cache is not None:
+                self.result_cache.clear()
+            return table
+        finally:
+            self._table_lock.release()
 
-        # Calculate amount in the output currency/all currencies (based on the amount in the base currency).
-        out_amounts = {}
-        if output_cur:
-            out_amounts[output_cur] = round(base_amount * rates[output_cur], 2)
-        else:
-            for cur_code, exchange_rate in rates.items():
-                out_amounts[cur_code] = round(base_amount * exchange_rate, 2)
+    def _save_history(self, rates_data):
+        """Save the rates to the historical rates store."""
+        try:
+            self.history.append(rates_data)
+        # Conversion with current rates must not fail because of the history.
+        except (IOError, OSError, ValueError):
+            pass
 
-        # Create the final return object.
-        result_dict = {
-            'input': {
-                'amount': in_amount,
-                'currency': input_cur,
-            },
-            'output': out_amounts,
-        }
-        # Convert dict to JSON string.
-        return json.dumps(result_dict)
+    def _get_history_table(self, at):
+        """
+        Get cross rates table for the last rates known at the time.
+
+        Args:
+            at (datetime.datetime | datetime.date | int | float): Time.
+
+        Returns:
+            RatesTable object.
+
+        Raises:
+            ValueError: Historical rates store is not set. | There are no rates for the time.
+        """
+        if self.history is None:
+            raise ValueError('Historical rates store is not set (see history_dirpath parameter).', 11)
+        row = self.history.find(at)
+        timestamp = self.history.timestamp(row)
+        table = self._history_tables.get(timestamp)
+        if table is None:
+            table = RatesTable(self.history.rates_at(timestamp))
+            with self._table_lock:
+                self._history_tables[timestamp] = table
+                # Keep only recently used tables.
+                if len(self._history_tables) > 16:
+                    self._history_tables.popitem(last=False)
+        return table
+
+    def _resolve_currency(self, currency, rates, direction, terminal_encoding=None):
+        """
+        Find currency code for the entered currency code or symbol.
+
+        Args:
+            currency (string): 3 letter currency code (case insensitive) or currency symbol.
+            rates (dict): Known currency codes as keys (i.e. exchange rates).
+            direction (string): "input" or "output" (used in error message).
+            terminal_encoding (string | None): Encoding of the currency parameter (default is UTF-8).
+
+        Returns:
+            Currency code.
+
+        Raises:
+            ValueError: Unknown currency code or symbol (message contains similar known codes/symbols).
+        """
+        # If run from terminal, decode input value. Necessary only for reading symbols from Windows terminal.
+        if terminal_encoding:
+            currency = unicode(currency, terminal_encoding).encode('utf-8')
+        code = self.resolver.resolve(currency)
+        if code is not None and code in rates:
+            return code
+        # Codes of rates which are not in the resolver (i.e. historical rates).
+        if currency.strip().upper() in rates:
+            return currency.strip().upper()
+        msg = "Unknown " + direction + " currency code/symbol entered: " + currency.strip()
+        suggestions = self.resolver.suggest(currency)
+        if suggestions:
+            msg += ". Did you mean: " + ", ".join(suggestions) + "?"
+        raise ValueError(msg, 5)
 
-    def _get_rates(self, source):
+    def _get_rates(self, source, refresh_ahead=0):
         """
         Get actual exchange rates for all known currencies.
 
         Args:
             source (string): "api", "file", "file_no_update"
+            refresh_ahead (int | float): In "file" mode, update the file this number of seconds before it's 1 hour old.
 
         Returns:
             Dictionary containing base currency, rates (code and value pairs) and UNIX timestamp (time of the rates).
@@ -192,48 +1003,177 @@ class CurrencyConverter(object):
             urllib2.URLError: No internet connection / invalid domain name in API URL.
             IOError: Rates file could not be read/written.
         """
-        # Get data from API.
+        if self.metrics is not None:
+            start = time.time()
+            try:
+                return self._load_rates(source, refresh_ahead)
+            finally:
+                self.metrics.observe('get_rates_seconds', time.time() - start, source=source)
+        return self._load_rates(source, refresh_ahead)
+
+    def _load_rates(self, source, refresh_ahead=0):
+        """Get actual exchange rates - see _get_rates()."""
+        # Get data from API (only if they have changed since the cached rates were downloaded).
         if source == 'api':
-            rates_json = urllib2.urlopen(self.rates_url).read()
-            return self._convert_rates_json_to_dict(rates_json)
+            return self._fetch_api_rates(self.rates_cache.peek())
 
         # Get data from rates file.
         if source == 'file' or source == 'file_no_update':
-            with open(self.rates_filepath) as rates_file:
-                # Get data from the file.
-                rf_dict = json.load(rates_file)
-                # If set, just return the file (no update).
-                if source == 'file_no_update':
-                    return rf_dict
-                # Check if the file is older than 1 hour.
-                if rf_dict['timestamp'] < (int(time.time()) - 3600):
-                    # If it is, get new rates from API, update the file and return rates.
-                    return self._get_api_rates_and_save_to_file()
-                else:
-                    # If not, just return the present rates.
-                    return rf_dict
+            # Get data from the file.
+            rf_dict = self._read_rates_file()
+            # If set, just return the file (no update).
+            if source == 'file_no_update':
+                return rf_dict
+            # Check if the file is older than 1 hour.
+            if self._rates_expired(rf_dict, refresh_ahead):
+                # If it is, get new rates from API, update the file and return rates.
+                return self._get_api_rates_and_save_to_file(refresh_ahead)
+            else:
+                # If not, just return the present rates.
+                return rf_dict
         # Invalid source parameter.
         else:
             raise ValueError("Unsupported way of getting rates: " + source)
 
-    def _get_api_rates_and_save_to_file(self):
+    @staticmethod
+    def _rates_expired(rates_dict, refresh_ahead=0):
+        """
+        Returns:
+            True if the rates are older than 1 hour (minus refresh_ahead seconds).
+        """
+        return rates_dict['timestamp'] < (int(time.time()) - 3600 + refresh_ahead)
+
+    def _read_rates_file(self):
+        """
+        Read rates from the Rates file. If its binary snapshot (saved together with the file, see
+        _get_api_rates_and_save_to_file()) is up to date, it is read instead, so no JSON has to be parsed.
+
+        Returns:
+            Dictionary with keys "timestamp", "base" and "rates".
+
+        Raises:
+            ValueError: Invalid JSON file.
+            IOError: Rates file could not be read.
+        """
+        try:
+            if os.path.getmtime(self.snapshot_filepath) >= os.path.getmtime(self.rates_filepath):
+                snapshot = MappedSnapshot(self.snapshot_filepath)
+                try:
+                    rates_data = snapshot.to_rates_data()
+                finally:
+                    snapshot.close()
+                if self.metrics is not None:
+                    self.metrics.inc('rates_file_reads_total', format='snapshot')
+                    self.metrics.inc('rates_file_bytes_read_total', snapshot.size, format='snapshot')
+                return rates_data
+        except (OSError, IOError, ValueError):
+            pass
+        with open(self.rates_filepath) as rates_file:
+            rates_json = rates_file.read()
+        if self.metrics is not None:
+            self.metrics.inc('rates_file_reads_total', format='json')
+            self.metrics.inc('rates_file_bytes_read_total', len(rates_json), format='json')
+        return json.loads(rates_json)
+
+    def _get_api_rates_and_save_to_file(self, refresh_ahead=0):
         """
         Get rates from API, save them to file and return the rates dictionary.
+        Only one process (or thread) updates the file at a time - the others wait and then use its result.
+        The file and its binary snapshot are replaced atomically, so readers never see a partially written file.
+
+        Args:
+            refresh_ahead (int | float): See _get_rates().
 
         Returns:
             Dictionary with keys "timestamp", "base" and "rates".
         """
         try:
-            rates_json = urllib2.urlopen(self.rates_url).read()
-            rates_dict = self._convert_rates_json_to_dict(rates_json)
-            final_json = json.dumps(rates_dict)
-            with open(self.rates_filepath, 'w') as rates_file:
-                rates_file.write(final_json)
-            return rates_dict
+            with self.rates_file_lock:
+                # Other process could have updated the file while we were waiting for the lock.
+                rf_dict = self._read_rates_file()
+                if not self._rates_expired(rf_dict, refresh_ahead):
+                    return rf_dict
+                rates_dict = self._fetch_api_rates(rf_dict)
+                # The rates have not changed - the file is not rewritten.
+                if rates_dict['timestamp'] <= rf_dict['timestamp']:
+                    if self.metrics is not None:
+                        self.metrics.inc('rates_unchanged_total')
+                    return rf_dict
+                final_json = json.dumps(rates_dict)
+                atomic_write(self.rates_filepath, final_json)
+                write_snapshot(self.snapshot_filepath, rates_dict)
+                return rates_dict
         # If there is no answer from server or file write is impossible, at least return last known rates.
-        except (urllib2.URLError, urllib2.HTTPError, IOError):
-            with open(self.rates_filepath) as rates_file:
-                return json.load(rates_file)
+        # (urllib2.URLError and urllib2.HTTPError are subclasses of IOError.)
+        except (IOError, OSError):
+            if self.metrics is not None:
+                self.metrics.inc('file_fallbacks_total')
+            return self._read_rates_file()
+
+    def _fetch_api_rates(self, current=None):
+        """
+        Download the latest rates from API - conditionally, if the current rates are known.
+
+        Args:
+            current (dict | None): Current rates (returned if the rates have not changed).
+
+        Returns:
+            Dictionary with keys "timestamp", "base" and "rates".
+
+        Raises:
+            See _fetch_api_rates_json().
+        """
+        rates_json = self._fetch_api_rates_json(conditional=current is not None)
+        if rates_json is None:
+            return current
+        return self._convert_rates_json_to_dict(rates_json)
+
+    def _fetch_api_rates_json(self, conditional=False):
+        """
+        Download the latest rates from API (or get them from the rates provider, if it's set).
+
+        Args:
+            conditional (bool): Send ETag/Last-Modified of the previous response - if the rates have not changed,
+                the server does not send them again.
+
+        Returns:
+            JSON string returned by the API or None if the rates have not changed (conditional request).
+
+        Raises:
+            urllib2.HTTPError: Could not download data from API.
+            urllib2.URLError: No internet connection / invalid domain name in API URL.
+        """
+        if self.metrics is None:
+            return self._request_rates(conditional)
+        self.metrics.inc('api_requests_total')
+        try:
+            rates_json = self._request_rates(conditional)
+        except Exception:
+            self.metrics.inc('api_errors_total')
+            raise
+        if rates_json is None:
+            self.metrics.inc('api_not_modified_total')
+        else:
+            self.metrics.inc('api_bytes_read_total', len(rates_json))
+        return rates_json
+
+    def _request_rates(self, conditional=False):
+        """Download the latest rates - see _fetch_api_rates_json()."""
+        if self.rates_provider is not None:
+            return self.rates_provider.fetch(conditional)
+        import urllib2
+        from HttpClient import conditional_headers, response_validators
+        validators = self._api_validators if conditional else {}
+        request = urllib2.Request(self.rates_url, headers=conditional_headers(validators))
+        try:
+            response = urllib2.urlopen(request)
+        except urllib2.HTTPError, e:
+            if e.code == 304 and validators:
+                return None
+            raise
+        rates_json = response.read()
+        self._api_validators = response_validators(response.info())
+        return rates_json
 
     @staticmethod
     def _convert_rates_json_to_dict(rates_json):
@@ -251,11 +1191,85 @@ class CurrencyConverter(object):
         # Convert JSON to dictionary.
         r_dict = json.loads(rates_json)
         # Remove unnecessary items.
-        r_dict.pop("disclaimer")
-        r_dict.pop("license")
+        r_dict.pop("disclaimer", None)
+        r_dict.pop("license", None)
         # Result
         return r_dict
 
+    def _acquire_shared(self, key, create):
+        """Get a shared object from the SharedRegistry (it's released by close())."""
+        shared_object = registry.acquire(key, create)
+        self._shared_keys.append(key)
+        return shared_object
+
+    def _acquire_symbols(self, symbols_filepath):
+        """
+        Get currency symbols (see _load_currency_symbols()) shared by all converters using the same version
+        of the file.
+
+        Returns:
+            FrozenDict with currency symbol as key and currency code as value.
+        """
+        file_stat = os.stat(symbols_filepath)
+        key = ('symbols', os.path.realpath(symbols_filepath), file_stat.st_mtime, file_stat.st_size)
+        symbols = self._acquire_shared(key, lambda: freeze_symbols(
+            self._load_currency_symbols(symbols_filepath, self.symbols_cache_dir)))
+        self._symbols_key = key
+        return symbols
+
+    def _rates_source_key(self, rates_ttl, api_url, history_dirpath):
+        """
+        Returns:
+            Key of the shared rates - converters with the same key get the same rates (see shared parameter).
+        """
+        if self.rates_provider is not None:
+            source = ('provider', id(self.rates_provider))
+        elif self.rates_read_mode == 'api':
+            source = ('api', api_url)
+        else:
+            source = ('file', os.path.realpath(self.rates_filepath))
+        history = os.path.realpath(history_dirpath) if history_dirpath else None
+        return ('rates', self.rates_read_mode) + source + (rates_ttl, history)
+
+    @classmethod
+    def _load_currency_symbols(cls, symbols_filepath, cache_dir=None):
+        """
+        Read currency symbols (see _read_currency_symbols()) from the precompiled cache in the cache directory
+        (in marshal format, which contains only data - unlike pickle, loading it can't execute any code).
+        If the cache is missing or older than the file, read the file and save the cache.
+
+        Args:
+            symbols_filepath (string): Absolute filepath to the currency symbols file.
+            cache_dir (string | None): Directory of the cache (the file is read without cache if it's None).
+
+        Returns:
+            Dictionary with currency symbol as key and currency code as value.
+        """
+        if cache_dir is None:
+            return cls._read_currency_symbols(symbols_filepath)
+        # Imported only when needed.
+        import hashlib
+        cache_filepath = os.path.join(cache_dir, 'symbols-%s.marshal' % hashlib.sha1(
+            os.path.realpath(symbols_filepath)).hexdigest())
+        file_stat = os.stat(symbols_filepath)
+        file_version = (file_stat.st_mtime, file_stat.st_size)
+        try:
+            with open(cache_filepath, 'rb') as cache_file:
+                cache_version, symbols = marshal.load(cache_file)
+            if cache_version == file_version and isinstance(symbols, dict):
+                return symbols
+        except (IOError, EOFError, ValueError, TypeError):
+            pass
+        symbols = cls._read_currency_symbols(symbols_filepath)
+        # The cache is optional - i.e. the directory might be read-only.
+        try:
+            if not os.path.isdir(cache_dir):
+                os.makedirs(cache_dir)
+            atomic_write(cache_filepath, marshal.dumps((file_version, symbols)))
+        except (IOError, OSError):
+            pass
+        return symbols
+
     @staticmethod
     def _read_currency_symbols(symbols_filepath):
         """
@@ -0,0 +1,132 @@
+# -*- coding: UTF-8 -*-
+import unicodedata
+
+from LRUCache import LRUCache
+
+
+def decode(currency):
+    """
+    Args:
+        currency (string | unicode): Currency code or symbol (string in UTF-8).
+
+    Returns:
+        Unicode string without surrounding whitespace or None if the string is not valid UTF-8.
+    """
+    if not isinstance(currency, unicode):
+        try:
+            currency = currency.decode('utf-8')
+        except UnicodeDecodeError:
+            return None
+    return currency.strip()
+
+
+def normalize(currency):
+    """
+    Normalize currency code/symbol entered by user: Unicode NFKC form without surrounding whitespace.
+
+    Args:
+        currency (string | unicode): Currency code or symbol (string in UTF-8).
+
+    Returns:
+        Normalized unicode string or None if the string is not valid UTF-8.
+    """
+    currency = decode(currency)
+    if currency is None:
+        return None
+    return unicodedata.normalize('NFKC', currency).strip()
+
+
+def deletes(key):
+    """
+    Returns:
+        All variants of the key with one character removed.
+    """
+    return [key[:n] + key[n + 1:] for n in range(len(key))]
+
+
+class CurrencyResolver(object):
+    """
+    Finds currency code for entered currency code or symbol. All codes and symbols are saved to one index
+    when the resolver is built - as they are and normalized (see normalize(), codes are case insensitive).
+    Exact match has priority (i.e. "₨" is MUR, but its normalized form "Rs" is LKR).
+    Results for entered values which had to be normalized are remembered, so they are not normalized again.
+    """
+
+    def __init__(self, symbols, codes=(), memo_size=1024):
+        """
+        Args:
+            symbols (dict): Currency symbol -> currency code (see CurrencyConverter._read_currency_symbols()).
+            codes (iterable): Known currency codes.
+            memo_size (int): Maximum number of remembered results.
+        """
+        self.codes = tuple(codes)
+        # Code/symbol -> currency code. Codes are saved in lower case and have priority over symbols,
+        # symbols as they are have priority over normalized symbols.
+        self._index = {}
+        # Normalized code/symbol and its variants with one character removed -> codes/symbols (for suggestions).
+        self._similar = {}
+        for code in self.codes:
+            self._index[code] = code
+            self._add(code.lower(), code, code)
+        for symbol, code in symbols.iteritems():
+            key = decode(symbol)
+            if key:
+                self._add(key, intern(code), symbol)
+        for symbol, code in symbols.iteritems():
+            key = normalize(symbol)
+            if key:
+                self._add(key, intern(code), symbol)
+        self._memo = LRUCache(memo_size)
+
+    def _add(self, key, code, display):
+        self._index.setdefault(key, code)
+        for variant in [key] + deletes(key):
+            self._similar.setdefault(variant, set()).add(display)
+
+    def resolve(self, currency):
+        """
+        Args:
+            currency (string): Currency code or symbol (UTF-8).
+
+        Returns:
+            Currency code or None if the code/symbol is unknown.
+        """
+        # Exact match is a plain dictionary lookup (ASCII strings are equal to their unicode keys).
+        code = self._index.get(currency)
+        if code is not None:
+            return code
+        key = decode(currency)
+        if key is None:
+            return None
+        code = self._index.get(key)
+        if code is not None:
+            return code
+        # Only values which have to be normalized are remembered.
+        code = self._memo.get(currency)
+        if code is None:
+            key = unicodedata.normalize('NFKC', key).strip()
+            code = self._index.get(key) or self._index.get(key.lower())
+            if code is not None:
+                self._memo.put(currency, code)
+        return code
+
+    def suggest(self, currency, limit=3):
+        """
+        Find known codes/symbols which differ from the entered value by one character
+        (one character added, removed or replaced).
+
+        Args:
+            currency (string): Unknown currency code or symbol (UTF-8).
+            limit (int): Maximum number of suggestions.
+
+        Returns:
+            List of codes/symbols (codes first).
+        """
+        key = normalize(currency)
+        if not key:
+            return []
+        found = set()
+        for base_key in set([key, key.lower()]):
+            for variant in [base_key] + deletes(base_key):
+                found.update(self._similar.get(variant, ()))
+        return sorted(found, key=lambda display: (display not in self.codes, display))[:limit]
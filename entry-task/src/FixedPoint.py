@@ -0,0 +1,135 @@
+# -*- coding: UTF-8 -*-
+import sys
+
+# Number of decimal places (ISO 4217 minor units) of currencies which don't have 2.
+MINOR_UNITS = {
+    'BIF': 0, 'CLP': 0, 'DJF': 0, 'GNF': 0, 'ISK': 0, 'JPY': 0, 'KMF': 0, 'KRW': 0, 'PYG': 0, 'RWF': 0,
+    'UGX': 0, 'UYI': 0, 'VND': 0, 'VUV': 0, 'XAF': 0, 'XOF': 0, 'XPF': 0,
+    'BHD': 3, 'IQD': 3, 'JOD': 3, 'KWD': 3, 'LYD': 3, 'OMR': 3, 'TND': 3,
+    'CLF': 4, 'UYW': 4,
+}
+DEFAULT_MINOR_UNITS = 2
+# Maximum absolute value of the decimal exponent of an amount (10 ** exponent is calculated with integers,
+# so an unbounded exponent could take all memory - doubles don't go beyond 1e308 and 5e-324).
+MAX_EXPONENT = 400
+
+# Rounding modes - the same values as constants of the decimal module (it's slow to import, so it's imported
+# only when Decimal objects are created).
+ROUND_HALF_UP = 'ROUND_HALF_UP'
+ROUND_HALF_EVEN = 'ROUND_HALF_EVEN'
+ROUND_HALF_DOWN = 'ROUND_HALF_DOWN'
+ROUND_UP = 'ROUND_UP'
+ROUND_DOWN = 'ROUND_DOWN'
+ROUND_CEILING = 'ROUND_CEILING'
+ROUND_FLOOR = 'ROUND_FLOOR'
+ROUND_05UP = 'ROUND_05UP'
+ROUNDING_MODES = (
+    ROUND_HALF_UP, ROUND_HALF_EVEN, ROUND_HALF_DOWN, ROUND_UP, ROUND_DOWN, ROUND_CEILING, ROUND_FLOOR, ROUND_05UP,
+)
+# Modes for rounding of negative numbers (they are rounded as positive numbers in the opposite direction).
+_NEGATIVE_MODES = {ROUND_CEILING: ROUND_FLOOR, ROUND_FLOOR: ROUND_CEILING}
+
+
+def minor_units(code):
+    """
+    Returns:
+        Number of decimal places of the currency.
+    """
+    return MINOR_UNITS.get(code, DEFAULT_MINOR_UNITS)
+
+
+def check_rounding(rounding):
+    """
+    Raises:
+        ValueError: Rounding is not a rounding mode of the decimal module.
+    """
+    if rounding not in ROUNDING_MODES:
+        msg = 'Rounding has invalid value: ' + str(rounding) + '. It must be one of: ' + ', '.join(ROUNDING_MODES)
+        raise ValueError(msg, 12)
+
+
+def parse_amount(amount):
+    """
+    Convert a number to fixed-point form without floating point arithmetic and without Decimal objects
+    (float is taken as its shortest representation, i.e. 0.1 is exactly 0.1).
+
+    Args:
+        amount (string | float | int | long | decimal.Decimal): Number.
+
+    Returns:
+        Tuple (coefficient, places) of ints: amount = coefficient / 10 ** places.
+
+    Raises:
+        ValueError: The amount is not a finite number (or its exponent is out of range, see MAX_EXPONENT).
+    """
+    if isinstance(amount, (int, long)) and not isinstance(amount, bool):
+        return amount, 0
+    # The amount can be Decimal only if the decimal module was imported.
+    decimal = sys.modules.get('decimal')
+    if decimal is not None and isinstance(amount, decimal.Decimal):
+        if not amount.is_finite():
+            raise ValueError('Not a finite number: ' + str(amount))
+        sign, digits, exponent = amount.as_tuple()
+        coefficient = int(''.join(map(str, digits)) or '0')
+        if sign:
+            coefficient = -coefficient
+        if abs(exponent) > MAX_EXPONENT:
+            raise ValueError('Not a finite number: ' + str(amount))
+        if exponent > 0:
+            return coefficient * 10 ** exponent, 0
+        return coefficient, -exponent
+    text = repr(amount) if isinstance(amount, float) else str(amount).strip()
+    mantissa, separator, exponent = text.lower().partition('e')
+    whole, _, fraction = mantissa.partition('.')
+    try:
+        coefficient = int(whole + fraction) if whole.lstrip('+-') or fraction else None
+        exponent = int(exponent) if separator else 0
+    except ValueError:
+        coefficient = None
+    if coefficient is None or (fraction and not fraction.isdigit()):
+        raise ValueError('Not a finite number: ' + text)
+    places = len(fraction) - exponent
+    if abs(places) > MAX_EXPONENT:
+        raise ValueError('Not a finite number: ' + text)
+    if places < 0:
+        return coefficient * 10 ** -places, 0
+    return coefficient, places
+
+
+def divide(numerator, denominator, rounding=ROUND_HALF_UP):
+    """
+    Integer division rounded by the rounding mode.
+
+    Args:
+        numerator (int | long): Dividend.
+        denominator (int | long): Divisor (> 0).
+        rounding (string): Rounding mode of the decimal module.
+
+    Returns:
+        Rounded quotient.
+    """
+    if numerator < 0:
+        return -divide(-numerator, denominator, _NEGATIVE_MODES.get(rounding, rounding))
+    quotient, remainder = divmod(numerator, denominator)
+    if not remainder or rounding in (ROUND_DOWN, ROUND_FLOOR):
+        return quotient
+    if rounding in (ROUND_UP, ROUND_CEILING):
+        return quotient + 1
+    if rounding == ROUND_05UP:
+        return quotient + 1 if quotient % 5 == 0 else quotient
+    double_remainder = remainder * 2
+    if double_remainder != denominator:
+        return quotient + 1 if double_remainder > denominator else quotient
+    # Exactly in the middle.
+    if rounding == ROUND_HALF_UP or (rounding == ROUND_HALF_EVEN and quotient % 2):
+        return quotient + 1
+    return quotient
+
+
+def to_decimal(coefficient, places):
+    """
+    Returns:
+        decimal.Decimal equal to coefficient / 10 ** places (exactly, with the given number of decimal places).
+    """
+    from decimal import Decimal
+    return Decimal('%de-%d' % (coefficient, places))
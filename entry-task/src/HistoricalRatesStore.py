@@ -0,0 +1,254 @@
+# -*- coding: UTF-8 -*-
+import bisect
+import calendar
+import datetime
+import mmap
+import os
+import struct
+import threading
+from array import array
+
+from SnapshotStore import FileLock
+
+# Value of a rate in a snapshot which did not contain the currency.
+MISSING = float('nan')
+TIMESTAMP = struct.Struct('<q')
+RATE = struct.Struct('<d')
+
+
+def to_timestamp(at):
+    """
+    Convert time to UNIX timestamp.
+
+    Args:
+        at (datetime.datetime | datetime.date | int | float): Time (naive datetime is considered to be in UTC).
+
+    Returns:
+        UNIX timestamp (int).
+    """
+    if isinstance(at, datetime.datetime):
+        return calendar.timegm(at.utctimetuple())
+    if isinstance(at, datetime.date):
+        return calendar.timegm(at.timetuple())
+    return int(at)
+
+
+class MappedColumn(object):
+    """
+    Read-only sequence of fixed size values in a file (mapped to memory, so it's not loaded at once).
+    """
+
+    def __init__(self, filepath, value_struct):
+        self.filepath = filepath
+        self.value_struct = value_struct
+        self._map = None
+        self._length = 0
+
+    def remap(self):
+        """
+        Map the file again (after it has grown).
+        The previous map is not closed (readers in other threads might still use it), it's freed when unused.
+        """
+        if not os.path.isfile(self.filepath) or not os.path.getsize(self.filepath):
+            return
+        with open(self.filepath, 'rb') as column_file:
+            new_map = mmap.mmap(column_file.fileno(), 0, access=mmap.ACCESS_READ)
+        # Length is set after the map, so it's never larger than the map.
+        self._map = new_map
+        self._length = len(new_map) // self.value_struct.size
+
+    def __len__(self):
+        return self._length
+
+    def __getitem__(self, index):
+        if not 0 <= index < self._length:
+            raise IndexError(index)
+        return self.value_struct.unpack_from(self._map, index * self.value_struct.size)[0]
+
+    def values(self, start, end):
+        """
+        Returns:
+            Tuple of values from start to end (excluding).
+        """
+        end = min(end, self._length)
+        if start >= end:
+            return ()
+        value_format = self.value_struct.format[0] + str(end - start) + self.value_struct.format[1:]
+        return struct.unpack_from(value_format, self._map, start * self.value_struct.size)
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+
+
+class HistoricalRatesStore(object):
+    """
+    Append-only store of rates snapshots in a directory with one file per column:
+        timestamps.bin ... timestamps of the snapshots (int64, sorted) - index used for searching
+        <currency code>.bin ... rates of the currency in all snapshots (float64, NaN if the snapshot did not
+            contain the currency)
+    Files are mapped to memory, so lookups don't load the whole history.
+    """
+
+    def __init__(self, dirpath, base='USD'):
+        """
+        Args:
+            dirpath (string): Directory of the store (created if it does not exist).
+            base (string): Base currency of the stored rates.
+        """
+        if not os.path.isdir(dirpath):
+            os.makedirs(dirpath)
+        self.dirpath = dirpath
+        self.base = base
+        self._lock = FileLock(os.path.join(dirpath, '.lock'))
+        self._timestamps = MappedColumn(os.path.join(dirpath, 'timestamps.bin'), TIMESTAMP)
+        # Currency code -> MappedColumn. Columns are added by lookups (when other process appended a snapshot),
+        # so other threads iterate over copies of the items (dict.items() is atomic).
+        self._columns = {}
+        self._columns_lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        """Map the files (again) - after append or when other process appended a snapshot."""
+        with self._columns_lock:
+            self._timestamps.remap()
+            for filename in os.listdir(self.dirpath):
+                code, extension = os.path.splitext(filename)
+                if extension == '.bin' and filename != 'timestamps.bin':
+                    if code not in self._columns:
+                        self._columns[code] = MappedColumn(os.path.join(self.dirpath, filename), RATE)
+                    self._columns[code].remap()
+            self.codes = sorted(self._columns)
+
+    def __len__(self):
+        return len(self._timestamps)
+
+    def append(self, rates_data):
+        """
+        Add a snapshot to the end of the store. Snapshot which is not newer than the last one is ignored.
+
+        Args:
+            rates_data (dict): Rates with keys "timestamp", "base" and "rates" (see CurrencyConverter._get_rates()).
+
+        Returns:
+            True if the snapshot was added.
+
+        Raises:
+            ValueError: Rates have different base currency.
+            IOError: Files could not be written.
+        """
+        if rates_data['base'] != self.base:
+            raise ValueError('Rates must have base currency ' + self.base + ', not ' + rates_data['base'])
+        with self._lock:
+            # Other process could have appended a snapshot.
+            self._load()
+            rows = len(self._timestamps)
+            if rows and self._timestamps[rows - 1] >= rates_data['timestamp']:
+                return False
+            rates = rates_data['rates']
+            for code in set(self._columns.keys()) | set(str(code) for code in rates):
+                column_filepath = os.path.join(self.dirpath, code + '.bin')
+                with open(column_filepath, 'ab') as column_file:
+                    # Cut values of a previously failed append, add missing values for a new currency.
+                    column_file.truncate(min(os.path.getsize(column_filepath), rows * RATE.size))
+                    column_file.seek(0, os.SEEK_END)
+                    missing = rows - column_file.tell() // RATE.size
+                    column_file.write(RATE.pack(MISSING) * missing + RATE.pack(rates.get(code, MISSING)))
+            # The timestamp is written last - the snapshot becomes visible only when all its rates are written.
+            with open(self._timestamps.filepath, 'ab') as timestamps_file:
+                timestamps_file.write(TIMESTAMP.pack(rates_data['timestamp']))
+            self._load()
+        return True
+
+    def find(self, at):
+        """
+        Find the last snapshot which is not newer than the given time (by bisection of the timestamps).
+
+        Args:
+            at (datetime.datetime | datetime.date | int | float): Time (see to_timestamp()).
+
+        Returns:
+            Row number of the snapshot.
+
+        Raises:
+            ValueError: There is no snapshot for the time.
+        """
+        timestamp = to_timestamp(at)
+        if self._stale():
+            self._load()
+        row = bisect.bisect_right(self._timestamps, timestamp) - 1
+        if row < 0:
+            raise ValueError('There are no rates for the time: ' + str(at), 10)
+        return row
+
+    def timestamp(self, row):
+        """
+        Returns:
+            Timestamp of the snapshot in the row.
+        """
+        return self._timestamps[row]
+
+    def rates_at(self, at):
+        """
+        Args:
+            at (datetime.datetime | datetime.date | int | float): Time (see to_timestamp()).
+
+        Returns:
+            Dictionary with keys "timestamp", "base" and "rates" of the last snapshot not newer than the time.
+
+        Raises:
+            ValueError: There is no snapshot for the time.
+        """
+        row = self.find(at)
+        rates = {}
+        for code, column in self._columns.items():
+            if row < len(column):
+                rate = column[row]
+                # NaN is not equal to itself.
+                if rate == rate:
+                    rates[code] = rate
+        return {
+            'timestamp': self._timestamps[row],
+            'base': self.base,
+            'rates': rates,
+        }
+
+    def series(self, code, start, end):
+        """
+        Get rates of the currency in all snapshots in the time range.
+
+        Args:
+            code (string): Currency code.
+            start, end (datetime.datetime | datetime.date | int | float): Time range (including both ends).
+
+        Returns:
+            Tuple (timestamps, rates) - tuple of ints and array of floats.
+            Rate is NaN if the snapshot did not contain the currency.
+        """
+        if self._stale():
+            self._load()
+        first = bisect.bisect_left(self._timestamps, to_timestamp(start))
+        last = bisect.bisect_right(self._timestamps, to_timestamp(end))
+        timestamps = self._timestamps.values(first, last)
+        rates = array('d', self._columns[code].values(first, last) if code in self._columns else ())
+        # Append pads every column, but the column can still be shorter: _load() in another thread remaps
+        # the timestamps first, so they can include a snapshot appended meanwhile while the column is not remapped
+        # yet (or the currency was added by the snapshot and its column is not mapped at all).
+        rates.extend([MISSING] * (len(timestamps) - len(rates)))
+        return timestamps, rates
+
+    def close(self):
+        self._timestamps.close()
+        for column in self._columns.values():
+            column.close()
+
+    def _stale(self):
+        """
+        Returns:
+            True if other process appended a snapshot since the files were mapped.
+        """
+        try:
+            return os.path.getsize(self._timestamps.filepath) // TIMESTAMP.size != len(self._timestamps)
+        except OSError:
+            return False
@@ -0,0 +1,166 @@
+# -*- coding: UTF-8 -*-
+import httplib
+import socket
+import urllib2
+import urlparse
+import Queue
+from StringIO import StringIO
+
+
+def response_validators(headers):
+    """
+    Args:
+        headers (mimetools.Message | httplib.HTTPMessage): Response headers.
+
+    Returns:
+        Dictionary with ETag and Last-Modified headers (for conditional requests, see get_if_modified()).
+    """
+    return {
+        'etag': headers.getheader('ETag'),
+        'last_modified': headers.getheader('Last-Modified'),
+    }
+
+
+def conditional_headers(validators):
+    """
+    Args:
+        validators (dict): ETag and Last-Modified of the previous response (see response_validators()).
+
+    Returns:
+        Headers of conditional request (empty if there are no validators).
+    """
+    headers = {}
+    if validators.get('etag'):
+        headers['If-None-Match'] = validators['etag']
+    if validators.get('last_modified'):
+        headers['If-Modified-Since'] = validators['last_modified']
+    return headers
+
+
+class KeepAliveClient(object):
+    """
+    Simple HTTP(S) client for one URL which keeps a pool of open (keep-alive) connections,
+    so repeated requests don't pay for TCP and TLS handshakes.
+    Errors are reported the same way as by urllib2.urlopen().
+    """
+
+    def __init__(self, url, timeout=5.0, pool_size=4):
+        """
+        Args:
+            url (string): Absolute URL to download (http or https).
+            timeout (int | float): Socket timeout in seconds (connect and every read).
+            pool_size (int): Maximum number of idle connections kept open.
+        """
+        parts = urlparse.urlsplit(url)
+        if parts.scheme not in ['http', 'https']:
+            raise ValueError('Unsupported URL scheme: ' + parts.scheme)
+        self.url = url
+        self.timeout = timeout
+        self._connection_class = httplib.HTTPSConnection if parts.scheme == 'https' else httplib.HTTPConnection
+        self._netloc = parts.netloc
+        self._path = (parts.path or '/') + ('?' + parts.query if parts.query else '')
+        # Idle connections (the most recently used first - it's the most likely to be still open).
+        self._idle = Queue.LifoQueue(pool_size)
+
+    def get(self, headers=None):
+        """
+        Send GET request to the URL.
+
+        Args:
+            headers (dict | None): Additional request headers.
+
+        Returns:
+            Response body (string).
+
+        Raises:
+            urllib2.HTTPError: Server returned other status than 200.
+            urllib2.URLError: Connection failed or timed out.
+        """
+        response, body = self._get(headers)
+        if response.status != 200:
+            raise urllib2.HTTPError(self.url, response.status, response.reason, response.msg, StringIO(body))
+        return body
+
+    def get_if_modified(self, validators):
+        """
+        Send conditional GET request - the body is downloaded only if it has changed since the previous response
+        (ETag and Last-Modified headers of the previous response are sent back).
+
+        Args:
+            validators (dict): ETag and Last-Modified of the previous response ({} = unconditional request).
+
+        Returns:
+            Tuple (body, validators) - body is None if it has not changed, validators of the new response.
+
+        Raises:
+            See get().
+        """
+        headers = conditional_headers(validators)
+        response, body = self._get(headers)
+        if response.status == 304 and headers:
+            return None, validators
+        if response.status != 200:
+            raise urllib2.HTTPError(self.url, response.status, response.reason, response.msg, StringIO(body))
+        return body, response_validators(response.msg)
+
+    def _get(self, headers):
+        """
+        Send GET request through a pooled connection.
+
+        Returns:
+            Tuple (httplib.HTTPResponse, body) - status is 200 or 304.
+
+        Raises:
+            urllib2.HTTPError: Server returned other status than 200 or 304.
+            urllib2.URLError: Connection failed or timed out.
+        """
+        try:
+            connection = self._idle.get_nowait()
+            reused = True
+        except Queue.Empty:
+            connection = self._connection_class(self._netloc, timeout=self.timeout)
+            reused = False
+        try:
+            response, body = self._request(connection, headers)
+        except (httplib.HTTPException, socket.error), e:
+            connection.close()
+            # Timeout is not retried (it would double the time the caller waits).
+            if not reused or isinstance(e, socket.timeout):
+                raise urllib2.URLError(e)
+            # Server might have closed the idle connection - try once more with a new one.
+            connection = self._connection_class(self._netloc, timeout=self.timeout)
+            try:
+                response, body = self._request(connection, headers)
+            except (httplib.HTTPException, socket.error), e:
+                connection.close()
+                raise urllib2.URLError(e)
+        # 304 Not Modified is a valid answer to a conditional request.
+        if response.status not in (200, 304):
+            connection.close()
+            raise urllib2.HTTPError(self.url, response.status, response.reason, response.msg, StringIO(body))
+        # Return the connection to the pool (if the server allows it).
+        if response.will_close:
+            connection.close()
+        else:
+            try:
+                self._idle.put_nowait(connection)
+            except Queue.Full:
+                connection.close()
+        return response, body
+
+    def close(self):
+        """Close all idle connections."""
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except Queue.Empty:
+                return
+
+    def _request(self, connection, headers):
+        """
+        Returns:
+            Tuple (httplib.HTTPResponse, body).
+        """
+        connection.request('GET', self._path, headers=headers or {})
+        response = connection.getresponse()
+        return response, response.read()
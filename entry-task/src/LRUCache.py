@@ -0,0 +1,65 @@
+# -*- coding: UTF-8 -*-
+import threading
+from collections import OrderedDict
+
+
+class LRUCache(object):
+    """
+    Thread-safe dictionary with limited size - when it's full, the least recently used item is removed
+    (approximately: "second chance" - the oldest item which was read since it was saved or since it got
+    the last chance is moved to the end instead of being removed).
+    Reading does not take the lock (it's one dictionary lookup and marking of the item), only saving does.
+    """
+
+    def __init__(self, maxsize=1024):
+        """
+        Args:
+            maxsize (int): Maximum number of items.
+        """
+        self.maxsize = maxsize
+        # Key -> [value, read since it was saved or moved]
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+        # Counters (not locked).
+        self.stats = {
+            'hits': 0,
+            'misses': 0,
+            'evictions': 0,
+        }
+
+    def __len__(self):
+        return len(self._items)
+
+    def get(self, key, default=None):
+        """
+        Returns:
+            Value of the key (the item is marked as recently used) or default value if it's not present.
+        """
+        # dict.get() is atomic, saving is done under the lock.
+        item = self._items.get(key)
+        if item is None:
+            self.stats['misses'] += 1
+            return default
+        item[1] = True
+        self.stats['hits'] += 1
+        return item[0]
+
+    def put(self, key, value):
+        """Save the item (as the most recently used)."""
+        with self._lock:
+            items = self._items
+            items.pop(key, None)
+            items[key] = [value, False]
+            while len(items) > self.maxsize:
+                oldest_key, oldest = items.popitem(last=False)
+                if oldest[1]:
+                    # Read recently - second chance.
+                    oldest[1] = False
+                    items[oldest_key] = oldest
+                else:
+                    self.stats['evictions'] += 1
+
+    def clear(self):
+        """Remove all items."""
+        with self._lock:
+            self._items.clear()
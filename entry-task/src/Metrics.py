@@ -0,0 +1,157 @@
+# -*- coding: UTF-8 -*-
+import bisect
+import threading
+import time
+
+# Upper bounds of histogram buckets (seconds).
+LATENCY_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+                   0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram(object):
+    """
+    Counts of observed values in buckets (plus their sum and count).
+    """
+    __slots__ = ('bounds', 'counts', 'sum', 'count')
+
+    def __init__(self, bounds=LATENCY_BUCKETS):
+        self.bounds = bounds
+        # The last bucket is +Inf.
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class StageTimer(object):
+    """
+    Measures duration of consecutive stages of one operation (see Metrics.timer()).
+    """
+    __slots__ = ('metrics', 'name', 'start', 'last')
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+        self.start = self.last = time.time()
+
+    def stage(self, stage):
+        """Record duration of the stage which ends now (it started at the end of the previous one)."""
+        now = time.time()
+        self.metrics.observe(self.name + '_stage_seconds', now - self.last, stage=stage)
+        self.last = now
+
+    def finish(self):
+        """Record duration of the whole operation."""
+        self.metrics.observe(self.name + '_seconds', time.time() - self.start)
+
+
+class Metrics(object):
+    """
+    Counters and histograms of CurrencyConverter (see its "metrics" parameter), exported in Prometheus text format.
+    Values can have labels (keyword arguments of inc() and observe()).
+    Collectors add values which are counted elsewhere (i.e. statistics of rates cache) when metrics are exported.
+    """
+
+    def __init__(self, prefix='currency_converter'):
+        """
+        Args:
+            prefix (string): Prefix of names of all exported metrics.
+        """
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        # (name, labels) -> value/Histogram, labels are tuples of (label, value) pairs
+        self.counters = {}
+        self.histograms = {}
+        self._collectors = []
+
+    def inc(self, name, value=1, **labels):
+        """Increase the counter."""
+        key = (name, tuple(sorted(labels.iteritems())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        """Add the value to the histogram."""
+        key = (name, tuple(sorted(labels.iteritems())))
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def timer(self, name):
+        """
+        Returns:
+            StageTimer recording to histograms <name>_stage_seconds (label "stage") and <name>_seconds.
+        """
+        return StageTimer(self, name)
+
+    def counter(self, name, **labels):
+        """
+        Returns:
+            Value of the counter (0 if it was not increased yet).
+        """
+        return self.counters.get((name, tuple(sorted(labels.iteritems()))), 0)
+
+    def add_collector(self, collector):
+        """
+        Args:
+            collector (callable): Function returning list of tuples (name, type, value, labels) - type is
+                "counter" or "gauge", labels is a dictionary.
+        """
+        self._collectors.append(collector)
+
+    def to_prometheus(self):
+        """
+        Returns:
+            All metrics in Prometheus text exposition format.
+        """
+        with self._lock:
+            counters = sorted(self.counters.iteritems())
+            histograms = sorted((key, (list(histogram.counts), histogram.sum, histogram.count, histogram.bounds))
+                                for key, histogram in self.histograms.iteritems())
+        samples = [(name, 'counter', value, labels) for (name, labels), value in counters]
+        for collector in self._collectors:
+            samples.extend((name, metric_type, value, tuple(sorted(labels.iteritems())))
+                           for name, metric_type, value, labels in collector())
+
+        lines = []
+        typed = set()
+        for name, metric_type, value, labels in sorted(samples):
+            full_name = self.prefix + '_' + name
+            if full_name not in typed:
+                typed.add(full_name)
+                lines.append('# TYPE %s %s' % (full_name, metric_type))
+            lines.append('%s%s %s' % (full_name, _labels(labels), _number(value)))
+        for (name, labels), (counts, total, count, bounds) in histograms:
+            full_name = self.prefix + '_' + name
+            if full_name not in typed:
+                typed.add(full_name)
+                lines.append('# TYPE %s histogram' % full_name)
+            cumulative = 0
+            for bound, bucket_count in zip(bounds + (float('inf'),), counts):
+                cumulative += bucket_count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append('%s_bucket%s %d' % (full_name, _labels(labels + (('le', le),)), cumulative))
+            lines.append('%s_sum%s %s' % (full_name, _labels(labels), _number(total)))
+            lines.append('%s_count%s %d' % (full_name, _labels(labels), count))
+        return '\n'.join(lines) + '\n'
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join('%s="%s"' % (label, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+                          for label, value in labels) + '}'
+
+
+def _number(value):
+    if value is None:
+        return 'NaN'
+    if isinstance(value, float):
+        return repr(value)
+    return str(int(value))
@@ -0,0 +1,142 @@
+# -*- coding: UTF-8 -*-
+import string
+import unicodedata
+
+from FixedPoint import minor_units
+
+# Locale -> (group separator, decimal separator, symbol before the amount).
+LOCALES = {
+    'en': (',', '.', True),
+    'cs': (' ', ',', False),
+    'de': ('.', ',', False),
+    'fr': (' ', ',', False),
+}
+
+
+def display_symbols(symbols):
+    """
+    Choose one symbol for every currency which has some.
+
+    Args:
+        symbols (dict): Currency symbol -> currency code (see CurrencyConverter.currency_symbols).
+
+    Returns:
+        Dictionary currency code -> symbol (the shortest one if there are more, i.e. "K" for MMK, not "Ks").
+    """
+    by_code = {}
+    for symbol, code in symbols.iteritems():
+        key = (len(symbol.decode('utf-8', 'replace')), symbol)
+        if code not in by_code or key < by_code[code][0]:
+            by_code[code] = (key, symbol)
+    return dict((code, symbol) for code, (_, symbol) in by_code.iteritems())
+
+
+class MoneyFormatter(object):
+    """
+    Formats amounts of money with currency symbols, minor units and separators of a locale
+    (i.e. "2 707,36 Kč" in "cs", "¥1,234" in "en").
+
+    A template (text before and after the number, format specification of the number) is compiled for every
+    currency when the formatter is created. Formatting of a value is then one call of format() (grouping
+    is done by Python in C), one translate() of the separators and concatenation.
+    """
+
+    def __init__(self, symbols, codes, locale='en'):
+        """
+        Args:
+            symbols (dict): Currency symbol -> currency code (see CurrencyConverter.currency_symbols).
+            codes (iterable): Currency codes (currencies without a symbol are formatted with the code).
+            locale (string): One of LOCALES.
+
+        Raises:
+            ValueError: Unknown locale.
+        """
+        if locale not in LOCALES:
+            msg = 'Unknown locale: ' + str(locale) + '. It must be one of: ' + ', '.join(sorted(LOCALES))
+            raise ValueError(msg, 14)
+        group, decimal, self._symbol_first = LOCALES[locale]
+        self.locale = locale
+        self.codes = tuple(codes)
+        # Separators of Python's format() ("," and ".") -> separators of the locale (None = not changed).
+        self._separators = string.maketrans(',.', group + decimal) if (group, decimal) != (',', '.') else None
+        self._symbol_by_code = display_symbols(symbols)
+        # Code -> (prefix, format specification, suffix)
+        self.templates = {}
+        for code in self.codes:
+            self._add_template(code)
+
+    def _add_template(self, code):
+        """
+        Compile the template of the currency (currencies which are not in codes, i.e. in historical rates,
+        get it on first use).
+
+        Returns:
+            Tuple (prefix, format specification, suffix).
+        """
+        symbol = self._symbol_by_code.get(code, code)
+        # Currency signs are not separated from the number ("$10.00"), other symbols are ("CHF 10.00").
+        space = ' ' if unicodedata.category(symbol.decode('utf-8', 'replace')[-1]) != 'Sc' else ''
+        spec = ',.%df' % minor_units(code)
+        if self._symbol_first:
+            template = (symbol + space, spec, '')
+        else:
+            template = ('', spec, ' ' + symbol)
+        self.templates[code] = template
+        return template
+
+    def format(self, amount, code):
+        """
+        Args:
+            amount (float | int | decimal.Decimal): Amount of money.
+            code (string): Currency code.
+
+        Returns:
+            Formatted amount with the currency symbol (UTF-8 string).
+        """
+        prefix, spec, suffix = self.templates.get(code) or self._add_template(code)
+        if amount < 0:
+            # Sign is before the symbol ("-$10.00").
+            prefix = '-' + prefix
+            amount = -amount
+        number = format(amount, spec)
+        if self._separators is not None:
+            number = number.translate(self._separators)
+        return prefix + number + suffix
+
+    def format_many(self, amounts):
+        """
+        Format amounts in different currencies (i.e. output of conversion to all currencies).
+
+        Args:
+            amounts (dict): Currency code -> amount.
+
+        Returns:
+            Dictionary currency code -> formatted amount.
+        """
+        templates = self.templates
+        separators = self._separators
+        formatted = {}
+        for code, amount in amounts.iteritems():
+            template = templates.get(code)
+            if amount < 0 or template is None:
+                formatted[code] = self.format(amount, code)
+                continue
+            prefix, spec, suffix = template
+            if separators is None:
+                formatted[code] = prefix + format(amount, spec) + suffix
+            else:
+                formatted[code] = prefix + format(amount, spec).translate(separators) + suffix
+        return formatted
+
+    def format_result(self, result):
+        """
+        Args:
+            result (ConversionResult): Result of conversion.
+
+        Returns:
+            Dictionary with the same structure as ConversionResult.to_dict(), amounts are formatted.
+        """
+        return {
+            'input': {'amount': self.format(result.amount, result.currency), 'currency': result.currency},
+            'output': self.format_many(result.output),
+        }
@@ -0,0 +1,195 @@
+# -*- coding: UTF-8 -*-
+import re
+import unicodedata
+
+from CurrencyResolver import decode
+
+# Text before the number (currency), the number and text after it (currency). The number starts with a digit,
+# digits can be separated by decimal separator and group separators (spaces, apostrophes).
+_MONEY_RE = re.compile(u"^\\s*([+-]?)\\s*(\\D*?)\\s*([+-]?)(\\d[\\d.,'\u00a0\u2009\u202f ]*)(.*)$",
+                       re.UNICODE | re.DOTALL)
+# Group separators which can't be decimal separators (apostrophe, spaces - also no-break and thin).
+_GROUP_RE = re.compile(u"['\u00a0\u2009\u202f ]")
+# Characters which can be moved from the end of the number to the currency (i.e. "10.د.ب").
+_SEPARATORS = u".,'\u00a0\u2009\u202f "
+
+
+def normalize_number(number, decimal_separator='.'):
+    """
+    Convert a number written with group separators and decimal point or comma to the form accepted by float()
+    and decimal.Decimal (i.e. "1 000,50" -> "1000.50").
+    If both "." and "," are used, the last one is the decimal separator. A separator used more than once
+    separates groups. A single separator followed by exactly 3 digits is ambiguous ("1,000") - it's a group
+    separator unless it's the decimal_separator.
+
+    Args:
+        number (unicode): Digits with separators.
+        decimal_separator (string): Decimal separator of the locale ("." or ",").
+
+    Returns:
+        Normalized number (string) or None if the number is not valid.
+    """
+    number = _GROUP_RE.sub(u'', number)
+    dot = number.rfind(u'.')
+    comma = number.rfind(u',')
+    if dot >= 0 and comma >= 0:
+        separator = u'.' if dot > comma else u','
+    elif dot >= 0 or comma >= 0:
+        separator = u'.' if dot >= 0 else u','
+        fraction = number[max(dot, comma) + 1:]
+        if number.count(separator) > 1 or (len(fraction) == 3 and separator != decimal_separator):
+            separator = None
+    else:
+        separator = None
+    if separator is None:
+        whole, fraction = number, u''
+    else:
+        whole, _, fraction = number.rpartition(separator)
+        # Decimal separator can be used only once.
+        if separator in whole:
+            return None
+    whole = whole.replace(u'.', u'').replace(u',', u'')
+    if not whole.isdigit() or (fraction and not fraction.isdigit()):
+        return None
+    if fraction:
+        number = whole + u'.' + fraction
+    else:
+        number = whole
+    try:
+        return str(number)
+    except UnicodeEncodeError:
+        # Other digits than ASCII (i.e. fullwidth).
+        return ''.join(str(unicodedata.decimal(char, char)) for char in number)
+
+
+class MoneyParser(object):
+    """
+    Splits free text with amount of money and currency (i.e. "€10.04", "1 000,50 Kč", "500.5¥", "USD 10")
+    to a normalized amount and a currency code.
+    The text is split by one regular expression, the currency (before or after the number) is found by
+    CurrencyResolver (codes and symbols, exact match first), the number is normalized by normalize_number().
+    """
+
+    def __init__(self, resolver, decimal_separator='.'):
+        """
+        Args:
+            resolver (CurrencyResolver): Index of currency codes and symbols (i.e. CurrencyConverter.resolver).
+            decimal_separator (string): Decimal separator used for ambiguous numbers ("." or ",") -
+                see normalize_number().
+        """
+        if decimal_separator not in ('.', ','):
+            raise ValueError('Decimal separator must be "." or ",".')
+        self.resolver = resolver
+        self.decimal_separator = decimal_separator
+
+    def parse(self, text):
+        """
+        Args:
+            text (string | unicode): Amount with currency code or symbol (UTF-8 string).
+
+        Returns:
+            Tuple (amount, currency code) - amount is a string accepted by float() and decimal.Decimal
+            (digits are not changed, so it can be used by exact conversion).
+
+        Raises:
+            ValueError: The text does not contain a number and a known currency.
+        """
+        result = self._parse(text)
+        if result is None:
+            if isinstance(text, unicode):
+                text = text.encode('utf-8')
+            raise ValueError('Amount with currency could not be parsed: ' + text, 13)
+        return result
+
+    def parse_many(self, texts):
+        """
+        Parse many texts at once (i.e. a column of a file) - see parse().
+        Currencies are resolved only once for every distinct text before/after the number.
+
+        Args:
+            texts (iterable): Amounts with currencies.
+
+        Returns:
+            Tuple of lists (amounts, currency codes) in order of the texts.
+
+        Raises:
+            ValueError: Some text could not be parsed (message contains its position).
+        """
+        amounts = []
+        codes = []
+        # (text before, separators after, text after the number) -> result of _split_currency().
+        resolved = {}
+        for text_n, text in enumerate(texts):
+            result = self._parse(text, resolved)
+            if result is None:
+                if isinstance(text, unicode):
+                    text = text.encode('utf-8')
+                raise ValueError('Amount with currency could not be parsed (item %d): %s' % (text_n, text), 13)
+            amounts.append(result[0])
+            codes.append(result[1])
+        return amounts, codes
+
+    def _parse(self, text, resolved=None):
+        """
+        Args:
+            text (string | unicode): Amount with currency code or symbol.
+            resolved (dict | None): Currencies found by _split_currency() for the texts around the number
+                (shared by the calls of parse_many()).
+
+        Returns:
+            Tuple (amount, currency code) or None.
+        """
+        text = decode(text)
+        if text is None:
+            return None
+        match = _MONEY_RE.match(text)
+        if match is None:
+            return None
+        sign, prefix, number_sign, number, suffix = match.groups()
+        if sign and number_sign:
+            return None
+        digits_end = len(number.rstrip(_SEPARATORS))
+        if resolved is None:
+            code, separators_end = self._split_currency(prefix, number[digits_end:], suffix)
+        else:
+            key = (prefix, number[digits_end:], suffix)
+            currency = resolved.get(key)
+            if currency is None:
+                currency = resolved[key] = self._split_currency(prefix, number[digits_end:], suffix)
+            code, separators_end = currency
+        if code is None:
+            return None
+        number = normalize_number(number[:digits_end + separators_end], self.decimal_separator)
+        if number is None:
+            return None
+        return str(sign or number_sign) + number, code
+
+    def _split_currency(self, prefix, separators, suffix):
+        """
+        Find the currency before or after the number (not both).
+        Symbols can start by a separator (i.e. ".د.ب" in "10.د.ب"), which is matched as a part of the number -
+        the longest currency made of separators at the end of the number and the text after it is used.
+
+        Args:
+            prefix (unicode): Text before the number.
+            separators (unicode): Separators at the end of the number.
+            suffix (unicode): Text after the number.
+
+        Returns:
+            Tuple (currency code or None, number of the separators which belong to the number).
+        """
+        if prefix:
+            if suffix.strip():
+                return None, 0
+            return self._resolve(prefix), 0
+        for position in range(len(separators) + 1):
+            code = self._resolve(separators[position:] + suffix)
+            if code is not None:
+                return code, position
+        return None, 0
+
+    def _resolve(self, currency):
+        currency = currency.strip()
+        if not currency:
+            return None
+        return self.resolver.resolve(currency.encode('utf-8'))
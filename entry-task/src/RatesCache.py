@@ -0,0 +1,165 @@
+# -*- coding: UTF-8 -*-
+import os.path
+import threading
+import time
+
+
+class RatesCache(object):
+    """
+    Process-level cache of the exchange rates dictionary (see CurrencyConverter._get_rates()).
+    While the cached rates are fresh (younger than TTL), get() returns them without any I/O.
+    Only one caller refreshes expired rates at a time, the others wait and share its result - also its failure:
+    for failure_backoff seconds after a failed refresh, get() raises the same exception without calling the loader.
+    """
+
+    def __init__(self, loader, ttl=60, watch_filepath=None, max_age=None, failure_backoff=1.0):
+        """
+        Args:
+            loader (callable): Function with no arguments returning the rates dictionary.
+            ttl (int | float): Number of seconds the rates are served from memory (0 disables caching).
+            watch_filepath (string | None): Rates file whose modification time is checked when TTL expires.
+                If the file has not changed, the cached rates are used again without parsing the file.
+            max_age (int | None): Rates with older "timestamp" (in seconds) can't be revalidated by the file check,
+                the loader is called instead (so it can download new rates).
+            failure_backoff (int | float): Number of seconds after a failed refresh when the loader is not called
+                again (callers get the exception of the failed refresh).
+        """
+        self.loader = loader
+        self.ttl = ttl
+        self.watch_filepath = watch_filepath
+        self.max_age = max_age
+        self.failure_backoff = failure_backoff
+        # If set (by a background refresher), expired rates are returned instead of loading new ones.
+        self.stale_while_revalidate = False
+        # Cached state.
+        self._rates = None
+        self._expires_at = 0
+        self._mtime = None
+        # Exception of the last refresh (None if it was successful) and its time.
+        self._error = None
+        self._failed_at = 0
+        # Lock for refreshing (single-flight).
+        self._lock = threading.Lock()
+        # Counters.
+        self.stats = {
+            'hits': 0,
+            'misses': 0,
+            'refreshes': 0,
+            'revalidations': 0,
+            'stale_hits': 0,
+            'failures': 0,
+            'backoff_hits': 0,
+        }
+
+    def get(self):
+        """
+        Get current rates (from memory if they are fresh, otherwise from the loader).
+
+        Returns:
+            Rates dictionary returned by the loader.
+
+        Raises:
+            Any exception raised by the loader (also by the last failed refresh, see failure_backoff).
+        """
+        rates = self._rates
+        if rates is not None and time.time() < self._expires_at:
+            self.stats['hits'] += 1
+            return rates
+        if rates is not None and self.stale_while_revalidate:
+            self.stats['stale_hits'] += 1
+            return rates
+        with self._lock:
+            # Another caller could have refreshed the rates while we were waiting for the lock.
+            if self._rates is not None and time.time() < self._expires_at:
+                self.stats['hits'] += 1
+                return self._rates
+            # The loader failed a moment ago (i.e. while we were waiting for the lock) - don't call it again.
+            error = self._error
+            if error is not None and time.time() - self._failed_at < self.failure_backoff:
+                self.stats['backoff_hits'] += 1
+                raise error
+            self.stats['misses'] += 1
+            if self._revalidate():
+                return self._rates
+            return self._refresh()
+
+    def refresh(self, loader=None):
+        """
+        Load new rates now and replace the cached ones.
+
+        Args:
+            loader (callable | None): Function to use instead of the default loader.
+
+        Returns:
+            New rates dictionary.
+        """
+        with self._lock:
+            return self._refresh(loader)
+
+    def peek(self):
+        """
+        Returns:
+            Last loaded rates (even if they are expired) or None if no rates were loaded yet.
+        """
+        return self._rates
+
+    def invalidate(self):
+        """Forget the cached rates, so the next get() calls the loader."""
+        with self._lock:
+            self._rates = None
+            self._expires_at = 0
+            self._mtime = None
+            self._error = None
+
+    def _revalidate(self):
+        """
+        Extend the life of the cached rates if the watched file has not changed.
+        Must be called with the lock held.
+
+        Returns:
+            True if the cached rates can be used again.
+        """
+        if self._rates is None or self.watch_filepath is None:
+            return False
+        if self.max_age is not None and self._rates['timestamp'] < (int(time.time()) - self.max_age):
+            return False
+        try:
+            mtime = os.path.getmtime(self.watch_filepath)
+        except OSError:
+            return False
+        if mtime != self._mtime:
+            return False
+        self._expires_at = time.time() + self.ttl
+        self.stats['revalidations'] += 1
+        return True
+
+    def _refresh(self, loader=None):
+        """
+        Load the rates and save them to the cache. Must be called with the lock held.
+
+        Args:
+            loader (callable | None): Function to use instead of the default loader.
+
+        Returns:
+            Rates dictionary returned by the loader.
+        """
+        # Remember modification time before loading, so a change during loading is not missed.
+        mtime = None
+        if self.watch_filepath is not None:
+            try:
+                mtime = os.path.getmtime(self.watch_filepath)
+            except OSError:
+                pass
+        try:
+            rates = (loader or self.loader)()
+        except Exception, e:
+            self.stats['failures'] += 1
+            self._error = e
+            self._failed_at = time.time()
+            raise
+        self._error = None
+        self.stats['refreshes'] += 1
+        self._rates = rates
+        self._mtime = mtime
+        self._expires_at = time.time() + self.ttl
+        return rates
@@ -0,0 +1,261 @@
+# -*- coding: UTF-8 -*-
+import json
+import os
+import threading
+import time
+import Queue
+
+
+class RatesProvider(object):
+    """
+    Source of the latest exchange rates. Subclasses implement fetch().
+    """
+    name = 'provider'
+
+    def fetch(self, conditional=False):
+        """
+        Args:
+            conditional (bool): The provider may return None if the rates have not changed since its last fetch.
+
+        Returns:
+            JSON string in the format of openexchangerates.org API (keys "timestamp", "base" and "rates")
+            or None (see conditional).
+
+        Raises:
+            IOError (urllib2.URLError, urllib2.HTTPError): Rates could not be get.
+        """
+        raise NotImplementedError
+
+    def close(self):
+        """Release resources of the provider (connections)."""
+        pass
+
+
+class HttpRatesProvider(RatesProvider):
+    """
+    Rates API (i.e. openexchangerates.org) downloaded through keep-alive connections with a timeout.
+    """
+
+    def __init__(self, url, timeout=5.0, pool_size=4, name=None):
+        """
+        Args:
+            url (string): Full URL of the API (including app_id parameter).
+            timeout (int | float): Socket timeout in seconds.
+            pool_size (int): Maximum number of idle connections kept open.
+            name (string | None): Name of the provider in statistics (default is the host name).
+        """
+        # Imported only when HTTP is used (urllib2 is slow to import).
+        from HttpClient import KeepAliveClient
+        self.client = KeepAliveClient(url, timeout=timeout, pool_size=pool_size)
+        self.name = name or self.client._netloc
+        # ETag and Last-Modified of the last response (for conditional requests).
+        self._validators = {}
+
+    def fetch(self, conditional=False):
+        body, self._validators = self.client.get_if_modified(self._validators if conditional else {})
+        return body
+
+    def close(self):
+        self.client.close()
+
+
+class FileRatesProvider(RatesProvider):
+    """
+    Rates read from a JSON file (i.e. written by other service).
+    """
+
+    def __init__(self, filepath, name=None):
+        """
+        Args:
+            filepath (string): Path to the rates file.
+            name (string | None): Name of the provider in statistics (default is the filepath).
+        """
+        self.filepath = filepath
+        self.name = name or filepath
+        # Modification time of the file when it was read.
+        self._mtime = None
+
+    def fetch(self, conditional=False):
+        mtime = os.path.getmtime(self.filepath)
+        if conditional and mtime == self._mtime:
+            return None
+        with open(self.filepath) as rates_file:
+            rates_json = rates_file.read()
+        self._mtime = mtime
+        return rates_json
+
+
+class StaticRatesProvider(RatesProvider):
+    """
+    Fixed rates in memory - local stand-in of a real provider for tests and development.
+    It can imitate a slow (delay) or broken (fail) provider.
+    """
+
+    def __init__(self, rates_data, delay=0, name='static'):
+        """
+        Args:
+            rates_data (dict): Rates with keys "timestamp", "base" and "rates".
+            delay (int | float): Number of seconds to wait on every fetch.
+            name (string): Name of the provider in statistics.
+        """
+        self.rates_data = rates_data
+        self.delay = delay
+        self.name = name
+        # If True, fetch() raises IOError.
+        self.fail = False
+        self.fetch_count = 0
+
+    def fetch(self, conditional=False):
+        self.fetch_count += 1
+        if self.delay:
+            time.sleep(self.delay)
+        if self.fail:
+            raise IOError('Provider ' + self.name + ' is not available.')
+        return json.dumps(self.rates_data)
+
+
+class FailoverRatesProvider(RatesProvider):
+    """
+    Gets rates from several providers - the fastest healthy provider is asked first.
+    If it fails, the next provider is asked immediately. If it does not respond within hedge_delay seconds,
+    the next provider is asked too (hedged request) and the first successful response is used,
+    so one slow provider does not delay the refresh.
+
+    Latency and errors of every provider are tracked. A provider which failed failure_threshold times
+    in a row is skipped (circuit breaker is open) for reset_timeout seconds, then it's tried once again.
+    """
+
+    def __init__(self, providers, hedge_delay=0.5, failure_threshold=3, reset_timeout=30):
+        """
+        Args:
+            providers (list): RatesProvider objects (in order of preference when their latency is unknown).
+            hedge_delay (int | float | None): Number of seconds to wait for a provider before the next one is
+                asked too (0 = ask all providers at once, None = ask the next one only when the previous fails).
+            failure_threshold (int): Number of failures in a row which opens the circuit breaker of a provider.
+            reset_timeout (int | float): Number of seconds the open circuit breaker skips the provider.
+        """
+        if not providers:
+            raise ValueError('At least one rates provider must be set.')
+        if len(set(provider.name for provider in providers)) != len(providers):
+            raise ValueError('Rates providers must have different names.')
+        self.providers = list(providers)
+        self.name = 'failover'
+        self.hedge_delay = hedge_delay
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self.stats = dict((provider.name, {
+            'requests': 0,
+            'failures': 0,
+            'consecutive_failures': 0,
+            'last_latency': None,
+            'avg_latency': None,
+            'max_latency': 0.0,
+            'last_error': None,
+            # Time until which the provider is skipped (0 = circuit breaker is closed).
+            'open_until': 0,
+            # The provider is tried after its circuit breaker was open (only one request at a time).
+            'probing': False,
+        }) for provider in self.providers)
+
+    def fetch(self, conditional=False):
+        """
+        Args:
+            conditional (bool): See RatesProvider.fetch().
+
+        Returns:
+            JSON string (or None) from the first provider which responded successfully.
+
+        Raises:
+            IOError: All providers failed (the error of the last one) or all circuit breakers are open.
+        """
+        providers = self._ordered_providers()
+        if not providers:
+            raise IOError('All rates providers are unavailable (circuit breakers are open).')
+        results = Queue.Queue()
+        started = 0
+        finished = 0
+        last_error = None
+        self._start(providers[started], results, conditional)
+        started += 1
+        while finished < started:
+            hedge = started < len(providers) and self.hedge_delay is not None
+            try:
+                success, value = results.get(timeout=self.hedge_delay if hedge else None)
+            except Queue.Empty:
+                self._start(providers[started], results, conditional)
+                started += 1
+                continue
+            finished += 1
+            if success:
+                return value
+            last_error = value
+            # Fail over to the next provider immediately.
+            if started < len(providers):
+                self._start(providers[started], results, conditional)
+                started += 1
+        raise last_error
+
+    def close(self):
+        for provider in self.providers:
+            provider.close()
+
+    def _ordered_providers(self):
+        """
+        Returns:
+            Providers with closed circuit breaker (or ready for a probe) - the healthy and fastest first.
+        """
+        now = time.time()
+        available = []
+        with self._lock:
+            for position, provider in enumerate(self.providers):
+                stats = self.stats[provider.name]
+                if stats['open_until'] and (stats['probing'] or now < stats['open_until']):
+                    continue
+                latency = stats['avg_latency'] or 0.0
+                available.append(((stats['consecutive_failures'] > 0, latency, position), provider))
+        available.sort()
+        return [provider for _, provider in available]
+
+    def _start(self, provider, results, conditional):
+        """Ask the provider in a background thread, put (success, JSON string or exception) to results."""
+        with self._lock:
+            stats = self.stats[provider.name]
+            stats['probing'] = stats['open_until'] != 0
+        thread = threading.Thread(target=self._fetch_from, args=(provider, results, conditional))
+        thread.daemon = True
+        thread.start()
+
+    def _fetch_from(self, provider, results, conditional):
+        start = time.time()
+        try:
+            body = provider.fetch(conditional)
+        except Exception, e:
+            self._record(provider, time.time() - start, e)
+            results.put((False, e))
+        else:
+            self._record(provider, time.time() - start, None)
+            results.put((True, body))
+
+    def _record(self, provider, latency, error):
+        """Update statistics and circuit breaker of the provider."""
+        with self._lock:
+            stats = self.stats[provider.name]
+            stats['requests'] += 1
+            stats['probing'] = False
+            if error is not None:
+                stats['failures'] += 1
+                stats['consecutive_failures'] += 1
+                stats['last_error'] = str(error)
+                if stats['consecutive_failures'] >= self.failure_threshold:
+                    stats['open_until'] = time.time() + self.reset_timeout
+                return
+            stats['consecutive_failures'] = 0
+            stats['open_until'] = 0
+            stats['last_latency'] = latency
+            stats['max_latency'] = max(stats['max_latency'], latency)
+            # Exponentially weighted average - recent requests have more weight.
+            if stats['avg_latency'] is None:
+                stats['avg_latency'] = latency
+            else:
+                stats['avg_latency'] = 0.7 * stats['avg_latency'] + 0.3 * latency
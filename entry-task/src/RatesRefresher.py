@@ -0,0 +1,74 @@
+# -*- coding: UTF-8 -*-
+import threading
+import time
+
+
+class RatesRefresher(object):
+    """
+    Background thread which periodically loads new rates into a RatesCache,
+    so no conversion has to wait for the API or the Rates file.
+    """
+
+    def __init__(self, rates_cache, loader, interval, retry_interval=None, on_refresh=None):
+        """
+        Args:
+            rates_cache (RatesCache): Cache to refresh.
+            loader (callable): Function with no arguments returning the rates dictionary.
+            interval (int | float): Number of seconds between refreshes.
+            retry_interval (int | float | None): Number of seconds to wait after failed refresh
+                (default is 10 % of interval).
+            on_refresh (callable | None): Function called with the new rates dictionary after every refresh.
+        """
+        self.rates_cache = rates_cache
+        self.loader = loader
+        self.interval = interval
+        self.retry_interval = retry_interval if retry_interval is not None else interval * 0.1
+        self.on_refresh = on_refresh
+        self.stats = {
+            'refreshes': 0,
+            'failures': 0,
+            'last_latency': None,
+            'max_latency': 0.0,
+            'total_latency': 0.0,
+            'last_error': None,
+        }
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='RatesRefresher')
+        self._thread.daemon = True
+
+    def start(self):
+        """Start refreshing (the first refresh is done immediately)."""
+        self._thread.start()
+
+    def stop(self):
+        """Stop refreshing and wait for the thread to finish."""
+        self._stop_event.set()
+        self._thread.join()
+
+    def refresh(self):
+        """
+        Load new rates into the cache and update the statistics.
+
+        Returns:
+            True if the refresh was successful.
+        """
+        start = time.time()
+        try:
+            rates = self.rates_cache.refresh(self.loader)
+            if self.on_refresh is not None:
+                self.on_refresh(rates)
+        except Exception, e:
+            self.stats['failures'] += 1
+            self.stats['last_error'] = str(e)
+            return False
+        latency = time.time() - start
+        self.stats['refreshes'] += 1
+        self.stats['last_latency'] = latency
+        self.stats['max_latency'] = max(self.stats['max_latency'], latency)
+        self.stats['total_latency'] += latency
+        return True
+
+    def _run(self):
+        wait = 0
+        while not self._stop_event.wait(wait):
+            wait = self.interval if self.refresh() else self.retry_interval
@@ -0,0 +1,115 @@
+# -*- coding: UTF-8 -*-
+from array import array
+
+from FixedPoint import parse_amount, minor_units
+
+
+class RatesTable(object):
+    """
+    Precomputed cross rates for all pairs of currencies from one rates snapshot.
+    Currencies are identified by integer IDs (position in the sorted list of codes) and the cross rates
+    are stored in one flat array of floats (row = input currency, column = output currency).
+    """
+
+    def __init__(self, rates_data, previous=None):
+        """
+        Args:
+            rates_data (dict): Rates with keys "timestamp", "base" and "rates" (see CurrencyConverter._get_rates()).
+            previous (RatesTable | None): Table of the previous rates - if it has the same currencies, only cross
+                rates of the changed currencies are calculated.
+        """
+        rates = rates_data['rates']
+        self.timestamp = rates_data['timestamp']
+        self.base = rates_data['base']
+        # Currency codes and their IDs (codes are interned, so dictionary lookups compare pointers).
+        codes = tuple(intern(str(code)) for code in sorted(rates))
+        if previous is not None and previous.codes == codes and previous.base == self.base:
+            self.codes = previous.codes
+            self.ids = previous.ids
+            self.json_keys = previous.json_keys
+        else:
+            self.codes = codes
+            self.ids = dict((code, cur_id) for cur_id, code in enumerate(self.codes))
+            # Codes as keys of JSON object (for writing JSON directly, see ConversionResult.encode_json()).
+            self.json_keys = tuple('"%s": ' % code for code in self.codes)
+            previous = None
+        self.size = len(self.codes)
+        # Rates against the base currency.
+        self.rates = array('d', [rates[code] for code in self.codes])
+        # Cross rates: how many units of output currency you get for 1 unit of input currency.
+        #   cross[in_id * size + out_id] = rate(base -> out) / rate(base -> in)
+        if previous is None:
+            # Codes of currencies with changed rates against the previous table (None = all currencies).
+            self.changed = None
+            self.cross = array('d')
+            for in_rate in self.rates:
+                self.cross.extend([out_rate / in_rate for out_rate in self.rates])
+        else:
+            changed_ids = [cur_id for cur_id in xrange(self.size) if self.rates[cur_id] != previous.rates[cur_id]]
+            self.changed = frozenset(self.codes[cur_id] for cur_id in changed_ids)
+            self._update_cross(previous, changed_ids)
+        # Rates as integers for exact conversion (see CurrencyConverter.convert(exact=True)):
+        #   rate = scaled_rates[id] / 10 ** scale (scale is the largest number of decimal places of the rates)
+        # and number of decimal places (minor units) of the currencies.
+        fixed_rates = [parse_amount(rate) for rate in self.rates]
+        self.scale = max([places for _, places in fixed_rates] or [0])
+        self.scaled_rates = tuple(coefficient * 10 ** (self.scale - places) for coefficient, places in fixed_rates)
+        self.minor_units = tuple(minor_units(code) for code in self.codes)
+
+    def _update_cross(self, previous, changed_ids):
+        """
+        Copy cross rates from the previous table and calculate rows and columns of the changed currencies.
+        """
+        size = self.size
+        rates = self.rates
+        if not changed_ids:
+            self.cross = previous.cross
+            return
+        self.cross = previous.cross[:]
+        cross = self.cross
+        for in_id in changed_ids:
+            in_rate = rates[in_id]
+            cross[in_id * size:(in_id + 1) * size] = array('d', [out_rate / in_rate for out_rate in rates])
+        for in_id in xrange(size):
+            in_rate = rates[in_id]
+            row = in_id * size
+            for out_id in changed_ids:
+                cross[row + out_id] = rates[out_id] / in_rate
+
+    def cross_rate(self, in_code, out_code):
+        """
+        Args:
+            in_code (string): Input currency code.
+            out_code (string): Output currency code.
+
+        Returns:
+            Amount of output currency for 1 unit of input currency.
+        """
+        return self.cross[self.ids[in_code] * self.size + self.ids[out_code]]
+
+    def row(self, in_code):
+        """
+        Args:
+            in_code (string): Input currency code.
+
+        Returns:
+            Array of cross rates from the input currency to all currencies (in order of self.codes).
+        """
+        start = self.ids[in_code] * self.size
+        return self.cross[start:start + self.size]
+
+    def fixed_cross_rate(self, in_code, out_code):
+        """
+        Cross rate for exact conversion to minor units of the output currency:
+            output minor units = amount * numerator / denominator
+
+        Args:
+            in_code (string): Input currency code.
+            out_code (string): Output currency code.
+
+        Returns:
+            Tuple (numerator, denominator) of ints.
+        """
+        in_id = self.ids[in_code]
+        out_id = self.ids[out_code]
+        return self.scaled_rates[out_id] * 10 ** self.minor_units[out_id], self.scaled_rates[in_id]
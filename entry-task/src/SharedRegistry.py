@@ -0,0 +1,168 @@
+# -*- coding: UTF-8 -*-
+import threading
+from collections import OrderedDict
+
+
+class FrozenDict(dict):
+    """
+    Dictionary which can't be modified after it's created (it's shared by many objects).
+    Reading is as fast as from a normal dictionary.
+    """
+
+    def _immutable(self, *args, **kwargs):
+        raise TypeError('Shared dictionary can not be modified.')
+
+    __setitem__ = __delitem__ = clear = pop = popitem = setdefault = update = _immutable
+
+
+def freeze_symbols(symbols):
+    """
+    Args:
+        symbols (dict): Currency symbol -> currency code.
+
+    Returns:
+        FrozenDict with interned symbols and codes (codes are the same objects as codes of RatesTable).
+    """
+    return FrozenDict((intern(symbol), intern(code)) for symbol, code in symbols.iteritems())
+
+
+class SharedRates(object):
+    """
+    Rates shared by converters with the same source of rates: one RatesCache (the source is read and refreshed
+    once for all of them), the current cross rates table, the lock for building of new tables and one refresher.
+    """
+
+    def __init__(self, rates_cache):
+        """
+        Args:
+            rates_cache (RatesCache): Cache of the rates (of the converter which created the shared rates).
+        """
+        self.rates_cache = rates_cache
+        # Current RatesTable (None until some converter builds it).
+        self.table = None
+        self.table_lock = threading.Lock()
+        self.refresher = None
+        self._refresher_users = 0
+        self._lock = threading.Lock()
+
+    def start_refresher(self, create):
+        """
+        Start the shared refresher (if it is not running yet).
+
+        Args:
+            create (callable): Function with no arguments returning a new RatesRefresher.
+
+        Returns:
+            The running RatesRefresher object.
+        """
+        with self._lock:
+            if self.refresher is None:
+                self.refresher = create()
+                self.rates_cache.stale_while_revalidate = True
+                self.refresher.start()
+            self._refresher_users += 1
+            return self.refresher
+
+    def stop_refresher(self):
+        """Stop the shared refresher when it's not used by any converter."""
+        with self._lock:
+            self._refresher_users -= 1
+            if self._refresher_users > 0 or self.refresher is None:
+                return
+            refresher = self.refresher
+            self.refresher = None
+            self.rates_cache.stale_while_revalidate = False
+        refresher.stop()
+
+
+class SharedRegistry(object):
+    """
+    Thread-safe registry of objects shared by all converters of a process (symbol tables, rates) - identical
+    objects are created only once and then handed out by their key (i.e. path of the file they were read from).
+    Objects are reference counted: every acquire() must be followed by release() (see CurrencyConverter.close()).
+    Objects which are not used by anybody are kept for reuse, the least recently released are evicted
+    when there are more than max_unused of them.
+    """
+
+    def __init__(self, max_unused=16):
+        """
+        Args:
+            max_unused (int): Maximum number of kept objects which are not used.
+        """
+        self.max_unused = max_unused
+        # Key -> [object, number of references]
+        self._entries = {}
+        # Keys of objects without references (the least recently released first).
+        self._unused = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {
+            'hits': 0,
+            'misses': 0,
+            'evictions': 0,
+        }
+
+    def __len__(self):
+        return len(self._entries)
+
+    def acquire(self, key, create):
+        """
+        Get the shared object of the key (create it if there is none) and add a reference to it.
+
+        Args:
+            key (hashable): Key of the object.
+            create (callable): Function with no arguments returning a new object. It's called with the registry
+                locked, so the object is created only once.
+
+        Returns:
+            The shared object.
+
+        Raises:
+            Any exception raised by create (nothing is registered).
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.stats['misses'] += 1
+                entry = self._entries[key] = [create(), 0]
+            else:
+                self.stats['hits'] += 1
+                self._unused.pop(key, None)
+            entry[1] += 1
+            return entry[0]
+
+    def release(self, key):
+        """
+        Remove a reference to the object (added by acquire()).
+
+        Raises:
+            KeyError: The object is not in the registry.
+        """
+        with self._lock:
+            entry = self._entries[key]
+            entry[1] -= 1
+            if entry[1] > 0:
+                return
+            self._unused[key] = True
+            while len(self._unused) > self.max_unused:
+                del self._entries[self._unused.popitem(last=False)[0]]
+                self.stats['evictions'] += 1
+
+    def references(self, key):
+        """
+        Returns:
+            Number of references to the object of the key (0 if it's unused or not in the registry).
+        """
+        entry = self._entries.get(key)
+        return entry[1] if entry is not None else 0
+
+    def clear(self):
+        """Remove all unused objects."""
+        with self._lock:
+            for key in self._unused:
+                del self._entries[key]
+            self.stats['evictions'] += len(self._unused)
+            self._unused.clear()
+
+
+# Registry of the process.
+registry = SharedRegistry()
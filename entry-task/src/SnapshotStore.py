@@ -0,0 +1,179 @@
+# -*- coding: UTF-8 -*-
+import mmap
+import os
+import struct
+import threading
+
+# File locking is available only on Unix. On other systems, the lock works only between threads of one process.
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# Binary snapshot format (little-endian):
+#   header: magic (4 bytes), version (uint16), timestamp (int64), base currency code (3 bytes), count (uint32)
+#   currency codes: count * 3 bytes
+#   rates: count * float64
+SNAPSHOT_MAGIC = 'CCRS'
+SNAPSHOT_VERSION = 1
+HEADER = struct.Struct('<4sHq3sI')
+
+
+def atomic_write(filepath, data):
+    """
+    Write data to a file so readers see either the old or the new content, never a partially written file.
+    The data is written to a temporary file in the same directory, which then replaces the file.
+
+    Args:
+        filepath (string): Path to the file.
+        data (string): Content of the file.
+
+    Raises:
+        IOError, OSError: The file could not be written.
+    """
+    # Imported only when needed (it's slow to import).
+    import tempfile
+    directory = os.path.dirname(os.path.abspath(filepath))
+    fd, tmp_filepath = tempfile.mkstemp(dir=directory, prefix='.' + os.path.basename(filepath) + '.')
+    try:
+        with os.fdopen(fd, 'wb') as tmp_file:
+            tmp_file.write(data)
+            tmp_file.flush()
+            os.fsync(tmp_file.fileno())
+        # On Windows, rename does not replace an existing file.
+        if os.name == 'nt' and os.path.exists(filepath):
+            os.remove(filepath)
+        os.rename(tmp_filepath, filepath)
+    except (IOError, OSError):
+        if os.path.exists(tmp_filepath):
+            os.remove(tmp_filepath)
+        raise
+
+
+def write_snapshot(filepath, rates_data):
+    """
+    Save rates to a binary snapshot file (atomically).
+
+    Args:
+        filepath (string): Path to the snapshot file.
+        rates_data (dict): Rates with keys "timestamp", "base" and "rates" (see CurrencyConverter._get_rates()).
+    """
+    codes = sorted(rates_data['rates'])
+    data = [
+        HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, rates_data['timestamp'], str(rates_data['base']), len(codes)),
+        ''.join(str(code) for code in codes),
+        struct.pack('<%dd' % len(codes), *[rates_data['rates'][code] for code in codes]),
+    ]
+    atomic_write(filepath, ''.join(data))
+
+
+class MappedSnapshot(object):
+    """
+    Rates snapshot file (see write_snapshot()) mapped to memory - codes and rates are unpacked directly from
+    the mapped file, without parsing. The mapping is only a reading buffer: the rates are copied to a dictionary
+    (to_rates_data()) and the file is closed, the processes don't share the rates in memory.
+    """
+
+    def __init__(self, filepath):
+        """
+        Args:
+            filepath (string): Path to the snapshot file.
+
+        Raises:
+            IOError: The file could not be read.
+            ValueError: The file is not a valid snapshot.
+        """
+        with open(filepath, 'rb') as snapshot_file:
+            self._map = mmap.mmap(snapshot_file.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self._map) < HEADER.size:
+            raise ValueError('Invalid rates snapshot file: ' + filepath)
+        magic, version, self.timestamp, self.base, self.count = HEADER.unpack_from(self._map, 0)
+        if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION or \
+                len(self._map) != HEADER.size + self.count * 11:
+            raise ValueError('Invalid rates snapshot file: ' + filepath)
+        self._rates_offset = HEADER.size + self.count * 3
+        # Size of the file in bytes.
+        self.size = len(self._map)
+
+    def codes(self):
+        """
+        Returns:
+            List of currency codes (sorted).
+        """
+        return [self._map[pos:pos + 3] for pos in xrange(HEADER.size, self._rates_offset, 3)]
+
+    def rates(self):
+        """
+        Returns:
+            Tuple of rates (in order of codes()).
+        """
+        return struct.unpack_from('<%dd' % self.count, self._map, self._rates_offset)
+
+    def to_rates_data(self):
+        """
+        Returns:
+            Dictionary with keys "timestamp", "base" and "rates" (see CurrencyConverter._get_rates()).
+        """
+        return {
+            'timestamp': self.timestamp,
+            'base': self.base,
+            'rates': dict(zip(self.codes(), self.rates())),
+        }
+
+    def close(self):
+        self._map.close()
+
+
+class FileLock(object):
+    """
+    Exclusive lock shared by all processes (and threads) using the same lock file.
+    """
+
+    def __init__(self, filepath):
+        """
+        Args:
+            filepath (string): Path to the lock file (created if it does not exist).
+        """
+        self.filepath = filepath
+        self._thread_lock = threading.Lock()
+        self._file = None
+
+    def acquire(self, blocking=True):
+        """
+        Args:
+            blocking (bool): Wait until the lock is released by other process/thread.
+
+        Returns:
+            True if the lock was acquired.
+        """
+        if not self._thread_lock.acquire(blocking):
+            return False
+        if fcntl is None:
+            return True
+        try:
+            self._file = open(self.filepath, 'a')
+            flags = fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB
+            fcntl.flock(self._file.fileno(), flags)
+        except IOError:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            self._thread_lock.release()
+            if not blocking:
+                return False
+            raise
+        return True
+
+    def release(self):
+        if self._file is not None:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+            self._file.close()
+            self._file = None
+        self._thread_lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
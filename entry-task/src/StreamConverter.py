@@ -0,0 +1,149 @@
+# -*- coding: UTF-8 -*-
+import csv
+import json
+import time
+from itertools import islice, izip
+
+from TextWriter import RowWriter
+
+# Names of the fields in input records (CSV header or JSON keys).
+FIELDS = ('amount', 'input_currency', 'output_currency')
+
+
+def read_csv(stream, delimiter=','):
+    """
+    Read records from CSV with header (columns amount, input_currency, output_currency - in any order).
+
+    Args:
+        stream (file): Open file (UTF-8).
+        delimiter (string): CSV delimiter.
+
+    Yields:
+        Tuples (amount, input currency, output currency).
+
+    Raises:
+        ValueError: Some column is missing in the header. | Row has less columns than the header (message contains
+            its row number - the header is row 1).
+    """
+    reader = csv.reader(stream, delimiter=delimiter)
+    try:
+        header = [name.strip() for name in next(reader)]
+    except StopIteration:
+        return
+    try:
+        positions = [header.index(field) for field in FIELDS]
+    except ValueError:
+        raise ValueError('CSV header must contain columns: ' + ', '.join(FIELDS))
+    min_length = max(positions) + 1
+    for row_n, row in enumerate(reader, 2):
+        if row:
+            if len(row) < min_length:
+                raise ValueError('row %d: %d columns, the header has %d' % (row_n, len(row), len(header)))
+            yield tuple(row[position] for position in positions)
+
+
+def read_jsonl(stream):
+    """
+    Read records from JSON Lines (objects with keys amount, input_currency, output_currency).
+
+    Args:
+        stream (file): Open file (UTF-8).
+
+    Yields:
+        Tuples (amount, input currency, output currency).
+
+    Raises:
+        ValueError: Invalid record (message contains its line number) - it's not a JSON object, some key is missing,
+            amount is not a number or string, currency is not a string.
+    """
+    for line_n, line in enumerate(stream, 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError, e:
+            raise ValueError('line %d: %s' % (line_n, e))
+        if not isinstance(record, dict):
+            raise ValueError('line %d: record must be JSON object' % line_n)
+        values = []
+        for field in FIELDS:
+            value = record.get(field)
+            if isinstance(value, unicode):
+                value = value.encode('utf-8')
+            elif field != 'amount' or isinstance(value, bool) or not isinstance(value, (int, long, float)):
+                raise ValueError('line %d: %s must be %s' % (
+                    line_n, field, 'number or string' if field == 'amount' else 'string'))
+            values.append(value)
+        yield tuple(values)
+
+
+def chunks(iterable, size):
+    """
+    Split iterable to lists of given size (the last one might be shorter).
+    """
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def convert_stream(converter, in_stream, out_stream, file_format='csv', chunk_size=10000, delimiter=','):
+    """
+    Convert all records from the input stream and write results to the output stream.
+    Records are processed in chunks (memory usage does not depend on the size of input)
+    and all of them are converted with the same rates.
+
+    Args:
+        converter (CurrencyConverter): Converter to use.
+        in_stream (file): Input records - CSV or JSON Lines (see read_csv() and read_jsonl()).
+        out_stream (file): Output - in the same format as input. CSV has columns amount, input_currency,
+            output_amount, output_currency; JSON Lines contain the same objects as CurrencyConverter.convert().
+        file_format (string): "csv" or "jsonl".
+        chunk_size (int): Number of records converted at once.
+        delimiter (string): CSV delimiter.
+
+    Returns:
+        Dictionary with statistics: {"rows": <number of records>, "seconds": <duration>, "rows_per_sec": <speed>}
+
+    Raises:
+        ValueError: Unsupported format. | Invalid record (message contains its row number).
+        urllib2.HTTPError, urllib2.URLError, IOError: Could not get exchange rates - see CurrencyConverter.convert().
+    """
+    start = time.time()
+    if file_format == 'csv':
+        records = read_csv(in_stream, delimiter)
+        writer = RowWriter(out_stream, delimiter)
+        writer.writerow(['amount', 'input_currency', 'output_amount', 'output_currency'])
+    elif file_format == 'jsonl':
+        records = read_jsonl(in_stream)
+    else:
+        raise ValueError('Unsupported format: ' + str(file_format) + '. It must be "csv" or "jsonl".')
+
+    # One snapshot of rates for the whole stream.
+    snapshot = converter.snapshot()
+    rows = 0
+    for chunk in chunks(records, chunk_size):
+        try:
+            result = converter.convert_many(chunk, snapshot=snapshot)
+        except ValueError, e:
+            raise ValueError('%s, chunk starting at record %d' % (e.args[0], rows + 1), *e.args[1:])
+        results = izip(result['input_amounts'], result['input_currencies'],
+                       result['output_amounts'], result['output_currencies'])
+        if file_format == 'csv':
+            writer.writerows(results)
+        else:
+            out_stream.write(''.join(
+                json.dumps({'input': {'amount': in_amount, 'currency': in_code}, 'output': {out_code: out_amount}})
+                + '\n' for in_amount, in_code, out_amount, out_code in results))
+        rows += len(chunk)
+    if file_format == 'csv':
+        writer.flush()
+
+    seconds = time.time() - start
+    return {
+        'rows': rows,
+        'seconds': seconds,
+        'rows_per_sec': rows / seconds if seconds else 0.0,
+    }
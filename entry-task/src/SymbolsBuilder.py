@@ -0,0 +1,371 @@
+# -*- coding: UTF-8 -*-
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from HTMLParser import HTMLParser
+
+from SnapshotStore import atomic_write
+from WorkerPool import WorkerPool
+
+WIKI_URL = 'https://en.wikipedia.org'
+
+# Pages are parsed from the start of the interesting element in chunks of this size (until it ends).
+_CHUNK_SIZE = 4096
+_TAG_RE = re.compile(r'<[^>]*>')
+
+
+class _TableParser(HTMLParser):
+    """
+    Streaming parser of one table (fed from its start tag) - collects cells of its rows (not of nested tables).
+    Every cell is a dictionary with keys "tag" (td or th), "text" (all text of the cell), "own_text" (text which
+    is not inside other elements), "links" (attributes of all links), "href" and "link_text" (of the first link).
+    """
+
+    def __init__(self):
+        HTMLParser.__init__(self)
+        self.rows = []
+        self.done = False
+        self._table_depth = 0
+        self._cell = None
+        # Depth of elements inside the current cell and of the first link (None = not in the link).
+        self._cell_depth = 0
+        self._link_depth = None
+
+    def handle_starttag(self, tag, attrs):
+        if self.done:
+            return
+        if tag == 'table':
+            self._table_depth += 1
+        if self._table_depth != 1:
+            return
+        if tag == 'tr':
+            self.rows.append([])
+        elif tag in ('td', 'th') and self.rows:
+            self._cell = {'tag': tag, 'text': u'', 'own_text': u'', 'links': [], 'href': None, 'link_text': None}
+            self.rows[-1].append(self._cell)
+            self._cell_depth = 0
+        elif self._cell is not None:
+            self._cell_depth += 1
+            if tag == 'a':
+                attrs = dict(attrs)
+                self._cell['links'].append(attrs)
+                if self._cell['href'] is None:
+                    self._cell['href'] = attrs.get('href')
+                    self._cell['link_text'] = u''
+                    self._link_depth = self._cell_depth
+
+    def handle_endtag(self, tag):
+        if self.done:
+            return
+        if tag == 'table':
+            self._table_depth -= 1
+            if self._table_depth == 0:
+                self.done = True
+            return
+        if self._table_depth != 1 or self._cell is None:
+            return
+        if tag in ('td', 'th', 'tr'):
+            self._cell = None
+            self._link_depth = None
+        else:
+            if self._cell_depth == self._link_depth:
+                self._link_depth = None
+            self._cell_depth = max(self._cell_depth - 1, 0)
+
+    def handle_startendtag(self, tag, attrs):
+        # Void elements (i.e. <br />) don't change the depth.
+        pass
+
+    def handle_data(self, data):
+        if self._cell is None or self.done:
+            return
+        self._cell['text'] += data
+        if self._cell_depth == 0:
+            self._cell['own_text'] += data
+        if self._link_depth is not None:
+            self._cell['link_text'] += data
+
+    def handle_entityref(self, name):
+        self.handle_data(self.unescape('&%s;' % name))
+
+    def handle_charref(self, name):
+        self.handle_data(self.unescape('&#%s;' % name))
+
+
+def parse_table(html, marker):
+    """
+    Parse the first table whose start tag contains the marker (i.e. its class) - only the table is parsed.
+
+    Args:
+        html (unicode): HTML page.
+        marker (unicode): Text of the start tag of the table.
+
+    Returns:
+        List of rows (lists of cells, see _TableParser) or None if there is no such table.
+    """
+    position = html.find(marker)
+    if position < 0:
+        return None
+    start = html.rfind('<table', 0, position)
+    if start < 0:
+        return None
+    parser = _TableParser()
+    while not parser.done and start < len(html):
+        parser.feed(html[start:start + _CHUNK_SIZE])
+        start += _CHUNK_SIZE
+    return parser.rows
+
+
+def parse_symbols_list(html):
+    """
+    Find currency symbols and links to pages of their currencies in the list of currency symbols
+    (https://en.wikipedia.org/wiki/Currency_symbol).
+
+    Args:
+        html (unicode): HTML of the list.
+
+    Returns:
+        OrderedDict currency symbol -> absolute URL of the currency page.
+
+    Raises:
+        ValueError: The page does not contain the table of symbols.
+    """
+    rows = parse_table(html, u'class="wikitable sortable"')
+    if rows is None:
+        raise ValueError('Table of currency symbols was not found.')
+    links = OrderedDict()
+    for row in rows:
+        if len(row) < 2 or row[0]['tag'] != 'td' or not row[1]['href']:
+            continue
+        # Symbol is the text of the link (if it's linked) or the text of the cell.
+        symbol_cell = row[0]
+        symbol = symbol_cell['link_text'] if symbol_cell['href'] else symbol_cell['own_text']
+        symbol = symbol.strip()
+        if symbol:
+            links[symbol] = WIKI_URL + row[1]['href']
+    return links
+
+
+def parse_currency_page(html):
+    """
+    Find ISO 4217 code and name of the currency on its Wikipedia page. Only the heading and the infobox are parsed.
+
+    Args:
+        html (unicode): HTML of the page.
+
+    Returns:
+        Tuple (code, name) or None if the page is not a page of a current currency (there is no infobox
+        or it does not contain ISO 4217 code).
+    """
+    rows = parse_table(html, u'class="infobox')
+    if not rows:
+        return None
+    code = None
+    for row in rows:
+        if len(row) > 1 and any(link.get('title') == 'ISO 4217' for link in row[0]['links']):
+            code = row[1]['text'].strip()
+            break
+    if not code:
+        return None
+    name = u''
+    heading = html.find(u'id="firstHeading"')
+    if heading >= 0:
+        start = html.find(u'>', heading) + 1
+        end = html.find(u'</h1>', start)
+        name = HTMLParser().unescape(_TAG_RE.sub(u'', html[start:end])).strip()
+    return code, name
+
+
+class SymbolsBuilder(object):
+    """
+    Builds the table of currency symbols from Wikipedia: the list of symbols links to pages of currencies,
+    their infoboxes contain ISO 4217 codes (see /cur_symbols/parse_wiki.py).
+
+    Pages are downloaded by a pool of threads and saved to a content-addressed cache (file name is SHA-1
+    of the page), together with ETag/Last-Modified of the responses and results of parsing of every page:
+    * unchanged pages are downloaded again only by conditional requests (the server answers "304 Not Modified"),
+    * pages with content which was parsed before are not parsed again.
+    Offline, pages are taken only from the cache and fixtures (saved pages).
+    """
+
+    def __init__(self, cache_dir, workers=8, timeout=10.0, max_age=None, offline=False, fixtures=None):
+        """
+        Args:
+            cache_dir (string): Directory of the page cache (created if it does not exist).
+            workers (int): Number of pages downloaded at once.
+            timeout (int | float): Socket timeout of one download in seconds.
+            max_age (int | float | None): Pages downloaded less than this number of seconds ago are not requested
+                at all (None = always ask the server if the page has changed).
+            offline (bool): Don't download anything (pages which are not cached are skipped).
+            fixtures (dict | None): URL -> path to a saved HTML page used instead of downloading.
+        """
+        self.cache_dir = cache_dir
+        self.pages_dir = os.path.join(cache_dir, 'pages')
+        if not os.path.isdir(self.pages_dir):
+            os.makedirs(self.pages_dir)
+        self.workers = workers
+        self.timeout = timeout
+        self.max_age = max_age
+        self.offline = offline
+        self.fixtures = fixtures or {}
+        self._index_filepath = os.path.join(cache_dir, 'index.json')
+        self._parsed_filepath = os.path.join(cache_dir, 'parsed.json')
+        # URL -> {"digest", "etag", "last_modified", "fetched_at"}
+        self.index = self._read_json(self._index_filepath)
+        # SHA-1 of the page -> [code, name] or None (not a currency page)
+        self.parsed = self._read_json(self._parsed_filepath)
+        self._lock = threading.Lock()
+        self.stats = {
+            'downloaded': 0,
+            'not_modified': 0,
+            'cached': 0,
+            'fixture': 0,
+            'missing': 0,
+            'failures': 0,
+            'parsed': 0,
+            'parse_cache_hits': 0,
+        }
+
+    def build(self, list_html):
+        """
+        Find currency codes of all symbols in the list.
+
+        Args:
+            list_html (string | unicode): HTML of the list of currency symbols (UTF-8 if it's not unicode).
+
+        Returns:
+            List of lists [currency code, currency symbol, currency name] (in order of the list).
+            Symbols whose pages are not currency pages or could not be downloaded are left out.
+        """
+        if isinstance(list_html, str):
+            list_html = list_html.decode('utf-8', 'replace')
+        links = parse_symbols_list(list_html)
+        pool = WorkerPool(self.workers)
+        try:
+            # Every URL is requested only once (more symbols can link to one currency).
+            futures = dict((url, pool.submit(self.currency_info, url)) for url in set(links.itervalues()))
+            rows = []
+            for symbol, url in links.iteritems():
+                info = futures[url].result()
+                if info is not None:
+                    rows.append([info[0], symbol, info[1]])
+        finally:
+            pool.shutdown()
+            self.save()
+        return rows
+
+    def currency_info(self, url):
+        """
+        Args:
+            url (string): URL of the currency page.
+
+        Returns:
+            Tuple (code, name) or None - see parse_currency_page(). None also if the page could not be get.
+        """
+        digest = self.fetch(url)
+        if digest is None:
+            return None
+        with self._lock:
+            if digest in self.parsed:
+                self.stats['parse_cache_hits'] += 1
+                info = self.parsed[digest]
+                return tuple(info) if info is not None else None
+        info = parse_currency_page(self.read_page(digest))
+        with self._lock:
+            self.stats['parsed'] += 1
+            self.parsed[digest] = list(info) if info is not None else None
+        return info
+
+    def fetch(self, url):
+        """
+        Get the page into the cache (downloaded, from fixtures or already cached).
+
+        Returns:
+            SHA-1 of the page content (name of the cached page) or None if the page is not available.
+        """
+        with self._lock:
+            entry = dict(self.index.get(url) or {})
+        if entry and not os.path.isfile(self._page_filepath(entry['digest'])):
+            entry = {}
+        fixture = self.fixtures.get(url)
+        if fixture is not None:
+            with open(fixture, 'rb') as page_file:
+                return self._store(url, page_file.read(), {}, 'fixture')
+        if self.offline or (entry and self.max_age is not None and
+                            time.time() - entry.get('fetched_at', 0) < self.max_age):
+            self._count('cached' if entry else 'missing')
+            return entry.get('digest')
+        # Imported only when pages are downloaded (urllib2 is slow to import).
+        import urllib2
+        from HttpClient import conditional_headers, response_validators
+        request = urllib2.Request(url, headers=conditional_headers(entry))
+        try:
+            response = urllib2.urlopen(request, timeout=self.timeout)
+            try:
+                body = response.read()
+            finally:
+                response.close()
+        except urllib2.HTTPError, e:
+            if e.code == 304 and entry:
+                entry['fetched_at'] = time.time()
+                with self._lock:
+                    self.index[url] = entry
+                self._count('not_modified')
+                return entry['digest']
+            self._count('failures')
+            return entry.get('digest')
+        except (IOError, OSError):
+            self._count('failures')
+            return entry.get('digest')
+        return self._store(url, body, response_validators(response.info()), 'downloaded')
+
+    def read_page(self, digest):
+        """
+        Returns:
+            Cached page (unicode).
+        """
+        with open(self._page_filepath(digest), 'rb') as page_file:
+            return page_file.read().decode('utf-8', 'replace')
+
+    def save(self):
+        """Save the index of pages and results of parsing to the cache directory."""
+        with self._lock:
+            index_json = json.dumps(self.index)
+            parsed_json = json.dumps(self.parsed)
+        atomic_write(self._index_filepath, index_json)
+        atomic_write(self._parsed_filepath, parsed_json)
+
+    def _store(self, url, body, validators, stat):
+        """Save the page to the cache (if it's not there already) and return its SHA-1."""
+        digest = hashlib.sha1(body).hexdigest()
+        page_filepath = self._page_filepath(digest)
+        if not os.path.isfile(page_filepath):
+            atomic_write(page_filepath, body)
+        with self._lock:
+            self.index[url] = {
+                'digest': digest,
+                'etag': validators.get('etag'),
+                'last_modified': validators.get('last_modified'),
+                'fetched_at': time.time(),
+            }
+            self.stats[stat] += 1
+        return digest
+
+    def _page_filepath(self, digest):
+        return os.path.join(self.pages_dir, digest + '.htm')
+
+    def _count(self, stat):
+        with self._lock:
+            self.stats[stat] += 1
+
+    @staticmethod
+    def _read_json(filepath):
+        try:
+            with open(filepath) as json_file:
+                return json.load(json_file)
+        except (IOError, ValueError):
+            return {}
@@ -0,0 +1,129 @@
+# -*- coding: UTF-8 -*-
+import codecs
+import csv
+import os
+import time
+from cStringIO import StringIO
+from itertools import islice
+
+
+class RowWriter(object):
+    """
+    Buffered writer of delimited rows (CSV with minimal quoting) to an open binary stream.
+    Rows are encoded by the csv module in chunks into a memory buffer, which is written to the stream
+    when it's full - not cell by cell.
+    """
+
+    def __init__(self, stream, delimiter=',', buffer_size=65536, chunk_size=1000):
+        """
+        Args:
+            stream (file): Binary stream (i.e. file opened in "wb" mode or gzip.GzipFile).
+            delimiter (string): Delimiter of cells.
+            buffer_size (int): Number of bytes buffered before they are written to the stream.
+            chunk_size (int): Number of rows encoded at once.
+        """
+        self.stream = stream
+        self.buffer_size = buffer_size
+        self.chunk_size = chunk_size
+        self._buffer = StringIO()
+        self._writer = csv.writer(self._buffer, delimiter=delimiter, lineterminator='\n')
+        # Number of written rows.
+        self.rows = 0
+
+    def writerow(self, row):
+        self.writerows([row])
+
+    def writerows(self, rows):
+        """
+        Args:
+            rows (iterable): Rows (sequences of cells - strings, unicode or numbers), i.e. a generator.
+        """
+        iterator = iter(rows)
+        while True:
+            chunk = list(islice(iterator, self.chunk_size))
+            if not chunk:
+                return
+            position = self._buffer.tell()
+            try:
+                self._writer.writerows(chunk)
+            except UnicodeError:
+                # csv module writes only byte strings - encode unicode cells of this chunk to UTF-8.
+                self._buffer.seek(position)
+                self._buffer.truncate()
+                self._writer.writerows([[cell.encode('utf-8') if isinstance(cell, unicode) else cell
+                                         for cell in row] for row in chunk])
+            self.rows += len(chunk)
+            if self._buffer.tell() >= self.buffer_size:
+                self.flush()
+
+    def flush(self):
+        """Write buffered rows to the stream."""
+        if self._buffer.tell():
+            self.stream.write(self._buffer.getvalue())
+            self._buffer.seek(0)
+            self._buffer.truncate()
+
+
+class TextWriter(object):
+    """
+    Writes rows to CSV files (UTF-8 with BOM, optionally compressed by gzip) - rows can come from a generator,
+    so they don't have to be in memory at once.
+    """
+
+    def __init__(self, output_dir='.', buffer_size=65536):
+        """
+        Args:
+            output_dir (string): Path to the output directory.
+            buffer_size (int): Number of bytes buffered before they are written to the file.
+        """
+        self.output_dir = output_dir
+        self.buffer_size = buffer_size
+
+    def write_file(self, data_list, file_name, items_delimiter, compress=False):
+        """
+        Write rows to a new file <output_dir>/<file_name>.csv (.csv.gz if compressed), replace an existing one.
+
+        Args:
+            data_list (iterable): Rows (sequences of cells).
+            file_name (string): Name of the file without extension.
+            items_delimiter (string): Delimiter of cells.
+            compress (bool): Compress the file by gzip.
+
+        Returns:
+            Dictionary with statistics: {"rows": <number of rows>, "seconds": <duration>, "rows_per_sec": <speed>}
+        """
+        return self._write_file(data_list, file_name, 'csv', items_delimiter, 'w', compress)
+
+    def append_file(self, data_list, file_name, items_delimiter, compress=False):
+        """
+        Append rows to the file (it's created if it does not exist) - see write_file().
+        Appended gzip file has more members, which are read as one stream.
+        """
+        return self._write_file(data_list, file_name, 'csv', items_delimiter, 'a', compress)
+
+    def _write_file(self, data_lists, file_name, file_extension, items_delimiter, file_mode, compress):
+        start = time.time()
+        # Create a file path.
+        file_path = '%s/%s.%s' % (self.output_dir, file_name, file_extension)
+        if compress:
+            file_path += '.gz'
+        # BOM is written only at the start of the file.
+        new_file = file_mode == 'w' or not os.path.exists(file_path) or os.path.getsize(file_path) == 0
+        if compress:
+            # Imported only when needed (it's slow to import).
+            import gzip
+            fh = gzip.open(file_path, file_mode + 'b')
+        else:
+            fh = open(file_path, file_mode + 'b')
+        with fh:
+            if new_file:
+                fh.write(codecs.BOM_UTF8)
+            writer = RowWriter(fh, items_delimiter, self.buffer_size)
+            writer.writerows(data_lists)
+            writer.flush()
+        seconds = time.time() - start
+        return {
+            'rows': writer.rows,
+            'seconds': seconds,
+            'rows_per_sec': writer.rows / seconds if seconds else 0.0,
+        }
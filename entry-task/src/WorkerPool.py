@@ -0,0 +1,123 @@
+# -*- coding: UTF-8 -*-
+import sys
+import threading
+import Queue
+
+
+class Future(object):
+    """
+    Result of a call which runs in the background (see WorkerPool.submit()).
+    """
+
+    def __init__(self):
+        self._done = threading.Event()
+        self._result = None
+        self._exc_info = None
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    def done(self):
+        """
+        Returns:
+            True if the call has finished (successfully or with an exception).
+        """
+        return self._done.is_set()
+
+    def result(self, timeout=None):
+        """
+        Wait for the call to finish and return its result.
+
+        Args:
+            timeout (int | float | None): Maximum number of seconds to wait (None = wait forever).
+
+        Returns:
+            Value returned by the call.
+
+        Raises:
+            Exception raised by the call. | RuntimeError: The call did not finish in time.
+        """
+        if not self._done.wait(timeout):
+            raise RuntimeError('The call did not finish in %s seconds.' % timeout)
+        if self._exc_info:
+            raise self._exc_info[0], self._exc_info[1], self._exc_info[2]
+        return self._result
+
+    def add_done_callback(self, callback):
+        """
+        Call the function (with this future as the only argument) when the call finishes.
+        If it has already finished, the function is called immediately.
+        """
+        with self._lock:
+            if not self._done.is_set():
+                self._callbacks.append(callback)
+                return
+        callback(self)
+
+    def set_result(self, result):
+        self._result = result
+        self._finish()
+
+    def set_exc_info(self, exc_info):
+        self._exc_info = exc_info
+        self._finish()
+
+    def _finish(self):
+        with self._lock:
+            self._done.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback(self)
+
+
+class WorkerPool(object):
+    """
+    Fixed number of daemon threads running submitted calls.
+    """
+
+    def __init__(self, workers=4):
+        """
+        Args:
+            workers (int): Number of threads.
+        """
+        self._tasks = Queue.Queue()
+        self._threads = []
+        for n in range(workers):
+            thread = threading.Thread(target=self._work, name='WorkerPool-%d' % n)
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, function, *args, **kwargs):
+        """
+        Run the function in one of the threads.
+
+        Returns:
+            Future object with the result of the function.
+        """
+        future = Future()
+        self._tasks.put((future, function, args, kwargs))
+        return future
+
+    def shutdown(self, wait=True):
+        """
+        Stop the threads after they finish already submitted calls.
+
+        Args:
+            wait (bool): Wait until the threads finish.
+        """
+        for _ in self._threads:
+            self._tasks.put(None)
+        if wait:
+            for thread in self._threads:
+                thread.join()
+
+    def _work(self):
+        while True:
+            task = self._tasks.get()
+            if task is None:
+                return
+            future, function, args, kwargs = task
+            try:
+                future.set_result(function(*args, **kwargs))
+            except Exception:
+                future.set_exc_info(sys.exc_info())
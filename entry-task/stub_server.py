@@ -0,0 +1,75 @@
+# -*- coding: UTF-8 -*-
+"""
+Local HTTP server imitating the rates API (used by tests and benchmarks instead of openexchangerates.org).
+"""
+import threading
+import time
+import BaseHTTPServer
+import SocketServer
+
+
+class StubRatesServer(object):
+    """
+    Serves the content of a rates file on http://127.0.0.1:<port>/api/latest.json in a background thread.
+    """
+
+    def __init__(self, rates_filepath, delay=0):
+        """
+        Args:
+            rates_filepath (string): JSON file returned on every request.
+            delay (int | float): Number of seconds to wait before every response.
+        """
+        with open(rates_filepath) as rates_file:
+            self.body = rates_file.read()
+        self.delay = delay
+        self.request_count = 0
+        # Number of responses "304 Not Modified" (to requests with ETag of the current body).
+        self.not_modified_count = 0
+        self.fail = False
+        stub = self
+
+        class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                stub.request_count += 1
+                if stub.delay:
+                    time.sleep(stub.delay)
+                if stub.fail:
+                    self.send_response(500)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                etag = '"%x"' % (hash(stub.body) & 0xffffffff)
+                if self.headers.getheader('If-None-Match') == etag:
+                    stub.not_modified_count += 1
+                    self.send_response(304)
+                    self.send_header('ETag', etag)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header('ETag', etag)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(stub.body)))
+                self.end_headers()
+                self.wfile.write(stub.body)
+
+            def log_message(self, *args):
+                pass
+
+        class Server(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+            daemon_threads = True
+
+        self.server = Server(('127.0.0.1', 0), Handler)
+        self.api_url = 'http://127.0.0.1:%d/api/latest.json' % self.server.server_address[1]
+        self._thread = threading.Thread(target=self.server.serve_forever, args=(0.05,))
+        self._thread.daemon = True
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()